@@ -0,0 +1,215 @@
+from datetime import date, timedelta
+
+# Charts never plot more than this many buckets per series
+MAX_CHART_POINTS = 1000
+
+# SQL expression that maps a timestamp column to the start of its bucket
+GRAINS = {
+    'day': "date({col})",
+    'week': "date({col}, 'weekday 0', '-6 days')",
+    'month': "date({col}, 'start of month')",
+}
+
+GRAIN_DAYS = {'day': 1, 'week': 7, 'month': 30}
+
+CATEGORY_SQL = "COALESCE((SELECT category FROM books WHERE book_id = {row}.book_id), 'Unknown')"
+
+def bucket_sql(grain, col):
+    return GRAINS[grain].format(col=col)
+
+def choose_grain(start, end):
+    # Pick the finest grain that keeps the chart under MAX_CHART_POINTS
+    days = (end - start).days + 1
+    for grain in ('day', 'week', 'month'):
+        if days / GRAIN_DAYS[grain] <= MAX_CHART_POINTS:
+            return grain
+    return 'month'
+
+def _upsert(grain, period, category, column, value, condition='1'):
+    return f'''
+        INSERT INTO circulation_stats (grain, period, category, {column})
+        SELECT '{grain}', {period}, {category}, {value} WHERE {condition}
+        ON CONFLICT (grain, period, category) DO UPDATE SET {column} = {column} + excluded.{column};
+    '''
+
+def _contribution(row, sign, returns_only=False):
+    # Statements that add (sign=1) or remove (sign=-1) one loan's share of every bucket.
+    # A loan counts towards the overdue backlog from the day after due_date until the
+    # day after it is returned, so each loan adds +1 and (once returned) -1 to overdue_delta.
+    category = CATEGORY_SQL.format(row=row)
+    returned = f"{row}.return_date IS NOT NULL"
+    overdue_end = f"date(max({row}.due_date, {row}.return_date), '+1 day')"
+    statements = []
+    for grain in GRAINS:
+        if not returns_only:
+            statements.append(_upsert(grain, bucket_sql(grain, f'{row}.issue_date'), category, 'issues', sign))
+            statements.append(_upsert(grain, bucket_sql(grain, f"date({row}.due_date, '+1 day')"), category, 'overdue_delta', sign))
+        statements.append(_upsert(grain, bucket_sql(grain, f'{row}.return_date'), category, 'returns', sign, returned))
+        statements.append(_upsert(grain, bucket_sql(grain, overdue_end), category, 'overdue_delta', -sign, returned))
+    return ''.join(statements)
+
+def init_aggregates(conn):
+    c = conn.cursor()
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS circulation_stats (
+            grain TEXT NOT NULL,
+            period TEXT NOT NULL,
+            category TEXT NOT NULL,
+            issues INTEGER DEFAULT 0,
+            returns INTEGER DEFAULT 0,
+            overdue_delta INTEGER DEFAULT 0,
+            PRIMARY KEY (grain, period, category)
+        ) WITHOUT ROWID
+    ''')
+
+    # Keep the buckets current as loans are issued, returned or removed
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS circulation_stats_issue
+        AFTER INSERT ON transactions
+        BEGIN {_contribution('NEW', 1)} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS circulation_stats_return
+        AFTER UPDATE OF return_date ON transactions
+        WHEN OLD.return_date IS NULL AND NEW.return_date IS NOT NULL
+        BEGIN {_contribution('NEW', 1, returns_only=True)} END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS circulation_stats_delete
+        AFTER DELETE ON transactions
+        BEGIN {_contribution('OLD', -1)} END
+    ''')
+
+    # Backfill history recorded before the aggregates existed
+    c.execute('SELECT EXISTS (SELECT 1 FROM circulation_stats)')
+    if not c.fetchone()[0]:
+        rebuild_aggregates(conn)
+
+def _day_deltas_sql():
+    # Day-grain buckets recomputed from the loans themselves, one row per (period, category)
+    return f'''
+        WITH loans AS (
+            SELECT t.issue_date, t.due_date, t.return_date, COALESCE(b.category, 'Unknown') as category
+            FROM transactions t
+            LEFT JOIN books b ON t.book_id = b.book_id
+        ),
+        deltas AS (
+            SELECT {bucket_sql('day', 'issue_date')} as period, category, 1 as issues, 0 as returns, 0 as overdue_delta
+            FROM loans
+            UNION ALL
+            SELECT {bucket_sql('day', "date(due_date, '+1 day')")}, category, 0, 0, 1
+            FROM loans
+            UNION ALL
+            SELECT {bucket_sql('day', 'return_date')}, category, 0, 1, 0
+            FROM loans WHERE return_date IS NOT NULL
+            UNION ALL
+            SELECT {bucket_sql('day', "date(max(due_date, return_date), '+1 day')")}, category, 0, 0, -1
+            FROM loans WHERE return_date IS NOT NULL
+        )
+        SELECT period, category, SUM(issues) as issues, SUM(returns) as returns, SUM(overdue_delta) as overdue_delta
+        FROM deltas
+        GROUP BY period, category
+    '''
+
+def rebuild_aggregates(conn, commit=True):
+    # One pass over the loans at day grain; coarser grains are rolled up from the
+    # day rows, since a bucket only depends on the date. With commit=False the
+    # rebuild joins the caller's transaction.
+    c = conn.cursor()
+    c.execute('DELETE FROM circulation_stats')
+    c.execute(f'''
+        INSERT INTO circulation_stats (grain, period, category, issues, returns, overdue_delta)
+        SELECT 'day', period, category, issues, returns, overdue_delta
+        FROM ({_day_deltas_sql()})
+    ''')
+    for grain in GRAINS:
+        if grain == 'day':
+            continue
+        c.execute(f'''
+            INSERT INTO circulation_stats (grain, period, category, issues, returns, overdue_delta)
+            SELECT ?, {bucket_sql(grain, 'period')}, category, SUM(issues), SUM(returns), SUM(overdue_delta)
+            FROM circulation_stats
+            WHERE grain = 'day'
+            GROUP BY 2, category
+        ''', (grain,))
+    if commit:
+        conn.commit()
+
+def find_aggregate_drift(conn):
+    # Day buckets whose stored sums differ from the loans. Buckets that net to
+    # zero count as absent on both sides. Returns [(period, category, stored, actual)]
+    # with stored/actual as (issues, returns, overdue_delta) or None.
+    c = conn.cursor()
+    c.execute(f'''
+        WITH actual AS (
+            SELECT * FROM ({_day_deltas_sql()})
+            WHERE issues != 0 OR returns != 0 OR overdue_delta != 0
+        ),
+        stored AS (
+            SELECT period, category, issues, returns, overdue_delta FROM circulation_stats
+            WHERE grain = 'day' AND (issues != 0 OR returns != 0 OR overdue_delta != 0)
+        ),
+        keys AS (
+            SELECT period, category FROM actual UNION SELECT period, category FROM stored
+        )
+        SELECT k.period, k.category,
+               s.issues, s.returns, s.overdue_delta,
+               a.issues, a.returns, a.overdue_delta
+        FROM keys k
+        LEFT JOIN stored s ON s.period = k.period AND s.category = k.category
+        LEFT JOIN actual a ON a.period = k.period AND a.category = k.category
+        WHERE s.issues IS NOT a.issues OR s.returns IS NOT a.returns OR s.overdue_delta IS NOT a.overdue_delta
+        ORDER BY k.period, k.category
+    ''')
+    return [(row[0], row[1], tuple(row[2:5]) if row[2] is not None else None,
+             tuple(row[5:8]) if row[5] is not None else None) for row in c.fetchall()]
+
+def get_history_start(conn):
+    c = conn.cursor()
+    c.execute("SELECT MIN(period) FROM circulation_stats WHERE grain = 'day'")
+    first = c.fetchone()[0]
+    return date.fromisoformat(first) if first else date.today()
+
+def get_trends(conn, start, end):
+    # Returns (grain, backlog, series, category_mix) for the date range [start, end].
+    # series rows are (period, issues, returns, overdue_delta); the overdue backlog at
+    # the end of each period is backlog plus the running sum of overdue_delta
+    grain = choose_grain(start, end)
+    c = conn.cursor()
+    first_period = f"{bucket_sql(grain, '?')}"
+
+    # Backlog carried in from before the range
+    c.execute(f'''
+        SELECT COALESCE(SUM(overdue_delta), 0) FROM circulation_stats
+        WHERE grain = ? AND period < {first_period}
+    ''', (grain, start.isoformat()))
+    backlog = c.fetchone()[0]
+
+    c.execute(f'''
+        SELECT period, SUM(issues), SUM(returns), SUM(overdue_delta)
+        FROM circulation_stats
+        WHERE grain = ? AND period >= {first_period} AND period <= ?
+        GROUP BY period
+        ORDER BY period
+    ''', (grain, start.isoformat(), end.isoformat()))
+    series = [tuple(row) for row in c.fetchall()]
+
+    c.execute(f'''
+        SELECT category, SUM(issues) as issues
+        FROM circulation_stats
+        WHERE grain = ? AND period >= {first_period} AND period <= ?
+        GROUP BY category
+        HAVING SUM(issues) > 0
+        ORDER BY issues DESC
+    ''', (grain, start.isoformat(), end.isoformat()))
+    category_mix = [tuple(row) for row in c.fetchall()]
+
+    return grain, backlog, series, category_mix
+
+def range_for_preset(preset, history_start, today=None):
+    today = today or date.today()
+    days = {'Last 30 days': 30, 'Last 90 days': 90, 'Last year': 365, 'Last 5 years': 5 * 365}
+    if preset in days:
+        return today - timedelta(days=days[preset] - 1), today
+    return min(history_start, today), today
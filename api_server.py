@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import queue
+import sqlite3
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import circulation
+import gate
+import policy
+import search_index
+import storage
+import writer
+
+# JSON API for kiosks and gate readers. Writes go through the branch writer thread,
+# so they follow the same circulation rules and group commit as the dashboard.
+# Reads use a small pool of connections to the primary, off the event loop.
+
+HOST = '127.0.0.1'
+PORT = 8765
+POOL_SIZE = 4
+KEEP_ALIVE_TIMEOUT = 30      # seconds an idle connection is kept open
+MAX_BODY = 64 * 1024
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ConnectionPool:
+    # Reusable read connections to one branch; opened lazily, at most `size` of them
+    def __init__(self, branch, size=POOL_SIZE):
+        self.branch = branch
+        self.idle = queue.LifoQueue()
+        self.slots = queue.Queue()
+        for _ in range(size):
+            self.slots.put(None)
+
+    def run(self, query, *args):
+        conn = None
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            self.slots.get()  # waits if every connection is busy
+            try:
+                conn = sqlite3.connect(storage.get_db_path(self.branch), check_same_thread=False)
+            except BaseException:
+                self.slots.put(None)  # the slot was never used
+                raise
+            conn.row_factory = sqlite3.Row
+        try:
+            return query(conn, *args)
+        finally:
+            conn.rollback()
+            self.idle.put(conn)
+
+_pools = {}
+
+def get_pool(branch):
+    if branch not in _pools:
+        _pools[branch] = ConnectionPool(branch)
+    return _pools[branch]
+
+def query_rfid(conn, rfid):
+    c = conn.cursor()
+    c.execute('''
+        SELECT t.transaction_id, t.book_id, b.title, b.author, t.student_id, s.name as student_name,
+               t.issue_date, t.due_date
+        FROM transactions t
+        JOIN books b ON t.book_id = b.book_id
+        JOIN students s ON t.student_id = s.student_id
+        WHERE t.rfid = ? AND t.status = 'Issued'
+    ''', (rfid,))
+    row = c.fetchone()
+    return {'rfid': rfid, 'issued': bool(row), 'loan': dict(row) if row else None}
+
+def query_patron(conn, student_id):
+    c = conn.cursor()
+    c.execute('''
+        SELECT s.student_id, s.name, ps.patron_type, ps.books_issued, ps.max_loans, ps.standing, ps.oldest_due
+        FROM students s
+        JOIN patron_standing ps ON ps.student_id = s.student_id
+        WHERE s.student_id = ?
+    ''', (student_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    c.execute('''
+        SELECT t.transaction_id, t.book_id, b.title, t.rfid, t.issue_date, t.due_date
+        FROM transactions t
+        JOIN books b ON t.book_id = b.book_id
+        WHERE t.student_id = ? AND t.status = 'Issued'
+        ORDER BY t.due_date
+    ''', (student_id,))
+    return dict(row, loans=[dict(loan) for loan in c.fetchall()])
+
+def search(branch, query, kind=None, limit=10):
+    return [
+        {'score': score, 'kind': doc_kind, 'id': doc_id, 'matched': field, **doc}
+        for score, doc_kind, doc_id, field, doc in search_index.get_index(branch).search(query, kind, limit)
+    ]
+
+def required(body, *fields):
+    missing = [field for field in fields if not body.get(field)]
+    if missing:
+        raise ApiError(400, f"Missing fields: {', '.join(missing)}")
+    return [str(body[field]) for field in fields]
+
+async def submit(branch, operation, *args):
+    try:
+        return await asyncio.wrap_future(writer.submit(branch, operation, *args))
+    except circulation.CirculationError as e:
+        raise ApiError(409, str(e))
+
+async def handle(method, path, params, body):
+    loop = asyncio.get_running_loop()
+    branch = params.get('branch') or storage.get_branch_names()[0]
+    if branch not in storage.get_branch_names():
+        raise ApiError(404, f"Unknown branch: {branch}")
+    parts = [unquote(part) for part in path.strip('/').split('/')]
+
+    if parts == ['health']:
+        return {'status': 'ok', 'branches': storage.get_branch_names()}
+
+    if parts == ['issue'] or parts == ['return']:
+        if method != 'POST':
+            raise ApiError(405, "Use POST")
+        if parts == ['issue']:
+            book_id, student_id, rfid = required(body, 'book_id', 'student_id', 'rfid')
+            transaction_id = await submit(branch, 'issue', book_id, student_id, rfid)
+            return {'transaction_id': transaction_id, 'book_id': book_id, 'student_id': student_id}
+        book_id, student_id = required(body, 'book_id', 'student_id')
+        fee = await submit(branch, 'return', book_id, student_id)
+        return {'book_id': book_id, 'student_id': student_id, 'fee': fee}
+
+    if parts == ['students']:
+        if method != 'POST':
+            raise ApiError(405, "Use POST")
+        student_id, name, email, phone = required(body, 'student_id', 'name', 'email', 'phone')
+        patron_type = str(body.get('patron_type') or policy.DEFAULT_PATRON_TYPE)
+        await submit(branch, 'add_student', student_id, name, email, phone, patron_type)
+        return {'student_id': student_id, 'patron_type': patron_type}
+
+    if parts == ['gate', 'read']:
+        if method != 'POST':
+            raise ApiError(405, "Use POST")
+        rfid, = required(body, 'rfid')
+        # Open-loan tags answer from memory on the event loop; only misses touch the database
+        exit_gate = gate.get_gate(branch)
+        started = time.perf_counter()
+        result = exit_gate.lookup(rfid, started) or await loop.run_in_executor(None, exit_gate.confirm, rfid, started)
+        return result.as_dict()
+
+    if method != 'GET':
+        raise ApiError(405, "Use GET")
+
+    if parts == ['gate', 'stats']:
+        return gate.get_gate(branch).stats()
+
+    if len(parts) == 2 and parts[0] == 'rfid':
+        return await loop.run_in_executor(None, get_pool(branch).run, query_rfid, parts[1])
+
+    if len(parts) == 2 and parts[0] == 'patrons':
+        patron = await loop.run_in_executor(None, get_pool(branch).run, query_patron, parts[1])
+        if patron is None:
+            raise ApiError(404, "Student not found!")
+        return patron
+
+    if parts == ['search']:
+        query = params.get('q', '')
+        kind = params.get('kind')
+        if kind not in (None, 'book', 'student'):
+            raise ApiError(400, "kind must be book or student")
+        try:
+            limit = min(int(params.get('limit', 10)), 100)
+        except ValueError:
+            raise ApiError(400, "limit must be a number")
+        results = await loop.run_in_executor(None, search, branch, query, kind, limit)
+        return {'query': query, 'results': results}
+
+    raise ApiError(404, f"No route for {method} {path}")
+
+async def read_request(reader):
+    # Returns (method, target, version, headers, body) or None when the client is done
+    line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise ApiError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise ApiError(400, "Content-Length must be a number")
+    if length < 0:
+        raise ApiError(400, "Content-Length cannot be negative")
+    if length > MAX_BODY:
+        raise ApiError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target, version, headers, body
+
+def write_response(writer_stream, status, payload, keep_alive):
+    body = json.dumps(payload, default=str).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer_stream.write(head.encode('latin-1') + body)
+
+async def serve_connection(reader, writer_stream):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers, raw = request
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                url = urlsplit(target)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    raise ApiError(400, "Body must be JSON")
+                if not isinstance(body, dict):
+                    raise ApiError(400, "Body must be a JSON object")
+                started = time.perf_counter()
+                payload = await handle(method, url.path, params, body)
+                payload['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+                write_response(writer_stream, 200, payload, keep_alive)
+            except ApiError as e:
+                write_response(writer_stream, e.status, {'error': str(e)}, keep_alive)
+            except sqlite3.Error as e:
+                write_response(writer_stream, 503, {'error': f"Database error: {e}"}, keep_alive)
+            except Exception as e:
+                write_response(writer_stream, 500, {'error': str(e)}, False)
+                keep_alive = False
+            await writer_stream.drain()
+            if not keep_alive:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer_stream.close()
+
+async def serve(host=HOST, port=PORT):
+    for branch in storage.get_branch_names():
+        storage.init_db(branch)
+        gate.get_gate(branch)  # load the open-loan tags before the first read
+    writer.add_listener(gate.on_write)
+    server = await asyncio.start_server(serve_connection, host, port)
+    print(f"Library API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON API for kiosks and gate readers")
+    parser.add_argument('--host', default=HOST, help="interface to bind (default: localhost only)")
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
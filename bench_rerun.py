@@ -0,0 +1,49 @@
+import argparse
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+# Rerun latency budget for the dashboard script with no data changes, in ms (p95)
+RERUN_BUDGET_MS = 250
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Streamlit rerun latency of the dashboard")
+    parser.add_argument('--script', default='streamlit_app.py')
+    parser.add_argument('--reruns', type=int, default=30)
+    parser.add_argument('--budget-ms', type=float, default=RERUN_BUDGET_MS, help="fail if p95 script time exceeds this")
+    args = parser.parse_args()
+
+    at = AppTest.from_file(args.script, default_timeout=120)
+    start = time.perf_counter()
+    at.run()  # first run pays for bootstrap and cold caches
+    first_ms = (time.perf_counter() - start) * 1000
+    if at.exception:
+        print(f"script raised: {at.exception[0].value}")
+        sys.exit(1)
+
+    script_ms = []
+    wall_ms = []
+    for _ in range(args.reruns):
+        start = time.perf_counter()
+        at.run()
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        script_ms.append(at.session_state['rerun_seconds'] * 1000)
+
+    p95 = percentile(script_ms, 95)
+    print(f"first run: {first_ms:.0f} ms (bootstrap)")
+    print(f"script time over {args.reruns} reruns: p50 {statistics.median(script_ms):.1f} ms, "
+          f"p95 {p95:.1f} ms, max {max(script_ms):.1f} ms")
+    print(f"including test harness: p50 {statistics.median(wall_ms):.1f} ms")
+    if p95 > args.budget_ms:
+        print(f"FAIL: p95 {p95:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        sys.exit(1)
+    print(f"OK: within the {args.budget_ms:.0f} ms budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import heapq
+import threading
+from collections import deque
+
+import replica
+import storage
+
+# Change rows kept by prune(); readers that fall further behind reload in full
+KEEP_CHANGES = 100000
+# Recent transaction changes a feed remembers for the live activity panel
+RECENT_CHANGES = 50
+# Newest loans (by issue date) a feed keeps in memory for the Transactions view
+WINDOW_ROWS = 5000
+
+FEED_TABLES = {'transactions': 'transaction_id', 'books': 'book_id', 'students': 'student_id'}
+
+TRANSACTION_ROWS = '''
+    SELECT t.transaction_id, t.book_id, b.title as book_title, t.student_id, s.name as student_name,
+           t.rfid, t.issue_date, t.due_date, t.return_date, t.status, t.fee
+    FROM transactions t
+    JOIN books b ON t.book_id = b.book_id
+    JOIN students s ON t.student_id = s.student_id
+'''
+
+def init_changefeed(conn):
+    c = conn.cursor()
+
+    # One row per insert, update or delete on the feed tables, numbered in commit
+    # order. Readers remember the last seq they saw and ask only for what follows.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+        )
+    ''')
+
+    # Feeds load the newest loans first
+    c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_issue_date ON transactions (issue_date)')
+
+    for table, key in FEED_TABLES.items():
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_insert AFTER INSERT ON {table}
+            BEGIN INSERT INTO change_log (table_name, row_key, op) VALUES ('{table}', NEW.{key}, 'insert'); END
+        ''')
+        # A changed key is logged as a delete of the old one
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_update AFTER UPDATE ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, row_key, op)
+                SELECT '{table}', OLD.{key}, 'delete' WHERE OLD.{key} IS NOT NEW.{key};
+                INSERT INTO change_log (table_name, row_key, op) VALUES ('{table}', NEW.{key}, 'update');
+            END
+        ''')
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS change_log_{table}_delete AFTER DELETE ON {table}
+            BEGIN INSERT INTO change_log (table_name, row_key, op) VALUES ('{table}', OLD.{key}, 'delete'); END
+        ''')
+
+def get_last_seq(conn):
+    c = conn.cursor()
+    c.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log')
+    return c.fetchone()[0]
+
+def get_changes_since(conn, seq, table=None, limit=None):
+    # (seq, table_name, row_key, op, changed_at) after `seq`, oldest first
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT seq, table_name, row_key, op, changed_at FROM change_log
+        WHERE seq > ? {'AND table_name = ?' if table else ''}
+        ORDER BY seq {'LIMIT ?' if limit else ''}
+    ''', (seq,) + ((table,) if table else ()) + ((limit,) if limit else ()))
+    return c.fetchall()
+
+def is_behind(conn, seq):
+    # True when rows after `seq` have been pruned (or the log was reset), so a
+    # reader at `seq` cannot catch up from the log alone
+    c = conn.cursor()
+    c.execute('SELECT MIN(seq), MAX(seq) FROM change_log')
+    first, last = c.fetchone()
+    if last is None:
+        return seq > 0
+    return seq > last or seq < first - 1
+
+def prune(conn, keep=KEEP_CHANGES):
+    c = conn.cursor()
+    c.execute('DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?', (keep,))
+    conn.commit()
+    return c.rowcount
+
+class TransactionFeed:
+    # The newest `window` loans of one branch (transactions joined with book title
+    # and student name), held in memory. The window is loaded from the branch's
+    # snapshot replica and then caught up from change_log on the primary, starting
+    # at the seq the replica was taken at, so a refresh reads only the rows changed
+    # since the last one. Older loans drop out as new ones are issued.
+    def __init__(self, branch, window=WINDOW_ROWS):
+        self.branch = branch
+        self.window = window
+        self.rows = {}
+        self.by_book = {}  # book_id -> transaction_ids, to find the loans a book change touches
+        self.seq = 0
+        self.max_rowid = 0  # highest transactions rowid in the last full load
+        self.loaded = False
+        self.recent = deque(maxlen=RECENT_CHANGES)  # (seq, transaction_id, op, changed_at, row)
+        self.last_refresh_rows = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            loaded_rows = 0
+            from_replica = not self.loaded
+            if from_replica:
+                self._load_from(replica.connect)
+                loaded_rows = self.last_refresh_rows
+            conn = storage.connect(self.branch)
+            try:
+                conn.execute('BEGIN')  # seq and rows from one snapshot
+                if is_behind(conn, self.seq) or (from_replica and self._has_unlogged(conn)):
+                    # The replica is older than the change log covers: pruned past
+                    # it, or loans were bulk loaded (seeded) without being logged
+                    # since it was taken. Reload the window from the primary.
+                    self._load(conn)
+                else:
+                    self._apply(conn)
+            finally:
+                conn.rollback()
+                conn.close()
+            self.last_refresh_rows += loaded_rows
+            return self.seq
+
+    def _load_from(self, connect):
+        conn = connect(self.branch)
+        try:
+            conn.execute('BEGIN')
+            self._load(conn)
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def snapshot(self):
+        # (rows, recent, last_refresh_rows) copied under the lock, for rendering
+        # while other sessions refresh the same feed
+        with self.lock:
+            return list(self.rows.values()), list(self.recent), self.last_refresh_rows
+
+    def _has_unlogged(self, conn):
+        # True when the primary has loans added after the last load that no
+        # change_log row after self.seq accounts for
+        c = conn.cursor()
+        c.execute('''
+            SELECT EXISTS (
+                SELECT 1 FROM transactions
+                WHERE rowid > ? AND transaction_id NOT IN (
+                    SELECT row_key FROM change_log WHERE table_name = 'transactions' AND seq > ?
+                )
+            )
+        ''', (self.max_rowid, self.seq))
+        return bool(c.fetchone()[0])
+
+    def _load(self, conn):
+        self.seq = get_last_seq(conn)
+        c = conn.cursor()
+        c.execute('SELECT COALESCE(MAX(rowid), 0) FROM transactions')
+        self.max_rowid = c.fetchone()[0]
+        c.execute(f'{TRANSACTION_ROWS} ORDER BY t.issue_date DESC LIMIT ?', (self.window,))
+        self.rows = {row['transaction_id']: dict(row) for row in c.fetchall()}
+        self.by_book = {}
+        for transaction_id, row in self.rows.items():
+            self.by_book.setdefault(row['book_id'], set()).add(transaction_id)
+        self.recent.clear()
+        self.loaded = True
+        self.last_refresh_rows = len(self.rows)
+
+    def _apply(self, conn):
+        changes = get_changes_since(conn, self.seq)
+        if not changes:
+            self.last_refresh_rows = 0
+            return
+        c = conn.cursor()
+        changed = {}
+        for change in changes:
+            if change['table_name'] == 'transactions':
+                changed[change['row_key']] = change['op']
+        # A changed book can only change the title shown on its loans
+        books = {change['row_key'] for change in changes if change['table_name'] == 'books'}
+        for book_id in books:
+            for transaction_id in self.by_book.get(book_id, ()):
+                changed.setdefault(transaction_id, 'update')
+
+        keys = list(changed)
+        fetched = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            c.execute(f"{TRANSACTION_ROWS} WHERE t.transaction_id IN ({', '.join('?' * len(chunk))})", chunk)
+            fetched.update((row['transaction_id'], dict(row)) for row in c.fetchall())
+        for change in changes:
+            if change['table_name'] == 'transactions':
+                self.recent.append((change['seq'], change['row_key'], change['op'], change['changed_at'],
+                                    fetched.get(change['row_key'])))
+        # New loans join the window; changes to loans older than it are only
+        # listed in `recent`
+        for key in keys:
+            old = self.rows.pop(key, None)
+            if old:
+                self.by_book[old['book_id']].discard(key)
+            if key in fetched and (old or changed[key] == 'insert'):
+                self.rows[key] = fetched[key]
+                self.by_book.setdefault(fetched[key]['book_id'], set()).add(key)
+        excess = len(self.rows) - self.window
+        if excess > 0:
+            for key in heapq.nsmallest(excess, self.rows, key=lambda key: self.rows[key]['issue_date']):
+                self.by_book[self.rows.pop(key)['book_id']].discard(key)
+        self.seq = changes[-1]['seq']
+        self.last_refresh_rows = len(changes) + len(fetched)
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+def get_feed(branch):
+    with _feeds_lock:
+        if branch not in _feeds:
+            _feeds[branch] = TransactionFeed(branch)
+        return _feeds[branch]
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or prune the change feed")
+    parser.add_argument('--branch', help="branch to use (default: all branches)")
+    parser.add_argument('--since', type=int, help="print the changes after this seq")
+    parser.add_argument('--prune', action='store_true', help="keep only the newest --keep changes")
+    parser.add_argument('--keep', type=int, default=KEEP_CHANGES)
+    args = parser.parse_args()
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    for branch in branches:
+        storage.init_db(branch)
+        conn = storage.connect(branch)
+        try:
+            if args.prune:
+                print(f"[{branch}] Pruned {prune(conn, args.keep)} changes")
+            if args.since is not None:
+                for change in get_changes_since(conn, args.since):
+                    print(f"[{branch}] {change['seq']} {change['changed_at']} {change['op']} {change['table_name']} {change['row_key']}")
+            print(f"[{branch}] Last change seq {get_last_seq(conn)}")
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import re
+from datetime import datetime, timedelta
+
+import events
+import policy
+
+# Circulation rules shared by the Streamlit app and the writer thread. Each function
+# works on a cursor inside the caller's transaction and raises CirculationError
+# with a user-facing message when a rule is violated.
+
+class CirculationError(Exception):
+    pass
+
+def add_book(c, book_id, title, author, isbn, category):
+    if not book_id or not title or not author or not isbn or not category:
+        raise CirculationError("All fields are required!")
+
+    if not book_id.isdigit() or len(book_id) != 3:
+        raise CirculationError("Book ID must be 3 digits!")
+
+    c.execute('SELECT book_id FROM books WHERE book_id = ?', (book_id,))
+    if c.fetchone():
+        raise CirculationError("Book ID already exists!")
+
+    c.execute('''
+        INSERT INTO books (book_id, title, author, isbn, category)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (book_id, title, author, isbn, category))
+    return book_id
+
+def add_student(c, student_id, name, email, phone, patron_type=policy.DEFAULT_PATRON_TYPE):
+    if not student_id or not name or not email or not phone:
+        raise CirculationError("All fields are required!")
+
+    if not re.match(r'^[A-Za-z0-9]{8}$', student_id):
+        raise CirculationError("Student ID must be 8 alphanumeric characters!")
+
+    # Only types the compiled policy knows, so every patron has loan terms
+    patron_type = patron_type or policy.DEFAULT_PATRON_TYPE
+    patron_types = policy.get_patron_types(c.connection)
+    if patron_type not in patron_types:
+        raise CirculationError(f"Unknown patron type {patron_type}! Use one of: {', '.join(patron_types)}")
+
+    c.execute('SELECT student_id FROM students WHERE student_id = ?', (student_id,))
+    if c.fetchone():
+        raise CirculationError("Student ID already exists!")
+
+    c.execute('''
+        INSERT INTO students (student_id, name, email, phone, patron_type)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (student_id, name, email, phone, patron_type))
+    return student_id
+
+def issue_book(c, book_id, student_id, rfid):
+    if not book_id or not student_id or not rfid:
+        raise CirculationError("All fields are required!")
+
+    # Check book availability, with the loan period for its category and the
+    # student's patron type (NULL if there is no such student; the insert below
+    # then finds no patron)
+    c.execute('''
+        SELECT b.status, b.category, s.patron_type, lp.loan_days
+        FROM books b
+        LEFT JOIN students s ON s.student_id = ?
+        LEFT JOIN loan_policy lp ON lp.category = b.category AND lp.patron_type = s.patron_type
+        WHERE b.book_id = ?
+    ''', (student_id, book_id))
+    book = c.fetchone()
+    if not book:
+        raise CirculationError("Book not found!")
+    if book[0] == 'Issued':
+        raise CirculationError("Book is already issued!")
+    if book[2] is not None and book[3] is None:
+        raise CirculationError(f"No loan policy for category {book[1]} / patron type {book[2]}!")
+
+    # Create transaction, only if the student's standing and borrowing limit allow it
+    issue_date = datetime.now()
+    due_date = issue_date + timedelta(days=book[3] or 0)
+    c.execute('SELECT COUNT(*) FROM transactions')
+    transaction_id = f"T{c.fetchone()[0] + 1:03d}"
+
+    c.execute('''
+        INSERT INTO transactions
+        (transaction_id, book_id, student_id, rfid, issue_date, due_date)
+        SELECT ?, ?, student_id, ?, ?, ?
+        FROM patron_standing
+        WHERE student_id = ? AND standing != 'Blocked' AND books_issued < max_loans
+    ''', (transaction_id, book_id, rfid, issue_date, due_date, student_id))
+    if c.rowcount == 0:
+        c.execute('SELECT standing, block_after_days FROM patron_standing WHERE student_id = ?', (student_id,))
+        student = c.fetchone()
+        if not student:
+            raise CirculationError("Student not found!")
+        if student[0] == 'Blocked':
+            raise CirculationError(f"Student is blocked: a book is more than {student[1]} days overdue!")
+        raise CirculationError("Student has reached maximum book limit!")
+    events.append_issue(c, transaction_id, book_id, student_id, rfid, issue_date, due_date)
+
+    # Update book and student status
+    c.execute('UPDATE books SET status = ? WHERE book_id = ?', ('Issued', book_id))
+    c.execute('UPDATE students SET books_issued = books_issued + 1 WHERE student_id = ?', (student_id,))
+    return transaction_id
+
+def return_book(c, book_id, student_id):
+    if not book_id or not student_id:
+        raise CirculationError("All fields are required!")
+
+    # Check book status
+    c.execute('SELECT status FROM books WHERE book_id = ?', (book_id,))
+    book = c.fetchone()
+    if not book:
+        raise CirculationError("Book not found!")
+    if book[0] == 'Available':
+        raise CirculationError("Book is already available!")
+
+    # Check student
+    c.execute('SELECT student_id FROM students WHERE student_id = ?', (student_id,))
+    if not c.fetchone():
+        raise CirculationError("Student not found!")
+
+    # Get active transaction and the daily fee for its book and patron
+    c.execute('''
+        SELECT t.transaction_id, t.due_date, lp.daily_fee, b.category, s.patron_type
+        FROM transactions t
+        JOIN books b ON b.book_id = t.book_id
+        JOIN students s ON s.student_id = t.student_id
+        LEFT JOIN loan_policy lp ON lp.category = b.category AND lp.patron_type = s.patron_type
+        WHERE t.book_id = ? AND t.student_id = ? AND t.status = 'Issued'
+    ''', (book_id, student_id))
+    transaction = c.fetchone()
+
+    if not transaction:
+        raise CirculationError("No active issue found for this book and student!")
+    if transaction[2] is None:
+        raise CirculationError(f"No loan policy for category {transaction[3]} / patron type {transaction[4]}!")
+
+    # Calculate fee
+    return_date = datetime.now()
+    due_date = datetime.fromisoformat(transaction[1])
+    days_overdue = (return_date - due_date).days if return_date > due_date else 0
+    fee = days_overdue * transaction[2]
+
+    # Update transaction
+    c.execute('''
+        UPDATE transactions
+        SET return_date = ?, status = 'Returned', fee = ?
+        WHERE transaction_id = ?
+    ''', (return_date, fee, transaction[0]))
+    events.append_return(c, transaction[0], book_id, student_id, return_date, fee)
+
+    # Update book and student status
+    c.execute('UPDATE books SET status = ? WHERE book_id = ?', ('Available', book_id))
+    c.execute('UPDATE students SET books_issued = books_issued - 1 WHERE student_id = ?', (student_id,))
+    return fee
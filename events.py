@@ -0,0 +1,275 @@
+import argparse
+import time
+from datetime import datetime
+
+import analytics
+import reconcile
+import storage
+
+# Take a new snapshot once this many events have been appended since the last one
+SNAPSHOT_EVERY = 1000
+
+TRANSACTION_COLUMNS = 'transaction_id, book_id, student_id, rfid, issue_date, due_date, return_date, status, fee'
+
+def init_events(conn):
+    c = conn.cursor()
+
+    # Every issue and return, in the order it happened. transactions, books.status
+    # and students.books_issued are projections of this log.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS circulation_events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            transaction_id TEXT NOT NULL,
+            book_id TEXT NOT NULL,
+            student_id TEXT NOT NULL,
+            rfid TEXT,
+            occurred_at TIMESTAMP NOT NULL,
+            due_date TIMESTAMP,
+            fee REAL
+        )
+    ''')
+
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS circulation_events_no_update
+        BEFORE UPDATE ON circulation_events
+        BEGIN SELECT RAISE(ABORT, 'circulation_events is append-only'); END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS circulation_events_no_delete
+        BEFORE DELETE ON circulation_events
+        BEGIN SELECT RAISE(ABORT, 'circulation_events is append-only'); END
+    ''')
+
+    # Latest snapshot of the transactions projection and the event it covers up to
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS projection_snapshot (
+            snapshot_seq INTEGER NOT NULL,
+            taken_at TIMESTAMP NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_transactions (
+            transaction_id TEXT PRIMARY KEY,
+            book_id TEXT,
+            student_id TEXT,
+            rfid TEXT NOT NULL,
+            issue_date TIMESTAMP NOT NULL,
+            due_date TIMESTAMP NOT NULL,
+            return_date TIMESTAMP,
+            status TEXT DEFAULT 'Issued',
+            fee REAL DEFAULT 0.0
+        )
+    ''')
+
+    backfill(conn)
+
+def append_issue(c, transaction_id, book_id, student_id, rfid, issued_at, due_date):
+    c.execute('''
+        INSERT INTO circulation_events
+        (event_type, transaction_id, book_id, student_id, rfid, occurred_at, due_date)
+        VALUES ('Issued', ?, ?, ?, ?, ?, ?)
+    ''', (transaction_id, book_id, student_id, rfid, issued_at, due_date))
+    return c.lastrowid
+
+def append_return(c, transaction_id, book_id, student_id, returned_at, fee):
+    c.execute('''
+        INSERT INTO circulation_events
+        (event_type, transaction_id, book_id, student_id, occurred_at, fee)
+        VALUES ('Returned', ?, ?, ?, ?, ?)
+    ''', (transaction_id, book_id, student_id, returned_at, fee))
+    return c.lastrowid
+
+def backfill(conn):
+    # Seed the log from transactions recorded before it existed
+    c = conn.cursor()
+    c.execute('SELECT EXISTS (SELECT 1 FROM circulation_events)')
+    if c.fetchone()[0]:
+        return 0
+    c.execute('''
+        INSERT INTO circulation_events
+        (event_type, transaction_id, book_id, student_id, rfid, occurred_at, due_date, fee)
+        SELECT event_type, transaction_id, book_id, student_id, rfid, occurred_at, due_date, fee
+        FROM (
+            SELECT 'Issued' as event_type, transaction_id, book_id, student_id, rfid,
+                   issue_date as occurred_at, due_date, NULL as fee
+            FROM transactions
+            UNION ALL
+            SELECT 'Returned', transaction_id, book_id, student_id, NULL, return_date, NULL, fee
+            FROM transactions WHERE return_date IS NOT NULL
+        )
+        ORDER BY occurred_at, event_type
+    ''')
+    return c.rowcount
+
+def get_last_seq(conn):
+    c = conn.cursor()
+    c.execute('SELECT COALESCE(MAX(seq), 0) FROM circulation_events')
+    return c.fetchone()[0]
+
+def get_snapshot_seq(conn):
+    c = conn.cursor()
+    c.execute('SELECT COALESCE(MAX(snapshot_seq), 0) FROM projection_snapshot')
+    return c.fetchone()[0]
+
+def _project(conn, use_snapshot=True):
+    # Build temp.projected_transactions from the latest snapshot plus the events
+    # after it, replayed in bulk with set-based statements
+    c = conn.cursor()
+    base_seq = get_snapshot_seq(conn) if use_snapshot else 0
+    last_seq = get_last_seq(conn)
+
+    c.execute('DROP TABLE IF EXISTS temp.projected_transactions')
+    c.execute('''
+        CREATE TEMP TABLE projected_transactions (
+            transaction_id TEXT PRIMARY KEY,
+            book_id TEXT,
+            student_id TEXT,
+            rfid TEXT NOT NULL,
+            issue_date TIMESTAMP NOT NULL,
+            due_date TIMESTAMP NOT NULL,
+            return_date TIMESTAMP,
+            status TEXT DEFAULT 'Issued',
+            fee REAL DEFAULT 0.0
+        )
+    ''')
+    if base_seq:
+        c.execute(f'''
+            INSERT INTO projected_transactions ({TRANSACTION_COLUMNS})
+            SELECT {TRANSACTION_COLUMNS} FROM snapshot_transactions
+        ''')
+
+    c.execute('''
+        INSERT OR REPLACE INTO projected_transactions
+        (transaction_id, book_id, student_id, rfid, issue_date, due_date, status, fee)
+        SELECT transaction_id, book_id, student_id, rfid, occurred_at, due_date, 'Issued', 0.0
+        FROM circulation_events
+        WHERE seq > ? AND seq <= ? AND event_type = 'Issued'
+    ''', (base_seq, last_seq))
+    c.execute('''
+        UPDATE projected_transactions
+        SET return_date = r.occurred_at, status = 'Returned', fee = r.fee
+        FROM (
+            SELECT transaction_id, occurred_at, fee FROM circulation_events
+            WHERE seq > ? AND seq <= ? AND event_type = 'Returned'
+        ) r
+        WHERE projected_transactions.transaction_id = r.transaction_id
+    ''', (base_seq, last_seq))
+    return base_seq, last_seq
+
+def take_snapshot(conn):
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        base_seq, last_seq = _project(conn)
+        c = conn.cursor()
+        c.execute('DELETE FROM snapshot_transactions')
+        c.execute(f'''
+            INSERT INTO snapshot_transactions ({TRANSACTION_COLUMNS})
+            SELECT {TRANSACTION_COLUMNS} FROM projected_transactions
+        ''')
+        c.execute('DELETE FROM projection_snapshot')
+        c.execute('INSERT INTO projection_snapshot (snapshot_seq, taken_at) VALUES (?, ?)', (last_seq, datetime.now()))
+        c.execute('DROP TABLE temp.projected_transactions')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return last_seq
+
+def maybe_snapshot(conn):
+    if get_last_seq(conn) - get_snapshot_seq(conn) >= SNAPSHOT_EVERY:
+        return take_snapshot(conn)
+    return None
+
+def rebuild(conn, apply=True, use_snapshot=True):
+    # Re-derive the current-state tables from the log and fix any drift.
+    # The repair writes are not loans being issued or returned, so the trend
+    # aggregates are rebuilt from the repaired rows rather than left to the
+    # triggers. With apply=False the drift is reported and rolled back.
+    start = time.perf_counter()
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        base_seq, last_seq = _project(conn, use_snapshot)
+        c = conn.cursor()
+        report = {'snapshot_seq': base_seq, 'events_replayed': 0, 'last_seq': last_seq}
+
+        c.execute('SELECT COUNT(*) FROM circulation_events WHERE seq > ? AND seq <= ?', (base_seq, last_seq))
+        report['events_replayed'] = c.fetchone()[0]
+
+        c.execute('''
+            DELETE FROM transactions
+            WHERE transaction_id NOT IN (SELECT transaction_id FROM projected_transactions)
+        ''')
+        report['transactions_deleted'] = c.rowcount
+
+        c.execute(f'''
+            INSERT INTO transactions ({TRANSACTION_COLUMNS})
+            SELECT {TRANSACTION_COLUMNS} FROM projected_transactions
+            WHERE transaction_id NOT IN (SELECT transaction_id FROM transactions)
+        ''')
+        report['transactions_inserted'] = c.rowcount
+
+        c.execute('''
+            UPDATE transactions
+            SET book_id = p.book_id, student_id = p.student_id, rfid = p.rfid,
+                issue_date = p.issue_date, due_date = p.due_date, return_date = p.return_date,
+                status = p.status, fee = p.fee
+            FROM projected_transactions p
+            WHERE transactions.transaction_id = p.transaction_id
+            AND (transactions.book_id IS NOT p.book_id OR transactions.student_id IS NOT p.student_id
+                 OR transactions.rfid IS NOT p.rfid OR transactions.issue_date IS NOT p.issue_date
+                 OR transactions.due_date IS NOT p.due_date OR transactions.return_date IS NOT p.return_date
+                 OR transactions.status IS NOT p.status OR transactions.fee IS NOT p.fee)
+        ''')
+        report['transactions_updated'] = c.rowcount
+
+        report['books_fixed'] = len(reconcile.reconcile_range(c, 'books'))
+        report['students_fixed'] = len(reconcile.reconcile_range(c, 'students'))
+
+        changed = report['transactions_deleted'] + report['transactions_inserted'] + report['transactions_updated']
+        drift = [] if changed else analytics.find_aggregate_drift(conn)
+        report['aggregates_rebuilt'] = bool(changed or drift)
+        if report['aggregates_rebuilt']:
+            analytics.rebuild_aggregates(conn, commit=False)
+            drift = analytics.find_aggregate_drift(conn)
+        # Should always be 0; anything else means the aggregates and the log disagree
+        report['aggregate_drift'] = len(drift)
+
+        c.execute('DROP TABLE temp.projected_transactions')
+        if apply:
+            conn.commit()
+        else:
+            conn.rollback()
+    except Exception:
+        conn.rollback()
+        raise
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Circulation event log tools")
+    parser.add_argument('command', choices=['verify', 'rebuild', 'snapshot'])
+    parser.add_argument('--branch', help="branch to process (default: all branches)")
+    parser.add_argument('--full', action='store_true', help="replay the whole log instead of starting from the snapshot")
+    args = parser.parse_args()
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    for branch in branches:
+        storage.init_db(branch)
+        conn = storage.connect(branch)
+        try:
+            if args.command == 'snapshot':
+                print(f"[{branch}] snapshot taken at event {take_snapshot(conn)}")
+                continue
+            report = rebuild(conn, apply=args.command == 'rebuild', use_snapshot=not args.full)
+            if args.command == 'rebuild':
+                maybe_snapshot(conn)
+            print(f"[{branch}] " + ", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                                            for key, value in report.items()))
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    main()
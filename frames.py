@@ -0,0 +1,86 @@
+import pandas as pd
+
+# Rows converted per chunk, so only one chunk is ever held as Python objects
+CHUNK_ROWS = 10000
+
+# Repeated labels become categoricals, timestamps datetime64 and money stays a
+# number; formatting for display happens in the view, not in the frame
+CATEGORY_COLUMNS = ('status', 'category', 'standing', 'patron_type', 'author', 'book_title', 'student_name')
+DATE_COLUMNS = ('issue_date', 'due_date', 'return_date', 'oldest_due')
+FLOAT_COLUMNS = ('fee', 'total_due_fee')
+INTEGER_COLUMNS = ('books_issued', 'active_issues', 'overdue_books')
+
+def compact(frame):
+    for column in frame.columns:
+        if column in CATEGORY_COLUMNS:
+            frame[column] = frame[column].astype('category')
+        elif column in DATE_COLUMNS:
+            frame[column] = pd.to_datetime(frame[column], format='ISO8601', errors='coerce')
+        elif column in FLOAT_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').fillna(0.0)
+        elif column in INTEGER_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column].fillna(0), downcast='integer')
+    return frame
+
+def concat(chunks):
+    # Categoricals only survive pd.concat when every chunk has the same categories
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            categories = pd.Index(sorted(set().union(*(chunk[column].cat.categories for chunk in chunks))))
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(categories)
+    frame = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    frame.attrs['object_bytes'] = sum(chunk.attrs.get('object_bytes', 0) for chunk in chunks)
+    return frame
+
+def _load(batches, columns):
+    chunks = []
+    sample = None
+    for rows in batches:
+        chunk = pd.DataFrame.from_records(rows, columns=columns)
+        if sample is None:
+            # Measuring object columns is slow, so only the first chunk is measured
+            sample = chunk.memory_usage(deep=True).sum() / len(chunk)
+        chunk = compact(chunk)
+        chunk.attrs['object_bytes'] = int(sample * len(chunk))
+        chunks.append(chunk)
+    if not chunks:
+        return compact(pd.DataFrame(columns=columns))
+    return concat(chunks)
+
+def read_frame(cursor, chunk_rows=CHUNK_ROWS):
+    # Frame straight from an executed cursor, fetched and converted a chunk at a time
+    columns = [description[0] for description in cursor.description]
+
+    def batches():
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield [tuple(row) for row in rows]
+
+    return _load(batches(), columns)
+
+def from_rows(rows, columns, chunk_rows=CHUNK_ROWS):
+    # Same as read_frame for rows already in memory (tuples or dicts)
+    rows = list(rows)
+
+    def batches():
+        for i in range(0, len(rows), chunk_rows):
+            chunk = rows[i:i + chunk_rows]
+            if isinstance(chunk[0], dict):
+                chunk = [tuple(row[column] for column in columns) for row in chunk]
+            yield chunk
+
+    return _load(batches(), columns)
+
+def memory_report(frame):
+    # (bytes now, estimated bytes for the same rows as object columns)
+    return int(frame.memory_usage(deep=True).sum()), frame.attrs.get('object_bytes', 0)
+
+def format_memory(frame):
+    used, as_objects = memory_report(frame)
+    text = f"🧮 {used / 1024 / 1024:.2f} MB in memory"
+    if as_objects > used:
+        text += f", {1 - used / as_objects:.0%} less than about {as_objects / 1024 / 1024:.2f} MB as object columns"
+    return text
@@ -0,0 +1,298 @@
+import argparse
+import random
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import changefeed
+import storage
+
+# How often the tag set catches up from the change feed
+REFRESH_SECONDS = 0.5
+# A tag passing the antenna is read many times; alarm once per tag in this window
+ALARM_HOLD_SECONDS = 10
+# Reads kept for the latency percentiles
+LATENCY_WINDOW = 10000
+
+def init_gate(conn):
+    c = conn.cursor()
+
+    # Confirmed exit alarms, for staff follow-up
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS gate_alarms (
+            alarm_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rfid TEXT NOT NULL,
+            book_id TEXT,
+            title TEXT,
+            raised_at TIMESTAMP NOT NULL
+        )
+    ''')
+
+    # Latest loan of any tag, to name the book behind an alarm
+    c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_rfid ON transactions (rfid, issue_date)')
+
+class GateResult:
+    def __init__(self, rfid, allowed, alarm=False, book_id=None, title=None):
+        self.rfid = rfid
+        self.allowed = allowed
+        self.alarm = alarm
+        self.book_id = book_id
+        self.title = title
+
+    def as_dict(self):
+        return {'rfid': self.rfid, 'allowed': self.allowed, 'alarm': self.alarm,
+                'book_id': self.book_id, 'title': self.title}
+
+class ExitGate:
+    # Answers "is this tag on an open loan?" from memory. The tags of open loans
+    # are loaded once and then kept current from the change feed, and straight
+    # from the writer through on_write where it runs in-process. A tag that is
+    # not in memory is checked against the database before it raises an alarm,
+    # so a loan committed since the last refresh never sets the gate off.
+    def __init__(self, branch, refresh_seconds=REFRESH_SECONDS, alarm_hold=ALARM_HOLD_SECONDS, record_alarms=True):
+        self.branch = branch
+        self.record_alarms = record_alarms
+        self.refresh_seconds = refresh_seconds
+        self.alarm_hold = alarm_hold
+        self.tags = {}        # rfid -> transaction_id of its open loan
+        self.loans = {}       # transaction_id -> rfid, to drop a tag when its loan closes
+        self.seq = 0
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        self.conn = None
+        self.conn_lock = threading.Lock()
+        self.last_alarm = {}  # rfid -> when it last alarmed, for tags within the hold-off window
+        self._wake = threading.Event()  # set by apply_write to refresh before the next tick
+        self.recent_alarms = deque(maxlen=50)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {'reads': 0, 'allowed': 0, 'confirmed_late': 0, 'alarms': 0, 'repeat_alarms': 0}
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f'gate-{branch}')
+        self._thread.start()
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(storage.get_db_path(self.branch), check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def refresh(self):
+        with self.conn_lock:
+            conn = self._connection()
+            c = conn.cursor()
+            try:
+                c.execute('BEGIN')  # seq and loans from one snapshot
+                if self.refreshed_at is None or changefeed.is_behind(conn, self.seq):
+                    self._load(c)
+                else:
+                    self._apply(c)
+            finally:
+                conn.rollback()
+        self.refreshed_at = time.monotonic()
+
+    def _load(self, c):
+        seq = changefeed.get_last_seq(c.connection)
+        c.execute("SELECT transaction_id, rfid FROM transactions WHERE status = 'Issued'")
+        loans = {row['transaction_id']: row['rfid'] for row in c.fetchall()}
+        with self.lock:
+            self.loans = loans
+            self.tags = {rfid: transaction_id for transaction_id, rfid in loans.items()}
+            self.seq = seq
+
+    def _apply(self, c):
+        changes = changefeed.get_changes_since(c.connection, self.seq, table='transactions')
+        if not changes:
+            return
+        keys = list({change['row_key'] for change in changes})
+        rows = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            c.execute(f"SELECT transaction_id, rfid, status FROM transactions WHERE transaction_id IN ({', '.join('?' * len(chunk))})", chunk)
+            rows.update((row['transaction_id'], row) for row in c.fetchall())
+        with self.lock:
+            for key in keys:
+                row = rows.get(key)
+                if row is not None and row['status'] == 'Issued':
+                    self._open(key, row['rfid'])
+                else:
+                    self._close(key)
+            self.seq = max(self.seq, changes[-1]['seq'])
+
+    def _open(self, transaction_id, rfid):
+        self._close(transaction_id)
+        self.loans[transaction_id] = rfid
+        self.tags[rfid] = transaction_id
+
+    def _close(self, transaction_id):
+        rfid = self.loans.pop(transaction_id, None)
+        if rfid is not None and self.tags.get(rfid) == transaction_id:
+            del self.tags[rfid]
+
+    def apply_write(self, operation, args, result):
+        if operation == 'issue':
+            book_id, student_id, rfid = args
+            with self.lock:
+                self._open(result, rfid)
+        elif operation == 'return':
+            # The return does not name the loan it closed, so the poll thread looks
+            # it up; this runs on the writer thread and must not hold up the batch
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.refresh_seconds)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                pass  # try again on the next pass
+
+    def lookup(self, rfid, started=None):
+        # In-memory answer for an open loan, or None when the tag needs confirming
+        started = started or time.perf_counter()
+        if rfid in self.tags:
+            self._record(started, 'allowed')
+            return GateResult(rfid, True)
+        return None
+
+    def confirm(self, rfid, started=None):
+        # Tag not in memory: check the database, then alarm if it really is not issued
+        started = started or time.perf_counter()
+        with self.conn_lock:
+            conn = self._connection()
+            try:
+                c = conn.cursor()
+                c.execute("SELECT transaction_id FROM transactions WHERE rfid = ? AND status = 'Issued'", (rfid,))
+                row = c.fetchone()
+                now = time.monotonic()
+                # Repeat reads of a tag the gate has just alarmed on are refused quietly
+                repeat = row is None and now - self.last_alarm.get(rfid, -self.alarm_hold) < self.alarm_hold
+                book = None
+                if row is None and not repeat:
+                    self.last_alarm = {tag: at for tag, at in self.last_alarm.items() if now - at < self.alarm_hold}
+                    self.last_alarm[rfid] = now
+                    c.execute('''
+                        SELECT t.book_id, b.title FROM transactions t
+                        LEFT JOIN books b ON t.book_id = b.book_id
+                        WHERE t.rfid = ? ORDER BY t.issue_date DESC LIMIT 1
+                    ''', (rfid,))
+                    book = c.fetchone()
+            finally:
+                conn.rollback()
+        if row is not None:
+            with self.lock:
+                self._open(row['transaction_id'], rfid)
+            self._record(started, 'confirmed_late')
+            return GateResult(rfid, True)
+        if repeat:
+            self._record(started, 'repeat_alarms')
+            return GateResult(rfid, False)
+
+        result = GateResult(rfid, False, True, book['book_id'] if book else None, book['title'] if book else None)
+        self._raise(result)
+        self._record(started, 'alarms')
+        return result
+
+    def check(self, rfid):
+        started = time.perf_counter()
+        return self.lookup(rfid, started) or self.confirm(rfid, started)
+
+    def _raise(self, result):
+        self.recent_alarms.append((datetime.now(), result))
+        if not self.record_alarms:
+            return
+        conn = storage.connect(self.branch)
+        try:
+            conn.execute('INSERT INTO gate_alarms (rfid, book_id, title, raised_at) VALUES (?, ?, ?, ?)',
+                         (result.rfid, result.book_id, result.title, datetime.now()))
+            conn.commit()
+        except sqlite3.Error:
+            pass  # the alarm still sounds; only its record is lost
+        finally:
+            conn.close()
+
+    def _record(self, started, outcome):
+        self.latencies.append(time.perf_counter() - started)
+        self.counts['reads'] += 1
+        self.counts[outcome] += 1
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1e6 if latencies else None
+
+        return dict(self.counts, open_tags=len(self.tags), seq=self.seq,
+                    refreshed_ago=time.monotonic() - self.refreshed_at if self.refreshed_at else None,
+                    p50_us=pct(50), p95_us=pct(95), p99_us=pct(99),
+                    max_us=latencies[-1] * 1e6 if latencies else None)
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+def get_gate(branch=None):
+    branch = branch or storage.get_branch_names()[0]
+    with _gates_lock:
+        if branch not in _gates:
+            _gates[branch] = ExitGate(branch)
+        return _gates[branch]
+
+def on_write(branch, operation, args, result):
+    # Writer listener, so gates see this process's own issues and returns at once
+    exit_gate = _gates.get(branch)
+    if exit_gate is not None:
+        exit_gate.apply_write(operation, args, result)
+
+def format_stats(stats):
+    if stats['p50_us'] is None:
+        return f"{stats['open_tags']} open tags, no reads yet"
+    return (f"{stats['reads']} reads: {stats['allowed']} allowed, {stats['confirmed_late']} confirmed late, "
+            f"{stats['alarms']} alarms ({stats['repeat_alarms']} repeats held back); "
+            f"p50 {stats['p50_us']:.1f} us, p95 {stats['p95_us']:.1f} us, p99 {stats['p99_us']:.1f} us, "
+            f"max {stats['max_us']:.1f} us; {stats['open_tags']} open tags")
+
+def bench(gate, reads, miss_share, seed=42):
+    # Replays reads of open-loan tags mixed with tags that are not on loan
+    rng = random.Random(seed)
+    issued = list(gate.tags)
+    if not issued:
+        raise ValueError("no open loans to read")
+    start = time.perf_counter()
+    for i in range(reads):
+        gate.check(f"UNISSUED{rng.randrange(1000)}" if rng.random() < miss_share else rng.choice(issued))
+    return reads / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Exit-gate check: reads tags from stdin, one per line, and reports alarms")
+    parser.add_argument('--branch', help="branch the gate belongs to (default: the first branch)")
+    parser.add_argument('--bench', type=int, metavar='READS', help="replay this many simulated reads instead of reading stdin")
+    parser.add_argument('--miss-share', type=float, default=0.01, help="share of simulated reads of tags not on loan")
+    args = parser.parse_args()
+
+    storage.init_db(args.branch)
+    if args.bench:
+        # Simulated alarms stay out of gate_alarms
+        exit_gate = ExitGate(args.branch or storage.get_branch_names()[0], record_alarms=False)
+        rate = bench(exit_gate, args.bench, args.miss_share)
+        print(f"{rate:,.0f} reads/s")
+        print(format_stats(exit_gate.stats()))
+        return
+
+    exit_gate = get_gate(args.branch)
+    try:
+        for line in sys.stdin:
+            rfid = line.strip()
+            if not rfid:
+                continue
+            result = exit_gate.check(rfid)
+            if result.alarm:
+                print(f"ALARM {rfid} {result.book_id or ''} {result.title or ''}".rstrip(), flush=True)
+    except KeyboardInterrupt:
+        pass
+    print(format_stats(exit_gate.stats()), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+
+# Open Library editions dump: either the official tab-separated export (JSON in the
+# last column) or plain JSON lines. It is never loaded; lookups read single lines.
+DUMP_FILE = os.environ.get('LIBRARY_ISBN_DUMP', 'ol_dump_editions.txt')
+INDEX_FILE = os.environ.get('LIBRARY_ISBN_INDEX', 'isbn.idx')
+
+MAGIC = b'ISBNIDX1'
+HEADER = struct.Struct('>8sQQQ')   # magic, record count, dump size, dump mtime (ns)
+RECORD = struct.Struct('>13sQI')   # ISBN-13, line offset, line length; big-endian sorts bytewise
+RUN_RECORDS = 1_000_000            # records sorted in memory per run while building
+
+# First matching keyword in an edition's subjects picks the category
+CATEGORY_KEYWORDS = [
+    ('biography', 'Biography'),
+    ('history', 'History'),
+    ('computer', 'Technology'),
+    ('programming', 'Technology'),
+    ('technology', 'Technology'),
+    ('engineering', 'Technology'),
+    ('science', 'Science'),
+    ('mathematics', 'Science'),
+    ('fiction', 'Fiction'),
+    ('novel', 'Fiction'),
+]
+
+ISBN_FIELDS = re.compile(rb'"isbn_1[03]"\s*:\s*\[([^\]]*)\]')
+QUOTED = re.compile(rb'"([^"]*)"')
+
+_index = None
+_index_lock = threading.Lock()
+
+def normalize_isbn(text):
+    # ISBN-10 or ISBN-13 in any punctuation -> 13-digit string, or None
+    digits = re.sub(r'[^0-9Xx]', '', text or '').upper()
+    if len(digits) == 13 and digits.isdigit():
+        return digits
+    if len(digits) == 10 and digits[:9].isdigit():
+        body = '978' + digits[:9]
+        total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(body))
+        return body + str((10 - total % 10) % 10)
+    return None
+
+def parse_line(line):
+    line = line.rstrip(b'\r\n')
+    if not line.startswith(b'{'):
+        line = line.rsplit(b'\t', 1)[-1]
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def line_isbns(line):
+    # Pull the ISBNs out without parsing the whole record; most of the build time
+    # would otherwise go to json.loads on fields we never use
+    found = set()
+    for field in ISBN_FIELDS.findall(line):
+        for value in QUOTED.findall(field):
+            isbn = normalize_isbn(value.decode('ascii', 'ignore'))
+            if isbn:
+                found.add(isbn)
+    return found
+
+def _write_run(records, directory):
+    records.sort()
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(b''.join(records))
+    return path
+
+def _read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            if not chunk:
+                return
+            for i in range(0, len(chunk), RECORD.size):
+                yield chunk[i:i + RECORD.size]
+
+def build(dump=DUMP_FILE, index=INDEX_FILE, run_records=RUN_RECORDS):
+    # External sort: sorted runs of packed records go to temp files and are merged
+    # into the index, so memory stays bounded however large the dump is
+    start = time.perf_counter()
+    stat = os.stat(dump)
+    directory = os.path.dirname(os.path.abspath(index))
+    lines = 0
+    count = 0
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        runs = []
+        records = []
+        offset = 0
+        with open(dump, 'rb') as f:
+            for line in f:
+                lines += 1
+                for isbn in line_isbns(line):
+                    records.append(RECORD.pack(isbn.encode('ascii'), offset, len(line)))
+                offset += len(line)
+                if len(records) >= run_records:
+                    runs.append(_write_run(records, tmp))
+                    records = []
+        records.sort()
+
+        partial = index + '.tmp'
+        with open(partial, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, 0, 0, 0))
+            previous = None
+            for record in heapq.merge(records, *[_read_run(path) for path in runs]):
+                isbn = record[:13]
+                if isbn == previous:
+                    continue  # keep the first edition listing an ISBN
+                previous = isbn
+                out.write(record)
+                count += 1
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, count, stat.st_size, stat.st_mtime_ns))
+        os.replace(partial, index)
+    return {'lines': lines, 'isbns': count, 'seconds': time.perf_counter() - start}
+
+class IsbnIndex:
+    # Memory-mapped view of the index and the dump. Nothing is loaded up front;
+    # a lookup touches ~log2(n) index pages and one line of the dump.
+    def __init__(self, index=INDEX_FILE, dump=DUMP_FILE):
+        self.path = index
+        self.mtime = os.stat(index).st_mtime_ns
+        with open(index, 'rb') as f:
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, dump_size, dump_mtime = HEADER.unpack_from(self.index, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{index} is not an ISBN index")
+        stat = os.stat(dump)
+        if (stat.st_size, stat.st_mtime_ns) != (dump_size, dump_mtime):
+            raise ValueError(f"{index} was built from a different {dump}; rebuild it")
+        with open(dump, 'rb') as f:
+            self.dump = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def find(self, isbn):
+        # Binary search for the dump line of a normalized ISBN-13
+        key = isbn.encode('ascii')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = HEADER.size + middle * RECORD.size
+            if self.index[position:position + 13] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            position = HEADER.size + low * RECORD.size
+            found, offset, length = RECORD.unpack_from(self.index, position)
+            if found == key:
+                return offset, length
+        return None
+
+    def lookup(self, isbn):
+        # Returns {'isbn', 'title', 'author', 'category'} (values may be None) or None
+        isbn = normalize_isbn(isbn)
+        location = self.find(isbn) if isbn else None
+        if location is None:
+            return None
+        offset, length = location
+        record = parse_line(self.dump[offset:offset + length])
+        return metadata(record, isbn) if record else None
+
+    def close(self):
+        self.index.close()
+        self.dump.close()
+
+def metadata(record, isbn):
+    title = record.get('title')
+    if title and record.get('subtitle'):
+        title = f"{title}: {record['subtitle']}"
+
+    # Edition records usually reference authors by key only; use names when the
+    # dump carries them, otherwise the edition's own "by" statement
+    names = [a.get('name') for a in record.get('authors') or [] if isinstance(a, dict) and a.get('name')]
+    by_statement = re.sub(r'^by\s+', '', (record.get('by_statement') or '').strip(), flags=re.IGNORECASE)
+    author = ', '.join(names) or by_statement.rstrip('.') or None
+
+    category = None
+    subjects = ' '.join(s for s in record.get('subjects') or [] if isinstance(s, str)).lower()
+    for keyword, name in CATEGORY_KEYWORDS:
+        if keyword in subjects:
+            category = name
+            break
+    return {'isbn': isbn, 'title': title, 'author': author, 'category': category}
+
+def get_index():
+    # Shared index, reopened when the file is rebuilt; None when no index is installed
+    global _index
+    with _index_lock:
+        try:
+            mtime = os.stat(INDEX_FILE).st_mtime_ns
+        except OSError:
+            return None
+        if _index is None or _index.mtime != mtime:
+            try:
+                _index = IsbnIndex()
+            except (OSError, ValueError):
+                _index = None
+        return _index
+
+def lookup(isbn):
+    index = get_index()
+    return index.lookup(isbn) if index else None
+
+def enrich(title, author, isbn, category):
+    # Fill blank fields from the dump; anything the user typed wins
+    found = lookup(isbn) if isbn and not (title and author and category) else None
+    if found:
+        title = title or found['title']
+        author = author or found['author']
+        category = category or found['category']
+    return title, author, isbn, category
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ISBN metadata index")
+    parser.add_argument('command', choices=['build', 'lookup'])
+    parser.add_argument('isbns', nargs='*', help="ISBNs to look up")
+    parser.add_argument('--dump', default=DUMP_FILE)
+    parser.add_argument('--index', default=INDEX_FILE)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        report = build(args.dump, args.index)
+        print(f"indexed {report['isbns']} ISBNs from {report['lines']} records in {report['seconds']:.1f}s")
+        return
+
+    index = IsbnIndex(args.index, args.dump)
+    for isbn in args.isbns:
+        start = time.perf_counter()
+        found = index.lookup(isbn)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        print(f"{isbn}: {json.dumps(found)} ({elapsed_us:.0f} us)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import streamlit as st
+from pathlib import Path
+import storage
+import writer
+
+# Self-checkout kiosk: scan patron card, scan books, confirm. It renders none of the
+# dashboard and does not import pandas; each step costs only its own reads and the
+# issue writes. Run with: streamlit run kiosk_app.py  (add ?branch=North for a branch)
+
+st.set_page_config(page_title="Self Checkout", page_icon="📚", layout="centered")
+
+@st.cache_resource
+def bootstrap():
+    for branch in storage.get_branch_names():
+        storage.init_db(branch)
+    return (Path(__file__).parent / 'style.css').read_text()
+
+def get_branch():
+    branch = st.query_params.get('branch')
+    return branch if branch in storage.get_branch_names() else storage.get_branch_names()[0]
+
+def query_patron(student_id):
+    conn = storage.connect(get_branch())
+    try:
+        c = conn.cursor()
+        c.execute('''
+            SELECT s.student_id, s.name, ps.books_issued, ps.max_loans, ps.block_after_days, ps.standing
+            FROM students s
+            JOIN patron_standing ps ON ps.student_id = s.student_id
+            WHERE s.student_id = ?
+        ''', (student_id,))
+        return c.fetchone()
+    finally:
+        conn.close()
+
+def query_book(book_id):
+    conn = storage.connect(get_branch())
+    try:
+        c = conn.cursor()
+        c.execute('SELECT book_id, title, author, status FROM books WHERE book_id = ?', (book_id,))
+        return c.fetchone()
+    finally:
+        conn.close()
+
+def reset():
+    for key in ('kiosk_patron', 'kiosk_basket', 'kiosk_results'):
+        st.session_state.pop(key, None)
+
+def render_scan_patron():
+    st.markdown("### 1. Scan your library card")
+    with st.form("kiosk_patron_form", clear_on_submit=True):
+        student_id = st.text_input("Library card", placeholder="Scan or type your student ID")
+        if st.form_submit_button("Continue"):
+            patron = query_patron(student_id.strip())
+            if not patron:
+                st.error("Student not found!")
+            elif patron['standing'] == 'Blocked':
+                st.error(f"You have a book more than {patron['block_after_days']} days overdue. Please see the desk.")
+            elif patron['books_issued'] >= patron['max_loans']:
+                st.error("You have reached the maximum book limit!")
+            else:
+                st.session_state.kiosk_patron = dict(patron)
+                st.session_state.kiosk_basket = []
+                st.rerun()
+
+def render_scan_books(patron):
+    basket = st.session_state.kiosk_basket
+    allowance = patron['max_loans'] - patron['books_issued']
+    st.markdown(f"### 2. Scan your books, {patron['name']}")
+    if patron['standing'] == 'Warning':
+        st.warning("You have an overdue book. Please return it soon.")
+
+    if len(basket) < allowance:
+        with st.form("kiosk_book_form", clear_on_submit=True):
+            book_id = st.text_input("Book barcode")
+            rfid = st.text_input("RFID tag")
+            if st.form_submit_button("Add book"):
+                book = query_book(book_id.strip()) if book_id.strip() and rfid.strip() else None
+                if not book_id.strip() or not rfid.strip():
+                    st.error("Scan both the barcode and the tag")
+                elif not book:
+                    st.error("Book not found!")
+                elif book['status'] == 'Issued':
+                    st.error("Book is already issued!")
+                elif any(item['book_id'] == book['book_id'] for item in basket):
+                    st.error("That book is already in your basket")
+                else:
+                    basket.append({'book_id': book['book_id'], 'title': book['title'], 'rfid': rfid.strip()})
+
+    for i, item in enumerate(basket):
+        col1, col2 = st.columns([4, 1])
+        col1.markdown(f"📖 **{item['title']}** ({item['book_id']})")
+        if col2.button("Remove", key=f"kiosk_remove_{i}"):
+            basket.pop(i)
+            st.rerun()
+    st.caption(f"You can borrow {allowance - len(basket)} more")
+
+    col1, col2 = st.columns(2)
+    if col1.button(f"3. Borrow {len(basket)} book(s)", disabled=not basket, type="primary", use_container_width=True):
+        st.session_state.kiosk_results = confirm(patron, basket)
+        st.rerun()
+    if col2.button("Cancel", use_container_width=True):
+        reset()
+        st.rerun()
+
+def confirm(patron, basket):
+    # Queue every issue before waiting, so the writer commits them together
+    branch = get_branch()
+    pending = [(item, writer.submit(branch, 'issue', item['book_id'], patron['student_id'], item['rfid'])) for item in basket]
+    results = []
+    for item, future in pending:
+        try:
+            future.result(timeout=30)
+            results.append((item, None))
+        except Exception as e:
+            results.append((item, str(e)))
+    return results
+
+def render_results(results):
+    st.markdown("### Done")
+    for item, error in results:
+        if error:
+            st.error(f"{item['title']}: {error}")
+        else:
+            st.success(f"✅ {item['title']}")
+    if st.button("Finish", type="primary", use_container_width=True):
+        reset()
+        st.rerun()
+
+def main():
+    st.markdown(f"<style>{bootstrap()}</style>", unsafe_allow_html=True)
+    st.title("📚 Self Checkout")
+
+    if 'kiosk_results' in st.session_state:
+        render_results(st.session_state.kiosk_results)
+    elif 'kiosk_patron' in st.session_state:
+        render_scan_books(st.session_state.kiosk_patron)
+    else:
+        render_scan_patron()
+
+if __name__ == "__main__":
+    main()
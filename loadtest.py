@@ -0,0 +1,264 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import circulation
+import queries
+
+OPERATIONS = ('issue', 'return', 'search', 'dashboard')
+DEFAULT_MIX = 'issue=30,return=25,search=30,dashboard=15'
+SEARCH_TERMS = ["smith", "book 1", "doe", "wilson", "science", "book 42", "taylor", "history"]
+
+# What the issue and return timings measure. Desks are separate processes, so
+# they cannot share the app's in-process writer thread (writer.py) and its group
+# commit; each write is its own BEGIN IMMEDIATE transaction and fsync instead.
+WRITE_PATH = "one BEGIN IMMEDIATE transaction per write per desk process (no writer-thread group commit)"
+
+# A run is past the breaking point once either limit is crossed
+BUSY_RATE_LIMIT = 0.01      # share of operations failing with SQLITE_BUSY
+WRITE_P95_LIMIT_MS = 500    # p95 latency of issue and return
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        op, weight = part.split('=')
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation in mix: {op}")
+        mix[op] = float(weight)
+    return mix
+
+def is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+def _write(conn, operation, *args):
+    # One desk write in its own transaction (see WRITE_PATH)
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        result = operation(c, *args)
+        c.execute('COMMIT')
+        return result
+    except BaseException:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        raise
+
+def run_desk(desk, desks, db_path, duration, mix, seed, timeout, ready, start, results):
+    # One circulation desk: its own process and connection. Each desk handles its
+    # own shelf of books (book index % desks), the way separate counters would.
+    rng = random.Random(seed * 1000 + desk)
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute('SELECT book_id, status FROM books ORDER BY book_id')
+    shelf = [(row[0], row[1]) for i, row in enumerate(c.fetchall()) if i % desks == desk]
+    available = [book_id for book_id, status in shelf if status == 'Available']
+    mine = {book_id for book_id, status in shelf}
+    c.execute("SELECT book_id, student_id FROM transactions WHERE status = 'Issued'")
+    open_loans = [(row[0], row[1]) for row in c.fetchall() if row[0] in mine]
+    c.execute('SELECT student_id FROM students')
+    students = [row[0] for row in c.fetchall()]
+
+    operations = list(mix)
+    weights = [mix[op] for op in operations]
+    stats = {op: {'latencies': [], 'ok': 0, 'rejected': 0, 'busy': 0, 'errors': 0} for op in OPERATIONS}
+
+    ready.put(desk)
+    start.wait()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        op = rng.choices(operations, weights)[0]
+        if op == 'issue' and not available:
+            op = 'return'
+        elif op == 'return' and not open_loans:
+            op = 'issue'
+
+        began = time.perf_counter()
+        try:
+            if op == 'issue':
+                book_id = available[rng.randrange(len(available))]
+                student_id = rng.choice(students)
+                _write(conn, circulation.issue_book, book_id, student_id, f"RFID-{desk}-{book_id}")
+                available.remove(book_id)
+                open_loans.append((book_id, student_id))
+            elif op == 'return':
+                book_id, student_id = open_loans.pop(rng.randrange(len(open_loans)))
+                try:
+                    _write(conn, circulation.return_book, book_id, student_id)
+                    available.append(book_id)
+                except Exception:
+                    open_loans.append((book_id, student_id))
+                    raise
+            elif op == 'search':
+                queries.query_search(conn, rng.choice(["Books", "Books", "Students"]), rng.choice(SEARCH_TERMS))
+            else:
+                queries.query_metrics(conn)
+                queries.query_stats(conn)
+            outcome = 'ok'
+        except circulation.CirculationError:
+            outcome = 'rejected'  # a rule said no (e.g. Blocked patron); not a failure
+        except sqlite3.OperationalError as e:
+            outcome = 'busy' if is_busy(e) else 'errors'
+        except Exception:
+            outcome = 'errors'
+        stats[op]['latencies'].append(time.perf_counter() - began)
+        stats[op][outcome] += 1
+
+    conn.close()
+    results.put(stats)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run_level(template, desks, duration, mix, seed, timeout):
+    # Run `desks` desk processes against a fresh copy of the seeded database
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    db_path = os.path.join(workdir, 'library.db')
+    shutil.copyfile(template, db_path)
+
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    results = ctx.Queue()
+    start = ctx.Event()
+    processes = [ctx.Process(target=run_desk, args=(desk, desks, db_path, duration, mix, seed, timeout, ready, start, results))
+                 for desk in range(desks)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get()
+    began = time.perf_counter()
+    start.set()
+    desk_stats = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - began
+    for process in processes:
+        process.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    level = {'desks': desks, 'seconds': elapsed, 'operations': {}}
+    total = busy = errors = 0
+    for op in OPERATIONS:
+        merged = {'latencies': [], 'ok': 0, 'rejected': 0, 'busy': 0, 'errors': 0}
+        for stats in desk_stats:
+            for key in ('ok', 'rejected', 'busy', 'errors'):
+                merged[key] += stats[op][key]
+            merged['latencies'].extend(stats[op]['latencies'])
+        count = len(merged['latencies'])
+        if not count:
+            continue
+        total += count
+        busy += merged['busy']
+        errors += merged['errors']
+        level['operations'][op] = {
+            'count': count,
+            'ok': merged['ok'],
+            'rejected': merged['rejected'],
+            'busy': merged['busy'],
+            'errors': merged['errors'],
+            'p50_ms': percentile(merged['latencies'], 50) * 1000,
+            'p95_ms': percentile(merged['latencies'], 95) * 1000,
+            'p99_ms': percentile(merged['latencies'], 99) * 1000,
+        }
+    level['throughput'] = total / elapsed
+    level['busy_rate'] = busy / total if total else 0.0
+    level['error_rate'] = errors / total if total else 0.0
+    write_p95 = [level['operations'][op]['p95_ms'] for op in ('issue', 'return') if op in level['operations']]
+    level['write_p95_ms'] = max(write_p95) if write_p95 else 0.0
+    level['broken'] = level['busy_rate'] > BUSY_RATE_LIMIT or level['write_p95_ms'] > WRITE_P95_LIMIT_MS
+    return level
+
+def format_report(report):
+    lines = [
+        f"Load test {report['started']}: {report['books']} books, {report['students']} students, "
+        f"{report['transactions']} transactions, seed {report['seed']}, {report['duration']}s per level, "
+        f"busy timeout {report['timeout']}s, journal {report['journal_mode']}",
+        f"Mix: {report['mix']}",
+        f"Writes: {report['write_path']}",
+        "",
+    ]
+    for level in report['levels']:
+        lines.append(f"{level['desks']:>3} desks: {level['throughput']:8.1f} ops/s  "
+                     f"busy {level['busy_rate']:6.2%}  errors {level['error_rate']:6.2%}"
+                     f"{'  <- over limits' if level['broken'] else ''}")
+        for op, stats in level['operations'].items():
+            lines.append(f"      {op:<9} n={stats['count']:<6} p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms  "
+                         f"p99 {stats['p99_ms']:7.1f} ms  busy {stats['busy']}  errors {stats['errors']}  rejected {stats['rejected']}")
+    lines.append("")
+    peak = max(report['levels'], key=lambda level: level['throughput'])
+    lines.append(f"Peak throughput: {peak['throughput']:.1f} ops/s at {peak['desks']} desks")
+    breaking = report['breaking_point']
+    if breaking:
+        lines.append(f"Breaking point: {breaking} desks (busy rate > {BUSY_RATE_LIMIT:.0%} or write p95 > {WRITE_P95_LIMIT_MS} ms)")
+    else:
+        lines.append(f"No breaking point up to {report['levels'][-1]['desks']} desks")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent circulation desk load test")
+    parser.add_argument('--desks', default='1,2,4,8,16', help="comma-separated desk counts to run, in order")
+    parser.add_argument('--duration', type=float, default=10, help="seconds per desk count")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="operation weights, e.g. issue=30,return=25,search=30,dashboard=15")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--transactions', type=int, default=50000)
+    parser.add_argument('--timeout', type=float, default=5.0, help="SQLite busy timeout per connection, as the app uses")
+    parser.add_argument('--journal-mode', help="set this journal mode on the test database (e.g. WAL)")
+    parser.add_argument('--stop-at-break', action='store_true', help="stop after the first desk count over the limits")
+    parser.add_argument('--output', help="also write the report as JSON to this file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    # Seed a template database once with seed.py; every desk count starts from a copy of it
+    workdir = tempfile.mkdtemp(prefix='loadtest-seed-')
+    template = os.path.join(workdir, 'library.db')
+    branches_file = os.path.join(workdir, 'branches.json')
+    with open(branches_file, 'w') as f:
+        json.dump({'Load test': template}, f)
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seed.py'),
+                    '--seed', str(args.seed), '--books', str(args.books), '--students', str(args.students),
+                    '--transactions', str(args.transactions)],
+                   env=dict(os.environ, LIBRARY_BRANCHES=branches_file), check=True)
+    conn = sqlite3.connect(template)
+    journal_mode = conn.execute(f'PRAGMA journal_mode = {args.journal_mode}' if args.journal_mode else 'PRAGMA journal_mode').fetchone()[0]
+    conn.close()
+
+    report = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'books': args.books, 'students': args.students, 'transactions': args.transactions,
+        'seed': args.seed, 'duration': args.duration, 'timeout': args.timeout,
+        'journal_mode': journal_mode, 'mix': args.mix, 'write_path': WRITE_PATH, 'levels': [], 'breaking_point': None,
+    }
+    try:
+        for desks in (int(n) for n in args.desks.split(',')):
+            level = run_level(template, desks, args.duration, mix, args.seed, args.timeout)
+            report['levels'].append(level)
+            print(f"{desks} desks: {level['throughput']:.1f} ops/s, busy {level['busy_rate']:.2%}, "
+                  f"write p95 {level['write_p95_ms']:.1f} ms", flush=True)
+            if level['broken'] and report['breaking_point'] is None:
+                report['breaking_point'] = desks
+                if args.stop_at_break:
+                    break
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import changefeed
+import events
+import replica
+import storage
+
+# Job intervals in seconds; the scheduler runs each job once its interval has passed
+ANALYZE_EVERY = 3600
+VACUUM_EVERY = 600
+INTEGRITY_EVERY = 24 * 3600
+BACKUP_EVERY = int(os.environ.get('LIBRARY_BACKUP_EVERY', 6 * 3600))
+SNAPSHOT_EVERY = 600
+PRUNE_CHANGES_EVERY = 3600
+OPTIMIZE_EVERY = 3600          # the writer's own connection, see writer.py
+
+# A table is re-analyzed once its row count is off from the stats by this factor
+ANALYZE_DRIFT = 2.0
+ANALYSIS_LIMIT = 1000          # rows sampled per index, keeps ANALYZE quick on big tables
+
+# Free pages are reclaimed once they pass both of these, VACUUM_STEP_PAGES at a time
+VACUUM_FREE_SHARE = 0.10
+VACUUM_MIN_FREE_PAGES = 1000
+VACUUM_STEP_PAGES = 2000
+
+BACKUP_DIR = Path(os.environ.get('LIBRARY_BACKUP_DIR', 'backups'))
+BACKUP_KEEP = 7                # newest backups kept per branch
+
+AUTO_VACUUM_MODES = {0: 'NONE', 1: 'FULL', 2: 'INCREMENTAL'}
+
+_lock = threading.Lock()
+_running = set()
+_scheduler = None
+
+def init_maintenance(conn):
+    c = conn.cursor()
+
+    # Last run of each job, for the scheduler and the health panel
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            job TEXT PRIMARY KEY,
+            last_run_at TIMESTAMP NOT NULL,
+            duration REAL NOT NULL,
+            ok INTEGER NOT NULL,
+            result TEXT
+        )
+    ''')
+
+def optimize(conn):
+    # Lets SQLite re-analyze whatever this connection's queries have shown to need
+    # it; only worthwhile on a long-lived connection that has run those queries
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    conn.execute('PRAGMA optimize')
+
+def stale_tables(conn):
+    # Tables with no stats yet, or whose row count has drifted from the stats
+    c = conn.cursor()
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    tables = [row[0] for row in c.fetchall()]
+    analyzed = {}
+    c.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    if c.fetchone():
+        c.execute('SELECT tbl, stat FROM sqlite_stat1')
+        for table, stat in c.fetchall():
+            rows = int(stat.split()[0]) if stat else 0
+            analyzed[table] = max(rows, analyzed.get(table, 0))
+    stale = []
+    for table in tables:
+        c.execute(f'SELECT COUNT(*) FROM "{table}"')
+        rows = c.fetchone()[0]
+        if table not in analyzed:
+            if rows:
+                stale.append(table)
+        elif abs(rows - analyzed[table]) > 100 and not analyzed[table] / ANALYZE_DRIFT <= rows <= analyzed[table] * ANALYZE_DRIFT:
+            stale.append(table)
+    return stale
+
+def analyze(branch):
+    conn = storage.connect(branch)
+    try:
+        tables = stale_tables(conn)
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        for table in tables:
+            conn.execute(f'ANALYZE "{table}"')
+        conn.commit()
+    finally:
+        conn.close()
+    return f"analyzed {', '.join(tables)}" if tables else "stats up to date"
+
+def get_health(conn):
+    c = conn.cursor()
+    health = {}
+    for pragma in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum', 'journal_mode'):
+        c.execute(f'PRAGMA {pragma}')
+        health[pragma] = c.fetchone()[0]
+    health['auto_vacuum'] = AUTO_VACUUM_MODES.get(health['auto_vacuum'], health['auto_vacuum'])
+    return health
+
+def incremental_vacuum(branch):
+    # Hands free pages back to the filesystem a step at a time, committing between
+    # steps so circulation writes get in. Needs auto_vacuum = INCREMENTAL; older
+    # files are converted once with --enable-incremental-vacuum.
+    conn = storage.connect(branch)
+    conn.isolation_level = None
+    try:
+        health = get_health(conn)
+        free = health['freelist_count']
+        if free < max(VACUUM_MIN_FREE_PAGES, health['page_count'] * VACUUM_FREE_SHARE):
+            return f"{free} free pages, under the threshold"
+        if health['auto_vacuum'] != 'INCREMENTAL':
+            return f"{free} free pages but auto_vacuum is {health['auto_vacuum']}; run maintenance.py --enable-incremental-vacuum"
+        c = conn.cursor()
+        while free:
+            # sqlite3 steps a statement without result columns only once, and one
+            # step of incremental_vacuum frees one page, so a step is a transaction
+            # of single-page calls
+            c.execute('BEGIN IMMEDIATE')
+            for _ in range(min(free, VACUUM_STEP_PAGES)):
+                c.execute('PRAGMA incremental_vacuum(1)')
+            c.execute('COMMIT')
+            remaining = get_health(conn)['freelist_count']
+            if remaining >= free:
+                break
+            free = remaining
+            time.sleep(0.01)
+        return f"reclaimed {health['freelist_count'] - free} pages"
+    finally:
+        conn.close()
+
+def enable_incremental_vacuum(branch):
+    # One full VACUUM to switch an existing file over; writers wait while it runs
+    conn = storage.connect(branch)
+    conn.isolation_level = None
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return get_health(conn)['auto_vacuum']
+    finally:
+        conn.close()
+
+def integrity_check(branch):
+    # Runs on the replica, a page-for-page copy of the primary, so the long read
+    # never holds up circulation writes
+    replica.refresh(branch)
+    conn = replica.connect(branch)
+    try:
+        c = conn.cursor()
+        c.execute('PRAGMA integrity_check(20)')
+        problems = [row[0] for row in c.fetchall()]
+    finally:
+        conn.close()
+    if problems != ['ok']:
+        raise sqlite3.DatabaseError('; '.join(problems))
+    return "ok"
+
+def get_backup_dir(branch=None):
+    return BACKUP_DIR / Path(storage.get_db_path(branch)).stem
+
+def list_backups(branch=None):
+    backup_dir = get_backup_dir(branch)
+    return sorted(backup_dir.glob('*.db')) if backup_dir.exists() else []
+
+def backup(branch):
+    # Hot backup through the online backup API, copied in steps so writers can get
+    # in between them. Written under a temporary name and renamed once checked.
+    backup_dir = get_backup_dir(branch)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+    path = backup_dir / f"{datetime.now():%Y%m%d-%H%M%S}.db"
+    partial = path.with_suffix('.db.tmp')
+    source = sqlite3.connect(storage.get_db_path(branch))
+    target = sqlite3.connect(partial)
+    try:
+        source.backup(target, pages=replica.BACKUP_STEP_PAGES, sleep=0.001)
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    if check != 'ok':
+        partial.unlink()
+        raise sqlite3.DatabaseError(f"backup failed quick_check: {check}")
+    os.replace(partial, path)
+    for old in list_backups(branch)[:-BACKUP_KEEP]:
+        old.unlink()
+    return f"{path} ({path.stat().st_size / 1024 / 1024:.1f} MB)"
+
+def snapshot(branch):
+    conn = storage.connect(branch)
+    try:
+        seq = events.maybe_snapshot(conn)
+    finally:
+        conn.close()
+    return f"snapshot at event {seq}" if seq is not None else "snapshot current"
+
+def prune_changes(branch):
+    conn = storage.connect(branch)
+    try:
+        return f"pruned {changefeed.prune(conn)} changes"
+    finally:
+        conn.close()
+
+JOBS = {
+    'analyze': (analyze, ANALYZE_EVERY),
+    'vacuum': (incremental_vacuum, VACUUM_EVERY),
+    'integrity': (integrity_check, INTEGRITY_EVERY),
+    'backup': (backup, BACKUP_EVERY),
+    'snapshot': (snapshot, SNAPSHOT_EVERY),
+    'prune_changes': (prune_changes, PRUNE_CHANGES_EVERY),
+}
+
+def record_run(branch, job, started_at, duration, ok, result):
+    conn = storage.connect(branch)
+    try:
+        conn.execute('''
+            INSERT INTO maintenance_runs (job, last_run_at, duration, ok, result) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (job) DO UPDATE SET last_run_at = excluded.last_run_at, duration = excluded.duration,
+                ok = excluded.ok, result = excluded.result
+        ''', (job, started_at, duration, int(ok), result))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_runs(conn):
+    c = conn.cursor()
+    c.execute('SELECT job, last_run_at, duration, ok, result FROM maintenance_runs ORDER BY job')
+    return c.fetchall()
+
+def run_job(branch, job):
+    # Runs one job and records how it went; returns (ok, result)
+    with _lock:
+        if (branch, job) in _running:
+            return False, "already running"
+        _running.add((branch, job))
+    try:
+        started_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            ok, result = True, JOBS[job][0](branch)
+        except (sqlite3.Error, OSError) as e:
+            ok, result = False, str(e)
+        except Exception as e:
+            # Recorded like any other failure; a bug in one job must not stop the scheduler
+            ok, result = False, f"{type(e).__name__}: {e}"
+        record_run(branch, job, started_at, time.perf_counter() - start, ok, result)
+        return ok, result
+    finally:
+        with _lock:
+            _running.discard((branch, job))
+
+def due_jobs(branch):
+    conn = storage.connect(branch)
+    try:
+        last = {row['job']: datetime.fromisoformat(row['last_run_at']) for row in get_runs(conn)}
+    finally:
+        conn.close()
+    now = datetime.now()
+    return [job for job, (_, every) in JOBS.items()
+            if job not in last or (now - last[job]).total_seconds() >= every]
+
+def _run_scheduler(interval):
+    while True:
+        for branch in storage.get_branch_names():
+            try:
+                for job in due_jobs(branch):
+                    run_job(branch, job)
+            except Exception:
+                pass  # e.g. the run could not be recorded; try again on the next pass
+        time.sleep(interval)
+
+def start_scheduler(interval=60.0):
+    # Background thread that runs each branch's maintenance jobs as they come due
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run_scheduler, args=(interval,), daemon=True, name='maintenance')
+            _scheduler.start()
+    return _scheduler
+
+def main():
+    parser = argparse.ArgumentParser(description="Database maintenance: stats, vacuum, integrity and backups")
+    parser.add_argument('--branch', help="branch to maintain (default: all branches)")
+    parser.add_argument('--run', nargs='*', choices=list(JOBS), metavar='JOB',
+                        help=f"run these jobs now ({', '.join(JOBS)}); no names runs them all")
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help="switch the file to auto_vacuum = INCREMENTAL (one full VACUUM)")
+    args = parser.parse_args()
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    for branch in branches:
+        storage.init_db(branch)
+        if args.enable_incremental_vacuum:
+            print(f"[{branch}] auto_vacuum is now {enable_incremental_vacuum(branch)}")
+        if args.run is not None:
+            for job in args.run or JOBS:
+                ok, result = run_job(branch, job)
+                print(f"[{branch}] {job}: {'ok' if ok else 'FAILED'} - {result}")
+
+        conn = storage.connect(branch)
+        try:
+            health = get_health(conn)
+            runs = get_runs(conn)
+        finally:
+            conn.close()
+        size = os.path.getsize(storage.get_db_path(branch))
+        print(f"[{branch}] {size / 1024 / 1024:.1f} MB, {health['page_count']} pages of {health['page_size']} bytes, "
+              f"{health['freelist_count']} free, auto_vacuum {health['auto_vacuum']}, journal {health['journal_mode']}")
+        for run in runs:
+            print(f"[{branch}]   {run['job']:<14} {run['last_run_at'][:19]}  {run['duration'] * 1000:8.1f} ms  "
+                  f"{'ok' if run['ok'] else 'FAILED'}  {run['result']}")
+
+if __name__ == "__main__":
+    main()
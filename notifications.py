@@ -0,0 +1,345 @@
+import argparse
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import storage
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '1025'))
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS') == '1'
+MAIL_FROM = os.environ.get('MAIL_FROM', 'library@example.com')
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30      # seconds before the first retry, doubled on every attempt
+BACKOFF_MAX = 3600
+CLAIM_BATCH = 20
+SENDING_LEASE = 600    # a row left in 'Sending' longer than this was interrupted
+
+def init_outbox(conn):
+    c = conn.cursor()
+
+    # Open loans by due date, used by the overdue queries
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_overdue
+        ON transactions (due_date) WHERE status = 'Issued'
+    ''')
+
+    # Durable outbox. A row moves Pending -> Sending -> Sent, or to Failed once
+    # retries run out. (transaction_id, kind) is unique, so a loan is never queued twice.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT DEFAULT 'Pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL,
+            claimed_at TIMESTAMP,
+            sent_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL,
+            UNIQUE (transaction_id, kind)
+        )
+    ''')
+
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON notification_outbox (next_attempt_at) WHERE status = 'Pending'
+    ''')
+
+def enqueue_overdue_reminders(conn):
+    # Queue one reminder for every overdue loan that has not been notified yet
+    c = conn.cursor()
+    now = datetime.now()
+    c.execute('''
+        INSERT OR IGNORE INTO notification_outbox
+        (transaction_id, kind, recipient, subject, body, next_attempt_at, created_at)
+        SELECT
+            t.transaction_id,
+            'overdue',
+            s.email,
+            'Overdue library book: ' || b.title,
+            'Dear ' || s.name || ',' || char(10) || char(10) ||
+            'Our records show that "' || b.title || '" (book ' || b.book_id || ') was due on ' ||
+            date(t.due_date) || ' and has not been returned yet. A fee of ' || char(8377) ||
+            printf('%g', lp.daily_fee) || ' is charged for every day it is overdue.' || char(10) || char(10) ||
+            'Please return it to the library at your earliest convenience.' || char(10) || char(10) ||
+            'PAAD Library',
+            ?, ?
+        FROM transactions t
+        JOIN students s ON t.student_id = s.student_id
+        JOIN books b ON t.book_id = b.book_id
+        JOIN loan_policy lp ON lp.category = b.category AND lp.patron_type = s.patron_type
+        WHERE t.status = 'Issued' AND t.due_date < datetime('now', 'localtime')
+        AND NOT EXISTS (
+            SELECT 1 FROM notification_outbox o
+            WHERE o.transaction_id = t.transaction_id AND o.kind = 'overdue'
+        )
+    ''', (now, now))
+    queued = c.rowcount
+    conn.commit()
+    return queued
+
+def get_outbox_counts(conn):
+    c = conn.cursor()
+    c.execute('SELECT status, COUNT(*) FROM notification_outbox GROUP BY status')
+    return {status: count for status, count in c.fetchall()}
+
+def recover_interrupted(conn):
+    # A crash between handing a message to SMTP and recording it leaves the row in
+    # 'Sending'. We cannot tell whether it went out, so park it instead of re-sending.
+    c = conn.cursor()
+    c.execute('''
+        UPDATE notification_outbox
+        SET status = 'Interrupted', last_error = 'Worker stopped while sending; not retried'
+        WHERE status = 'Sending' AND claimed_at < ?
+    ''', (datetime.now() - timedelta(seconds=SENDING_LEASE),))
+    conn.commit()
+    return c.rowcount
+
+class DomainRateLimiter:
+    # Token bucket per recipient domain, shared by all workers
+    def __init__(self, rate=1.0, burst=5):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def try_acquire(self, domain):
+        # Returns 0 when a token was taken, otherwise the seconds until one is free
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(domain, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self.buckets[domain] = (tokens - 1, now)
+                return 0
+            self.buckets[domain] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+class SmtpSender:
+    # Keeps one SMTP connection open across messages and reconnects when it drops
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT):
+        self.host = host
+        self.port = port
+        self.smtp = None
+
+    def connect(self):
+        self.smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if SMTP_STARTTLS:
+            self.smtp.starttls()
+        if SMTP_USER:
+            self.smtp.login(SMTP_USER, SMTP_PASSWORD)
+
+    def send(self, message):
+        if self.smtp is None:
+            self.connect()
+        else:
+            try:
+                self.smtp.noop()
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # The server dropped the idle connection; open a fresh one
+                self.smtp = None
+                self.connect()
+        try:
+            self.smtp.send_message(message)
+        except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+            # The server rejected this message but the connection is still usable
+            raise
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.smtp = None
+
+def build_message(row):
+    message = EmailMessage()
+    message['From'] = MAIL_FROM
+    message['To'] = row['recipient']
+    message['Subject'] = row['subject']
+    # Stable id so downstream systems can drop duplicates
+    message['Message-ID'] = f"<{row['kind']}-{row['transaction_id']}@library.local>"
+    message.set_content(row['body'])
+    return message
+
+def is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+def claim_batch(conn, limit=CLAIM_BATCH):
+    c = conn.cursor()
+    now = datetime.now()
+    c.execute('''
+        UPDATE notification_outbox
+        SET status = 'Sending', claimed_at = ?
+        WHERE notification_id IN (
+            SELECT notification_id FROM notification_outbox
+            WHERE status = 'Pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        )
+        RETURNING notification_id, transaction_id, kind, recipient, subject, body, attempts
+    ''', (now, now, limit))
+    rows = c.fetchall()
+    conn.commit()
+    return rows
+
+def mark_sent(conn, notification_id):
+    conn.execute('''
+        UPDATE notification_outbox
+        SET status = 'Sent', sent_at = ?, attempts = attempts + 1, last_error = NULL
+        WHERE notification_id = ?
+    ''', (datetime.now(), notification_id))
+    conn.commit()
+
+def mark_deferred(conn, notification_id, delay):
+    # Rate limited: hand the row back without counting an attempt
+    conn.execute('''
+        UPDATE notification_outbox
+        SET status = 'Pending', next_attempt_at = ?
+        WHERE notification_id = ?
+    ''', (datetime.now() + timedelta(seconds=delay), notification_id))
+    conn.commit()
+
+def mark_failed(conn, row, error):
+    attempts = row['attempts'] + 1
+    if is_permanent(error) or attempts >= MAX_ATTEMPTS:
+        status = 'Failed'
+        next_attempt_at = datetime.now()
+    else:
+        status = 'Pending'
+        next_attempt_at = datetime.now() + timedelta(seconds=min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)))
+    conn.execute('''
+        UPDATE notification_outbox
+        SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+        WHERE notification_id = ?
+    ''', (status, attempts, next_attempt_at, str(error)[:500], row['notification_id']))
+    conn.commit()
+
+def seconds_until_next(conn, horizon):
+    # Seconds until the next pending row is due, or None if nothing is due within horizon
+    c = conn.cursor()
+    c.execute("SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status = 'Pending'")
+    next_attempt_at = c.fetchone()[0]
+    if next_attempt_at is None:
+        return None
+    wait = (datetime.fromisoformat(next_attempt_at) - datetime.now()).total_seconds()
+    return max(wait, 0) if wait <= horizon else None
+
+class SendStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.deferred = 0
+        self.lock = threading.Lock()
+
+    def add(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+def worker(branch, limiter, stop, stats, horizon, sender_factory=SmtpSender):
+    conn = storage.connect(branch)
+    sender = sender_factory()
+    try:
+        while not stop.is_set():
+            rows = claim_batch(conn)
+            if not rows:
+                # Wait for rate-limited or retrying rows that come due shortly
+                wait = seconds_until_next(conn, horizon)
+                if wait is None:
+                    break
+                stop.wait(wait)
+                continue
+            for row in rows:
+                domain = row['recipient'].rpartition('@')[2].lower()
+                wait = limiter.try_acquire(domain)
+                while 0 < wait <= 1 and not stop.is_set():
+                    # Short waits are cheaper to sleep through than to requeue
+                    stop.wait(wait)
+                    wait = limiter.try_acquire(domain)
+                if wait:
+                    mark_deferred(conn, row['notification_id'], wait)
+                    stats.add('deferred')
+                    continue
+                try:
+                    sender.send(build_message(row))
+                except (smtplib.SMTPException, OSError) as e:
+                    mark_failed(conn, row, e)
+                    stats.add('failed')
+                    continue
+                mark_sent(conn, row['notification_id'])
+                stats.add('sent')
+    finally:
+        sender.close()
+        conn.close()
+
+def drain_outbox(branch=None, workers=4, rate=1.0, burst=5, horizon=60, sender_factory=SmtpSender):
+    # Send everything that is due (or comes due within horizon seconds) using a pool of
+    # workers that each reuse one SMTP connection.
+    conn = storage.connect(branch)
+    recover_interrupted(conn)
+    conn.close()
+
+    limiter = DomainRateLimiter(rate, burst)
+    stop = threading.Event()
+    stats = SendStats()
+    threads = [
+        threading.Thread(target=worker, args=(branch, limiter, stop, stats, horizon, sender_factory), daemon=True)
+        for _ in range(workers)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue and send overdue reminders")
+    parser.add_argument('command', choices=['enqueue', 'send', 'run'])
+    parser.add_argument('--branch', help="branch to process (default: all branches)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=1.0, help="messages per second per recipient domain")
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--loop', type=float, help="keep running, pausing this many seconds between passes")
+    args = parser.parse_args()
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    while True:
+        for branch in branches:
+            storage.init_db(branch)
+            if args.command in ('enqueue', 'run'):
+                conn = storage.connect(branch)
+                print(f"[{branch}] queued {enqueue_overdue_reminders(conn)} reminders")
+                conn.close()
+            if args.command in ('send', 'run'):
+                stats = drain_outbox(branch, args.workers, args.rate, args.burst)
+                print(f"[{branch}] sent {stats.sent}, failed {stats.failed}, deferred {stats.deferred}")
+        if not args.loop:
+            break
+        time.sleep(args.loop)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse
+
+import storage
+
+DEFAULT_PATRON_TYPE = 'Student'
+# Compiled row for categories and patron types that no rule names
+ANY = '*'
+
+# The catch-all rule a new branch starts with: how the library has always lent
+DEFAULT_RULE = {'loan_days': 14, 'max_loans': 3, 'daily_fee': 10.0, 'warn_after_days': 0, 'block_after_days': 14}
+
+# Loan terms depend on the book's category and the patron's type; the borrowing
+# limit and standing thresholds on the patron's type alone
+LOAN_FIELDS = ('loan_days', 'daily_fee')
+PATRON_FIELDS = ('max_loans', 'warn_after_days', 'block_after_days')
+FIELDS = LOAN_FIELDS + PATRON_FIELDS
+
+class LoanPolicy:
+    # Resolves each field from the most specific rule that sets it: category and
+    # patron type, then category, then patron type, then the catch-all rule.
+    # Among equally specific rules the newest wins.
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda rule: (rule['category'] is not None, rule['patron_type'] is not None,
+                                                     rule.get('rule_id') or 0))
+
+    def resolve(self, field, category=None, patron_type=None):
+        value = None
+        for rule in self.rules:
+            if rule[field] is not None and rule['category'] in (None, category) and rule['patron_type'] in (None, patron_type):
+                value = rule[field]
+        if value is None:
+            raise ValueError(f"No rule sets {field}; the catch-all rule must set every field")
+        return value
+
+    def loan(self, category=None, patron_type=None):
+        return tuple(self.resolve(field, category, patron_type) for field in LOAN_FIELDS)
+
+    def patron(self, patron_type=None):
+        return tuple(self.resolve(field, None, patron_type) for field in PATRON_FIELDS)
+
+def init_policy(conn):
+    c = conn.cursor()
+
+    c.execute('PRAGMA table_info(students)')
+    if 'patron_type' not in [row[1] for row in c.fetchall()]:
+        c.execute(f"ALTER TABLE students ADD COLUMN patron_type TEXT NOT NULL DEFAULT '{DEFAULT_PATRON_TYPE}'")
+
+    # Rules as staff write them; NULL category or patron type matches any, and a
+    # NULL field leaves it to a less specific rule
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS loan_rules (
+            rule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT,
+            patron_type TEXT,
+            loan_days INTEGER,
+            max_loans INTEGER,
+            daily_fee REAL,
+            warn_after_days INTEGER,
+            block_after_days INTEGER
+        )
+    ''')
+    c.execute('SELECT COUNT(*) FROM loan_rules')
+    if c.fetchone()[0] == 0:
+        rule = dict(DEFAULT_RULE)
+        # Standing thresholds used to live in their own single-row table
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'standing_policy'")
+        if c.fetchone():
+            c.execute('SELECT warn_after_days, block_after_days FROM standing_policy WHERE id = 1')
+            row = c.fetchone()
+            if row:
+                rule['warn_after_days'], rule['block_after_days'] = row
+        c.execute(f'''
+            INSERT INTO loan_rules (category, patron_type, {', '.join(FIELDS)})
+            VALUES (NULL, NULL, {', '.join('?' * len(FIELDS))})
+        ''', [rule[field] for field in FIELDS])
+    c.execute('DROP VIEW IF EXISTS patron_standing')  # recreated by init_standing
+    c.execute('DROP TABLE IF EXISTS standing_policy')
+
+    # The rules compiled into lookup tables for every category and patron type in
+    # use, plus ANY rows, so queries resolve terms with plain equality joins
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS patron_policy (
+            patron_type TEXT PRIMARY KEY,
+            max_loans INTEGER NOT NULL,
+            warn_after_days INTEGER NOT NULL,
+            block_after_days INTEGER NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS loan_policy (
+            category TEXT NOT NULL,
+            patron_type TEXT NOT NULL,
+            loan_days INTEGER NOT NULL,
+            daily_fee REAL NOT NULL,
+            PRIMARY KEY (category, patron_type)
+        ) WITHOUT ROWID
+    ''')
+
+    # A category or patron type no rule names resolves like ANY, so its rows
+    # are copied from the ANY rows the first time it appears
+    for event in ('INSERT', 'UPDATE OF category'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS loan_policy_books_{event.split()[0].lower()} AFTER {event} ON books
+            WHEN NOT EXISTS (SELECT 1 FROM loan_policy WHERE category = NEW.category)
+            BEGIN
+                INSERT INTO loan_policy (category, patron_type, loan_days, daily_fee)
+                SELECT NEW.category, patron_type, loan_days, daily_fee FROM loan_policy WHERE category = '{ANY}';
+            END
+        ''')
+    for event in ('INSERT', 'UPDATE OF patron_type'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS loan_policy_students_{event.split()[0].lower()} AFTER {event} ON students
+            WHEN NOT EXISTS (SELECT 1 FROM patron_policy WHERE patron_type = NEW.patron_type)
+            BEGIN
+                INSERT INTO patron_policy (patron_type, max_loans, warn_after_days, block_after_days)
+                SELECT NEW.patron_type, max_loans, warn_after_days, block_after_days FROM patron_policy WHERE patron_type = '{ANY}';
+                INSERT INTO loan_policy (category, patron_type, loan_days, daily_fee)
+                SELECT category, NEW.patron_type, loan_days, daily_fee FROM loan_policy WHERE patron_type = '{ANY}';
+            END
+        ''')
+
+    compile_policy(conn)
+
+def get_rules(conn):
+    c = conn.cursor()
+    c.execute(f'SELECT rule_id, category, patron_type, {", ".join(FIELDS)} FROM loan_rules ORDER BY rule_id')
+    return [dict(zip(('rule_id', 'category', 'patron_type') + FIELDS, row)) for row in c.fetchall()]
+
+def get_patron_types(conn):
+    # Patron types with compiled terms, for new patrons to choose from
+    c = conn.cursor()
+    c.execute('SELECT patron_type FROM patron_policy WHERE patron_type != ? ORDER BY patron_type', (ANY,))
+    return [row[0] for row in c.fetchall()]
+
+def load(conn):
+    return LoanPolicy(get_rules(conn))
+
+def compile_policy(conn):
+    # Rewrites patron_policy and loan_policy from loan_rules; raises ValueError if
+    # the rules leave a field unset or give a patron type warn > block
+    policy = load(conn)
+    c = conn.cursor()
+    rules = policy.rules
+    c.execute('SELECT DISTINCT category FROM books')
+    categories = {row[0] for row in c.fetchall()} | {rule['category'] for rule in rules if rule['category']}
+    c.execute('SELECT DISTINCT patron_type FROM students')
+    patron_types = ({row[0] for row in c.fetchall()} | {rule['patron_type'] for rule in rules if rule['patron_type']}
+                    | {DEFAULT_PATRON_TYPE})
+
+    patron_rows = [(ANY,) + policy.patron()] + [(t,) + policy.patron(t) for t in sorted(patron_types)]
+    for patron_type, max_loans, warn, block in patron_rows:
+        if not 0 <= warn <= block:
+            raise ValueError(f"{patron_type}: thresholds must satisfy 0 <= warn_after_days <= block_after_days")
+    loan_rows = [(category, patron_type) + policy.loan(None if category == ANY else category,
+                                                       None if patron_type == ANY else patron_type)
+                 for category in [ANY] + sorted(categories) for patron_type in [ANY] + sorted(patron_types)]
+
+    c.execute('DELETE FROM patron_policy')
+    c.executemany('INSERT INTO patron_policy (patron_type, max_loans, warn_after_days, block_after_days) VALUES (?, ?, ?, ?)', patron_rows)
+    c.execute('DELETE FROM loan_policy')
+    c.executemany('INSERT INTO loan_policy (category, patron_type, loan_days, daily_fee) VALUES (?, ?, ?, ?)', loan_rows)
+    return len(patron_rows), len(loan_rows)
+
+def set_rule(conn, category=None, patron_type=None, **values):
+    # Sets fields on the rule for this category / patron type (creating it if
+    # needed), recompiles and commits. Raises ValueError for invalid rules.
+    values = {field: value for field, value in values.items() if value is not None}
+    unknown = set(values) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown policy fields: {', '.join(sorted(unknown))}")
+    if category is not None and set(values) & set(PATRON_FIELDS):
+        raise ValueError(f"{', '.join(PATRON_FIELDS)} depend on the patron type only; leave out the category")
+    if any(value < 0 for value in values.values()):
+        raise ValueError("Policy values cannot be negative")
+    if not values:
+        raise ValueError("Nothing to set")
+    c = conn.cursor()
+    c.execute('SELECT rule_id FROM loan_rules WHERE category IS ? AND patron_type IS ?', (category, patron_type))
+    row = c.fetchone()
+    try:
+        if row:
+            c.execute(f"UPDATE loan_rules SET {', '.join(f'{field} = ?' for field in values)} WHERE rule_id = ?",
+                      list(values.values()) + [row[0]])
+        else:
+            c.execute(f"INSERT INTO loan_rules (category, patron_type, {', '.join(values)}) VALUES (?, ?, {', '.join('?' * len(values))})",
+                      [category, patron_type] + list(values.values()))
+        compile_policy(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+
+def delete_rule(conn, category=None, patron_type=None):
+    if category is None and patron_type is None:
+        raise ValueError("The catch-all rule cannot be deleted")
+    c = conn.cursor()
+    c.execute('DELETE FROM loan_rules WHERE category IS ? AND patron_type IS ?', (category, patron_type))
+    deleted = c.rowcount
+    compile_policy(conn)
+    conn.commit()
+    return deleted
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or change the loan policy")
+    parser.add_argument('--branch', help="branch to configure (default: all branches)")
+    parser.add_argument('--category', help="rule for this book category (default: any)")
+    parser.add_argument('--patron-type', help="rule for this patron type (default: any)")
+    parser.add_argument('--loan-days', type=int)
+    parser.add_argument('--max-loans', type=int)
+    parser.add_argument('--daily-fee', type=float)
+    parser.add_argument('--warn-after', type=int, help="days overdue before a patron is in Warning")
+    parser.add_argument('--block-after', type=int, help="days overdue before a patron is Blocked from borrowing")
+    parser.add_argument('--delete', action='store_true', help="delete the rule for --category / --patron-type")
+    args = parser.parse_args()
+    values = {'loan_days': args.loan_days, 'max_loans': args.max_loans, 'daily_fee': args.daily_fee,
+              'warn_after_days': args.warn_after, 'block_after_days': args.block_after}
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    for branch in branches:
+        storage.init_db(branch)
+        conn = storage.connect(branch)
+        try:
+            try:
+                if args.delete:
+                    delete_rule(conn, args.category, args.patron_type)
+                elif any(value is not None for value in values.values()):
+                    set_rule(conn, args.category, args.patron_type, **values)
+            except ValueError as e:
+                parser.error(str(e))
+            rules = get_rules(conn)
+        finally:
+            conn.close()
+        print(f"[{branch}] Loan rules (most specific wins):")
+        for rule in rules:
+            scope = f"{rule['category'] or 'any category'} / {rule['patron_type'] or 'any patron'}"
+            terms = ', '.join(f"{field} {rule[field]:g}" for field in FIELDS if rule[field] is not None)
+            print(f"[{branch}]   {scope}: {terms}")
+
+if __name__ == "__main__":
+    main()
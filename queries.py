@@ -0,0 +1,98 @@
+# Dashboard, search and statistics queries. Each takes a connection to one branch
+# and returns plain values, so the Streamlit page, the load test and other tools
+# run exactly the same SQL.
+
+def query_metrics(conn):
+    c = conn.cursor()
+    
+    # Get total books
+    c.execute('SELECT COUNT(*) FROM books')
+    total_books = c.fetchone()[0]
+    
+    # Get total students
+    c.execute('SELECT COUNT(*) FROM students')
+    total_students = c.fetchone()[0]
+    
+    # Get active issues
+    c.execute('SELECT COUNT(*) FROM transactions WHERE status = "Issued"')
+    active_issues = c.fetchone()[0]
+    
+    # Get overdue books
+    c.execute('''
+        SELECT COUNT(*) FROM transactions 
+        WHERE status = "Issued" AND due_date < datetime('now', 'localtime')
+    ''')
+    overdue_books = c.fetchone()[0]
+    
+    return {
+        'total_books': total_books,
+        'total_students': total_students,
+        'active_issues': active_issues,
+        'overdue_books': overdue_books
+    }
+
+SEARCH_COLUMNS = {
+    "Books": ['book_id', 'title', 'author', 'isbn', 'category', 'status'],
+    "Students": ['student_id', 'name', 'email', 'phone', 'books_issued'],
+    "Transactions": ['transaction_id', 'book_id', 'student_id', 'rfid', 'issue_date', 'due_date', 'return_date', 'status', 'fee']
+}
+
+def query_search(conn, search_type, search_query):
+    c = conn.cursor()
+    if search_type == "Books":
+        c.execute('''
+            SELECT book_id, title, author, isbn, category, status FROM books 
+            WHERE LOWER(title) LIKE ? 
+            OR LOWER(author) LIKE ? 
+            OR book_id LIKE ?
+        ''', (f'%{search_query.lower()}%', f'%{search_query.lower()}%', f'%{search_query}%'))
+    elif search_type == "Students":
+        c.execute('''
+            SELECT student_id, name, email, phone, books_issued FROM students 
+            WHERE LOWER(name) LIKE ? 
+            OR student_id LIKE ?
+        ''', (f'%{search_query.lower()}%', f'%{search_query}%'))
+    else:  # Transactions
+        c.execute('''
+            SELECT transaction_id, book_id, student_id, rfid, issue_date, due_date, return_date, status, fee
+            FROM transactions 
+            WHERE transaction_id LIKE ? 
+            OR book_id LIKE ? 
+            OR student_id LIKE ?
+        ''', (f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'))
+    return [tuple(row) for row in c.fetchall()]
+
+def query_stats(conn):
+    c = conn.cursor()
+    
+    # Category distribution
+    c.execute('''
+        SELECT category, COUNT(*) as count 
+        FROM books 
+        GROUP BY category 
+        ORDER BY count DESC
+    ''')
+    categories = [tuple(row) for row in c.fetchall()]
+    
+    # Overdue books
+    c.execute('''
+        SELECT b.title, s.name, t.due_date
+        FROM transactions t
+        JOIN books b ON t.book_id = b.book_id
+        JOIN students s ON t.student_id = s.student_id
+        WHERE t.status = 'Issued' AND t.due_date < datetime('now', 'localtime')
+    ''')
+    overdue_books = [tuple(row) for row in c.fetchall()]
+    
+    # Popular books
+    c.execute('''
+        SELECT b.title, COUNT(*) as issue_count
+        FROM transactions t
+        JOIN books b ON t.book_id = b.book_id
+        GROUP BY b.book_id
+        ORDER BY issue_count DESC
+        LIMIT 5
+    ''')
+    popular_books = [tuple(row) for row in c.fetchall()]
+    
+    return {'categories': categories, 'overdue_books': overdue_books, 'popular_books': popular_books}
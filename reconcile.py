@@ -0,0 +1,136 @@
+import argparse
+import time
+
+import storage
+
+BATCH_SIZE = 500
+BATCH_PAUSE = 0.01   # seconds between batches so desk writes can get the lock
+
+# Denormalised counter -> (key column, counter column, value derived from open loans)
+COUNTERS = {
+    'students': ('student_id', 'books_issued', "COUNT(t.transaction_id)"),
+    'books': ('book_id', 'status', "CASE WHEN COUNT(t.transaction_id) > 0 THEN 'Issued' ELSE 'Available' END"),
+}
+
+def init_indexes(conn):
+    c = conn.cursor()
+
+    # Open loans per patron, per book and per RFID tag; used to recompute the
+    # counters and to look up what a scanned tag is on loan to
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_open_student
+        ON transactions (student_id, due_date) WHERE status = 'Issued'
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_open_book
+        ON transactions (book_id) WHERE status = 'Issued'
+    ''')
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_transactions_open_rfid
+        ON transactions (rfid) WHERE status = 'Issued'
+    ''')
+
+def reconcile_range(c, table, low=None, high=None, apply=True):
+    # Recompute the counter for keys in (low, high] from open loans and fix the rows
+    # that drifted, with one UPDATE ... FROM. Returns [(key, stored, actual)].
+    key, column, actual = COUNTERS[table]
+    bounds = []
+    params = []
+    if low is not None:
+        bounds.append(f"x.{key} > ?")
+        params.append(low)
+    if high is not None:
+        bounds.append(f"x.{key} <= ?")
+        params.append(high)
+    where = f"WHERE {' AND '.join(bounds)}" if bounds else ""
+
+    c.execute('DROP TABLE IF EXISTS temp.counter_drift')
+    c.execute(f'''
+        CREATE TEMP TABLE counter_drift AS
+        SELECT key, stored, actual FROM (
+            SELECT x.{key} as key, x.{column} as stored, {actual} as actual
+            FROM {table} x
+            LEFT JOIN transactions t ON t.{key} = x.{key} AND t.status = 'Issued'
+            {where}
+            GROUP BY x.{key}
+        )
+        WHERE stored IS NOT actual
+    ''', params)
+    c.execute('SELECT key, stored, actual FROM temp.counter_drift ORDER BY key')
+    drift = [tuple(row) for row in c.fetchall()]
+
+    if apply and drift:
+        c.execute(f'''
+            UPDATE {table}
+            SET {column} = d.actual
+            FROM temp.counter_drift d
+            WHERE {table}.{key} = d.key
+        ''')
+    c.execute('DROP TABLE temp.counter_drift')
+    return drift
+
+def _next_bound(c, table, low, batch_size):
+    key = COUNTERS[table][0]
+    if low is None:
+        c.execute(f'SELECT {key} FROM {table} ORDER BY {key} LIMIT 1 OFFSET ?', (batch_size - 1,))
+    else:
+        c.execute(f'SELECT {key} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT 1 OFFSET ?', (low, batch_size - 1))
+    row = c.fetchone()
+    return row[0] if row else None
+
+def reconcile(conn, tables=('students', 'books'), apply=True, batch_size=BATCH_SIZE, pause=BATCH_PAUSE):
+    # Walk each table in key order, one short write transaction per batch, so the
+    # job can run while the desk is open. Returns {table: [(key, stored, actual)]}.
+    report = {}
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # each batch is its own explicit transaction
+    c = conn.cursor()
+    for table in tables:
+        drift = []
+        low = None
+        while True:
+            c.execute('BEGIN IMMEDIATE')
+            try:
+                high = _next_bound(c, table, low, batch_size)
+                drift.extend(reconcile_range(c, table, low, high, apply))
+                c.execute('COMMIT' if apply else 'ROLLBACK')
+            except Exception:
+                c.execute('ROLLBACK')
+                raise
+            if high is None:
+                break
+            low = high
+            time.sleep(pause)
+        report[table] = drift
+    conn.isolation_level = isolation_level
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute books_issued and books.status from open loans")
+    parser.add_argument('--branch', help="branch to process (default: all branches)")
+    parser.add_argument('--dry-run', action='store_true', help="report drift without fixing it")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--verbose', action='store_true', help="list every drifted row")
+    args = parser.parse_args()
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    for branch in branches:
+        storage.init_db(branch)
+        conn = storage.connect(branch)
+        try:
+            start = time.perf_counter()
+            report = reconcile(conn, apply=not args.dry_run, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+        finally:
+            conn.close()
+        action = "found" if args.dry_run else "fixed"
+        for table, drift in report.items():
+            print(f"[{branch}] {table}: {action} {len(drift)} drifted rows")
+            if args.verbose:
+                column = COUNTERS[table][1]
+                for key, stored, actual in drift:
+                    print(f"    {key}: {column} {stored} -> {actual}")
+        print(f"[{branch}] done in {elapsed:.3f}s")
+
+if __name__ == "__main__":
+    main()
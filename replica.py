@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import storage
+
+# Refresh a branch's replica once it is this old or has missed this many local writes
+REPLICA_MAX_AGE = float(os.environ.get('REPLICA_MAX_AGE', '30'))
+REPLICA_MAX_WRITES = int(os.environ.get('REPLICA_MAX_WRITES', '20'))
+BACKUP_STEP_PAGES = 256   # copy in steps so writers can get in between them
+
+_lock = threading.Lock()
+_writes_since_refresh = {}
+_refreshing = set()
+_scheduler = None
+
+def get_replica_path(branch=None):
+    primary = Path(storage.get_db_path(branch))
+    return primary.with_name(f"{primary.stem}.replica{primary.suffix}")
+
+def note_write(branch=None):
+    branch = branch or storage.get_branch_names()[0]
+    with _lock:
+        _writes_since_refresh[branch] = _writes_since_refresh.get(branch, 0) + 1
+
+def refresh(branch=None):
+    branch = branch or storage.get_branch_names()[0]
+    with _lock:
+        if branch in _refreshing:
+            return False
+        _refreshing.add(branch)
+        writes = _writes_since_refresh.get(branch, 0)
+    try:
+        source = sqlite3.connect(storage.get_db_path(branch))
+        target = sqlite3.connect(get_replica_path(branch))
+        try:
+            # Online backup: the replica is replaced in one transaction, so readers
+            # see either the old snapshot or the new one
+            source.backup(target, pages=BACKUP_STEP_PAGES, sleep=0.001)
+            target.execute('CREATE TABLE IF NOT EXISTS replica_info (refreshed_at TIMESTAMP NOT NULL)')
+            target.execute('DELETE FROM replica_info')
+            target.execute('INSERT INTO replica_info (refreshed_at) VALUES (?)', (datetime.now(),))
+            target.commit()
+        finally:
+            target.close()
+            source.close()
+        with _lock:
+            _writes_since_refresh[branch] = max(0, _writes_since_refresh.get(branch, 0) - writes)
+        return True
+    finally:
+        with _lock:
+            _refreshing.discard(branch)
+
+def get_refreshed_at(branch=None):
+    if not get_replica_path(branch).exists():
+        return None
+    conn = connect(branch, refresh_missing=False)
+    try:
+        c = conn.cursor()
+        c.execute('SELECT refreshed_at FROM replica_info')
+        row = c.fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+def get_staleness(branch=None):
+    # Seconds since the replica was taken, or None if there is no replica yet
+    refreshed_at = get_refreshed_at(branch)
+    return (datetime.now() - refreshed_at).total_seconds() if refreshed_at else None
+
+def needs_refresh(branch):
+    with _lock:
+        writes = _writes_since_refresh.get(branch, 0)
+    if writes >= REPLICA_MAX_WRITES:
+        return True
+    staleness = get_staleness(branch)
+    return staleness is None or staleness >= REPLICA_MAX_AGE
+
+def connect(branch=None, refresh_missing=True):
+    path = get_replica_path(branch)
+    if refresh_missing and not path.exists():
+        refresh(branch)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row  # This enables column access by name
+    return conn
+
+def _run_scheduler(interval):
+    while True:
+        for branch in storage.get_branch_names():
+            try:
+                if needs_refresh(branch):
+                    refresh(branch)
+            except sqlite3.Error:
+                pass  # try again on the next pass
+        time.sleep(interval)
+
+def start_scheduler(interval=1.0):
+    # Background thread that keeps every branch's replica within its age/write budget
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run_scheduler, args=(interval,), daemon=True, name='replica')
+            _scheduler.start()
+    return _scheduler
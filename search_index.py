@@ -0,0 +1,283 @@
+import heapq
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from itertools import islice
+
+import changefeed
+import storage
+import writer
+
+# A query word only matches catalog words at least this similar to it
+MIN_SIMILARITY = 0.3
+# Closest catalog words considered per query word; bounds the work per keystroke
+MAX_CANDIDATE_WORDS = 50
+# Field values one query word may add to the results; bounds the work for words
+# that appear in most of the catalog
+MAX_VALUES_PER_WORD = 500
+# Trigrams shared by more catalog words than this are only counted for words the
+# rarer trigrams of the query already matched
+MAX_GRAM_WORDS = 2000
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def words(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+def trigrams(word, prefix=False):
+    # pg_trgm style padding; a word still being typed gets no trailing pad so
+    # "rodri" fully matches the start of "rodriguez"
+    padded = f"  {word}" if prefix else f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TrigramIndex:
+    # Fuzzy index over book titles, authors and student names. Trigram postings are
+    # kept per distinct word, so an author who wrote 10,000 books costs one posting,
+    # and matches are expanded word -> field value -> record only for the best words.
+    def __init__(self, branch=None):
+        self.branch = branch
+        self.word_grams = defaultdict(set)    # trigram -> words
+        self.word_sizes = {}                  # word -> trigram count
+        self.word_values = defaultdict(set)   # word -> field values containing it
+        self.value_docs = defaultdict(set)    # field value -> (kind, id, field)
+        self.docs = {}                        # (kind, id) -> {field: text}
+        self.seq = None                       # last change_log seq applied
+        self.lock = threading.Lock()
+        self.conn = None
+        self.conn_lock = threading.Lock()
+
+    def _index_value(self, key, text):
+        value = ' '.join(words(text))
+        if not value:
+            return
+        if not self.value_docs[value]:
+            for word in value.split(' '):
+                if word not in self.word_sizes:
+                    grams = trigrams(word)
+                    for gram in grams:
+                        self.word_grams[gram].add(word)
+                    self.word_sizes[word] = len(grams)
+                self.word_values[word].add(value)
+        self.value_docs[value].add(key)
+
+    def _unindex_value(self, key, text):
+        value = ' '.join(words(text))
+        docs = self.value_docs.get(value)
+        if docs is None:
+            return
+        docs.discard(key)
+        if not docs:
+            del self.value_docs[value]
+            for word in set(value.split(' ')):
+                self.word_values[word].discard(value)
+
+    def add(self, kind, doc_id, **fields):
+        with self.lock:
+            self._remove(kind, doc_id)
+            for field, text in fields.items():
+                self._index_value((kind, doc_id, field), text)
+            self.docs[(kind, doc_id)] = dict(fields)
+
+    def remove(self, kind, doc_id):
+        with self.lock:
+            self._remove(kind, doc_id)
+
+    def _remove(self, kind, doc_id):
+        for field, text in self.docs.pop((kind, doc_id), {}).items():
+            self._unindex_value((kind, doc_id, field), text)
+
+    def _candidate_words(self, word, prefix):
+        grams = trigrams(word, prefix)
+        postings = sorted((self.word_grams.get(gram, ()) for gram in grams), key=len)
+        shared = Counter()
+        for matches in postings:
+            if len(matches) <= MAX_GRAM_WORDS:
+                shared.update(matches)
+            elif shared:
+                # A common trigram (the "  1" of every number) only adds to words
+                # the rarer trigrams already found
+                for candidate in shared:
+                    if candidate in matches:
+                        shared[candidate] += 1
+            else:
+                # Every trigram is common: a sample of its words, plus the word itself
+                shared.update(islice(matches, MAX_GRAM_WORDS))
+                if word in matches:
+                    shared[word] = max(shared[word], 1)
+        scored = []
+        for candidate, count in shared.items():
+            jaccard = count / (len(grams) + self.word_sizes[candidate] - count)
+            # While typing, how much of the prefix matched is what counts
+            similarity = count / len(grams) if prefix else jaccard
+            if similarity >= MIN_SIMILARITY:
+                scored.append((similarity, jaccard, candidate))
+        return heapq.nlargest(MAX_CANDIDATE_WORDS, scored)
+
+    def search(self, query, kind=None, limit=10):
+        # Returns [(score, kind, id, field, {field: text})], best first. score is the
+        # mean over query words of the best similarity found in the matched field.
+        query_words = words(query)
+        if not query_words:
+            return []
+        typing = not query[-1:].isspace()
+        with self.lock:
+            candidates = []
+            for i, word in enumerate(query_words):
+                prefix = typing and i == len(query_words) - 1
+                candidates.append([(similarity + jaccard * 0.01, candidate)   # prefer whole-word matches on ties
+                                   for similarity, jaccard, candidate in self._candidate_words(word, prefix)])
+            postings = [sum(len(self.word_values[candidate]) for score, candidate in scored) for scored in candidates]
+
+            # Rarest query word first. It seeds at most MAX_VALUES_PER_WORD field
+            # values; a common word ("book" in 100,000 titles) after it only rescores
+            # the values already found instead of expanding to all of its own
+            value_scores = {}
+            for i in sorted(range(len(query_words)), key=postings.__getitem__):
+                if value_scores and postings[i] > MAX_VALUES_PER_WORD:
+                    best = {}
+                    for score, candidate in candidates[i]:
+                        best.setdefault(candidate, score)
+                    for value, scores in value_scores.items():
+                        scores[i] = max((best.get(word, 0.0) for word in value.split(' ')), default=0.0)
+                    continue
+                budget = MAX_VALUES_PER_WORD
+                for score, candidate in candidates[i]:
+                    values = self.word_values[candidate]
+                    for value in values if len(values) <= budget else islice(values, budget):
+                        scores = value_scores.get(value)
+                        if scores is None:
+                            if budget <= 0:
+                                continue
+                            scores = value_scores[value] = [0.0] * len(query_words)
+                            budget -= 1
+                        if score > scores[i]:
+                            scores[i] = score
+
+            # Pop field values best first; a record's first hit is its best field,
+            # so we can stop as soon as enough records are collected. Heapify and
+            # pop rather than sort, since only the first few are ever needed.
+            ranked_values = [(-sum(scores) / len(scores), value) for value, scores in value_scores.items()]
+            heapq.heapify(ranked_values)
+            results = []
+            seen = set()
+            while ranked_values and len(results) < limit:
+                score, value = heapq.heappop(ranked_values)
+                score = -score
+                if score < MIN_SIMILARITY:
+                    break
+                # An author of 10,000 books is one value; take only the ids still needed
+                docs = list(islice((key for key in self.value_docs[value]
+                                    if not (kind and key[0] != kind) and key[:2] not in seen),
+                                   limit - len(results)))
+                for doc_kind, doc_id, field in docs:
+                    doc = (doc_kind, doc_id)
+                    if doc in seen:
+                        continue
+                    seen.add(doc)
+                    results.append((round(min(score, 1.0), 3), doc_kind, doc_id, field, dict(self.docs[doc])))
+            return results
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(storage.get_db_path(self.branch), check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+        return self.conn
+
+    def refresh(self):
+        # Catch up with books and students written by any process (other API
+        # servers, the dashboard, imports) from change_log, the way gate.py
+        # follows loans. Builds in full on first use or after a prune.
+        with self.conn_lock:
+            conn = self._connection()
+            conn.execute('BEGIN')  # seq and rows from one snapshot
+            try:
+                if self.seq is None or changefeed.is_behind(conn, self.seq):
+                    return self.build(conn)
+                return self._apply(conn)
+            finally:
+                conn.rollback()
+
+    def _apply(self, conn):
+        changes = changefeed.get_changes_since(conn, self.seq)
+        if not changes:
+            return 0
+        c = conn.cursor()
+        changed = {'books': set(), 'students': set()}
+        for change in changes:
+            if change['table_name'] in changed:
+                changed[change['table_name']].add(change['row_key'])
+        fetched = {}
+        for table, sql in (('books', 'SELECT book_id AS id, title, author FROM books WHERE book_id'),
+                           ('students', 'SELECT student_id AS id, name FROM students WHERE student_id')):
+            keys = list(changed[table])
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                c.execute(f"{sql} IN ({', '.join('?' * len(chunk))})", chunk)
+                fetched.update(((table, row['id']), dict(row)) for row in c.fetchall())
+        for table, kind in (('books', 'book'), ('students', 'student')):
+            for key in changed[table]:
+                fields = fetched.get((table, key))
+                if fields is None:
+                    self.remove(kind, key)
+                    continue
+                del fields['id']
+                # Loans update books and students too; only reindex changed text
+                if self.docs.get((kind, key)) != fields:
+                    self.add(kind, key, **fields)
+        with self.lock:
+            self.seq = max(self.seq, changes[-1]['seq'])
+        return len(changes) + len(fetched)
+
+    def build(self, conn):
+        seq = changefeed.get_last_seq(conn)
+        c = conn.cursor()
+        c.execute('SELECT book_id, title, author FROM books')
+        books = c.fetchall()
+        c.execute('SELECT student_id, name FROM students')
+        students = c.fetchall()
+
+        # Bulk load into a fresh index, then swap it in
+        fresh = TrigramIndex()
+        for book_id, title, author in books:
+            fresh._index_value(('book', book_id, 'title'), title)
+            fresh._index_value(('book', book_id, 'author'), author)
+            fresh.docs[('book', book_id)] = {'title': title, 'author': author}
+        for student_id, name in students:
+            fresh._index_value(('student', student_id, 'name'), name)
+            fresh.docs[('student', student_id)] = {'name': name}
+        with self.lock:
+            self.word_grams = fresh.word_grams
+            self.word_sizes = fresh.word_sizes
+            self.word_values = fresh.word_values
+            self.value_docs = fresh.value_docs
+            self.docs = fresh.docs
+            self.seq = seq
+        return len(books) + len(students)
+
+def get_index(branch=None):
+    # The branch's index, built on first use and caught up from change_log on
+    # every call so writes from other processes show up in the next search
+    branch = branch or storage.get_branch_names()[0]
+    with _indexes_lock:
+        index = _indexes.get(branch)
+        if index is None:
+            index = _indexes[branch] = TrigramIndex(branch)
+    index.refresh()
+    return index
+
+def on_write(branch, operation, args, result):
+    # Keep already-built indexes current as books and students are added here,
+    # without waiting for the next catch-up from change_log
+    index = _indexes.get(branch)
+    if index is None:
+        return
+    if operation == 'add_book':
+        book_id, title, author = args[:3]
+        index.add('book', book_id, title=title, author=author)
+    elif operation == 'add_student':
+        student_id, name = args[:2]
+        index.add('student', student_id, name=name)
+
+writer.add_listener(on_write)
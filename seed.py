@@ -0,0 +1,211 @@
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import analytics
+import events
+import policy
+import replica
+import storage
+
+# Vocabularies for generated books and patrons
+CATEGORIES = ["Fiction", "Non-Fiction", "Science", "Technology", "History", "Biography", "Mathematics", "Physics", "Chemistry", "Biology", "Computer Science", "Literature", "Philosophy", "Psychology", "Economics"]
+AUTHORS = ["John Smith", "Jane Doe", "Robert Johnson", "Emily Brown", "Michael Wilson", "Sarah Davis", "David Miller", "Lisa Anderson", "James Taylor", "Mary Thomas"]
+FIRST_NAMES = ["John", "Jane", "Michael", "Emily", "David", "Sarah", "James", "Lisa", "Robert", "Mary", "William", "Emma", "Daniel", "Sophia", "Matthew"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson"]
+
+ISSUED_SHARE = 0.3    # chance a circulating book is out on loan at the as-of date
+HISTORY_DAYS = 365
+CHUNK_BOOKS = 10_000  # books (and their loans) generated per executemany batch
+
+SEED_TABLES = ('books', 'students', 'transactions')
+DAY = 86400
+
+class Fixtures:
+    # Generates a consistent library in memory: every loan of a book happens after
+    # the previous one was returned, each issued book has exactly one open loan,
+    # and no patron holds more than the loan policy allows. Every patron gets the
+    # default patron type; loan periods and fees follow the book's category.
+    def __init__(self, seed, books, students, transactions, as_of, history_days=HISTORY_DAYS, loan_policy=None):
+        if students > 9_999_999:
+            raise ValueError("At most 9,999,999 students can be generated")
+        self.rng = random.Random(seed)
+        self.books = books
+        self.students = students
+        self.transactions = transactions
+        self.as_of = as_of
+        self.history = history_days * DAY
+        self.book_width = max(3, len(str(books)))
+        self.open_loans = bytearray(students)
+        self.next_transaction = 1
+
+        loan_policy = loan_policy or policy.LoanPolicy([dict(policy.DEFAULT_RULE, category=None, patron_type=None)])
+        self.max_open_loans = loan_policy.patron(policy.DEFAULT_PATRON_TYPE)[0]
+        self.terms = {category: loan_policy.loan(category, policy.DEFAULT_PATRON_TYPE) for category in CATEGORIES}
+
+        # Spread the loans over the books: everyone gets the base share and a
+        # random subset of books one more
+        self.base_loans, extra = divmod(transactions, books) if books else (0, 0)
+        self.extra_loans = set(self.rng.sample(range(books), extra)) if extra else set()
+
+    def book_id(self, i):
+        return f"{i + 1:0{self.book_width}d}"
+
+    def student_id(self, i):
+        return f"STU{i + 1:05d}" if self.students <= 99_999 else f"S{i + 1:07d}"
+
+    def timestamp(self, seconds_ago):
+        return (self.as_of - timedelta(seconds=seconds_ago)).isoformat(' ')
+
+    def _open_student(self):
+        # A random patron with room for another loan, or None if a few tries fail
+        for _ in range(5):
+            student = self.rng.randrange(self.students)
+            if self.open_loans[student] < self.max_open_loans:
+                self.open_loans[student] += 1
+                return student
+        return None
+
+    def _loan(self, book_id, category, student, rfid, issued_ago, returned_ago=None):
+        loan_days, daily_fee = self.terms[category]
+        issue_date = self.timestamp(issued_ago)
+        due_ago = issued_ago - loan_days * DAY
+        if returned_ago is None:
+            return_date, status, fee = None, 'Issued', 0.0
+        else:
+            return_date, status = self.timestamp(returned_ago), 'Returned'
+            fee = max(0, int((due_ago - returned_ago) // DAY)) * daily_fee
+        transaction_id = f"T{self.next_transaction:03d}"
+        self.next_transaction += 1
+        return (transaction_id, book_id, self.student_id(student), rfid, issue_date,
+                self.timestamp(due_ago), return_date, status, float(fee))
+
+    def chunks(self):
+        # Yields (books, transactions) row lists, CHUNK_BOOKS books at a time
+        rng = self.rng
+        for first in range(0, self.books, CHUNK_BOOKS):
+            books = []
+            loans = []
+            for i in range(first, min(first + CHUNK_BOOKS, self.books)):
+                book_id = self.book_id(i)
+                rfid = f"RFID{i + 1:04d}"
+                count = self.base_loans + (i in self.extra_loans)
+                span = self.history / count if count else 0
+
+                # Walk back from the as-of date: an optional open loan, then
+                # returned loans separated by idle gaps
+                status = 'Available'
+                cursor = 0.0
+                timings = []  # (student, issued_ago, returned_ago)
+                if count and self.students and rng.random() < ISSUED_SHARE:
+                    student = self._open_student()
+                    if student is not None:
+                        cursor = rng.uniform(DAY, min(30 * DAY, max(span, DAY)))
+                        timings.append((student, cursor, None))
+                        status = 'Issued'
+                        count -= 1
+                for _ in range(count if self.students else 0):
+                    returned_ago = cursor + rng.uniform(0, span * 0.5)
+                    cursor = returned_ago + rng.uniform(0.2, 1.0) * min(24 * DAY, max(span * 0.5, DAY))
+                    timings.append((rng.randrange(self.students), cursor, returned_ago))
+
+                books.append((book_id, f"Book {i + 1}", rng.choice(AUTHORS),
+                              f"978-{rng.randint(1000000000, 9999999999)}", rng.choice(CATEGORIES), status))
+                # Due dates and fees depend on the category, drawn after the timings
+                loans.extend(self._loan(book_id, books[-1][4], student, rfid, issued_ago, returned_ago)
+                             for student, issued_ago, returned_ago in timings)
+            yield books, loans
+
+    def student_rows(self):
+        # Generated last so books_issued matches the open loans handed out
+        rng = self.rng
+        for i in range(self.students):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            yield (self.student_id(i), name, f"{name.lower().replace(' ', '.')}.{i + 1}@example.com",
+                   f"{rng.randint(1000000000, 9999999999)}", self.open_loans[i])
+
+def _deferred_schema(c):
+    # Secondary indexes and triggers on the seeded tables; dropped during the
+    # load and recreated afterwards so each is built once, in bulk
+    c.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+        AND tbl_name IN ({', '.join('?' * len(SEED_TABLES))})
+    ''', SEED_TABLES)
+    return c.fetchall()
+
+def seed(branch=None, seed=42, books=100, students=25, transactions=50, as_of=None, history_days=HISTORY_DAYS):
+    # Load generated fixtures into an empty branch. Raises ValueError if it has data.
+    start = time.perf_counter()
+    storage.init_db(branch)
+    conn = sqlite3.connect(storage.get_db_path(branch), isolation_level=None)
+    c = conn.cursor()
+    fixtures = Fixtures(seed, books, students, transactions, as_of or datetime.now(), history_days, policy.load(conn))
+
+    # Relaxed durability for the load only; a failed seed is simply rerun
+    c.execute('PRAGMA journal_mode = MEMORY')
+    c.execute('PRAGMA synchronous = OFF')
+    c.execute('PRAGMA cache_size = -262144')
+    c.execute('PRAGMA temp_store = MEMORY')
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        for table in SEED_TABLES + ('circulation_events',):
+            c.execute(f'SELECT EXISTS (SELECT 1 FROM {table})')
+            if c.fetchone()[0]:
+                raise ValueError(f"{table} already has rows; seed an empty branch")
+
+        deferred = _deferred_schema(c)
+        for kind, name, sql in deferred:
+            c.execute(f'DROP {kind.upper()} {name}')
+
+        for book_rows, loan_rows in fixtures.chunks():
+            c.executemany('INSERT INTO books (book_id, title, author, isbn, category, status) VALUES (?, ?, ?, ?, ?, ?)', book_rows)
+            c.executemany(f'INSERT INTO transactions ({events.TRANSACTION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', loan_rows)
+        c.executemany('INSERT INTO students (student_id, name, email, phone, books_issued) VALUES (?, ?, ?, ?, ?)', fixtures.student_rows())
+        loaded = time.perf_counter()
+
+        for kind, name, sql in deferred:
+            c.execute(sql)
+        # The loan_policy triggers were among those dropped, so compile once for
+        # the categories just loaded
+        policy.compile_policy(conn)
+        events.backfill(conn)
+        analytics.rebuild_aggregates(conn)  # commits
+        c.execute('ANALYZE')
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    end = time.perf_counter()
+    return {'books': books, 'students': students, 'transactions': fixtures.next_transaction - 1,
+            'open_loans': sum(fixtures.open_loans), 'load_seconds': loaded - start, 'seconds': end - start}
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a branch with generated, consistent sample data")
+    parser.add_argument('--branch', help="branch to seed (default: the first branch)")
+    parser.add_argument('--seed', type=int, default=42, help="random seed; the same seed and as-of date give the same data")
+    parser.add_argument('--books', type=int, default=100)
+    parser.add_argument('--students', type=int, default=25)
+    parser.add_argument('--transactions', type=int, default=50)
+    parser.add_argument('--history-days', type=int, default=HISTORY_DAYS)
+    parser.add_argument('--as-of', type=datetime.fromisoformat, help="date the fixtures end at (default: now)")
+    parser.add_argument('--replace', action='store_true', help="delete the branch database first")
+    args = parser.parse_args()
+
+    if args.replace:
+        for path in (storage.get_db_path(args.branch), replica.get_replica_path(args.branch)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    report = seed(args.branch, args.seed, args.books, args.students, args.transactions, args.as_of, args.history_days)
+    print(f"seeded {report['books']} books, {report['students']} students, {report['transactions']} transactions "
+          f"({report['open_loans']} open) in {report['seconds']:.1f}s (rows loaded in {report['load_seconds']:.1f}s)")
+
+if __name__ == "__main__":
+    main()
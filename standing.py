@@ -0,0 +1,69 @@
+import argparse
+
+import policy
+import storage
+
+def init_standing(conn):
+    c = conn.cursor()
+
+    # OK / Warning / Blocked per patron from the oldest open due date, against the
+    # thresholds of the patron's type in patron_policy (see policy.py). Filtering on
+    # student_id is pushed into the view, so one patron costs a single probe of
+    # idx_transactions_open_student (student_id, due_date) WHERE status = 'Issued'.
+    # Due dates are written in local time, so "now" is too.
+    c.execute('DROP VIEW IF EXISTS patron_standing')
+    c.execute('''
+        CREATE VIEW patron_standing AS
+        SELECT s.student_id, s.patron_type, s.books_issued, p.max_loans, p.block_after_days,
+               MIN(t.due_date) as oldest_due,
+               CASE WHEN MIN(t.due_date) < datetime('now', 'localtime', -p.block_after_days || ' days') THEN 'Blocked'
+                    WHEN MIN(t.due_date) < datetime('now', 'localtime', -p.warn_after_days || ' days') THEN 'Warning'
+                    ELSE 'OK' END as standing
+        FROM students s
+        JOIN patron_policy p ON p.patron_type = s.patron_type
+        LEFT JOIN transactions t ON t.student_id = s.student_id AND t.status = 'Issued'
+        GROUP BY s.student_id
+    ''')
+
+def get_thresholds(conn, patron_type=None):
+    # (warn, block) for the patron type, by default the one new patrons get
+    c = conn.cursor()
+    c.execute('''
+        SELECT warn_after_days, block_after_days FROM patron_policy
+        WHERE patron_type IN (?, ?) ORDER BY patron_type = ? LIMIT 1
+    ''', (patron_type or policy.DEFAULT_PATRON_TYPE, policy.ANY, policy.ANY))
+    return tuple(c.fetchone())
+
+def set_thresholds(conn, warn_after_days=None, block_after_days=None, patron_type=None):
+    # Thresholds are fields of the loan rule for the patron type (None: every type)
+    policy.set_rule(conn, patron_type=patron_type, warn_after_days=warn_after_days, block_after_days=block_after_days)
+    return get_thresholds(conn, patron_type)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or change the patron standing thresholds")
+    parser.add_argument('--branch', help="branch to configure (default: all branches)")
+    parser.add_argument('--warn-after', type=int, help="days overdue before a patron is in Warning")
+    parser.add_argument('--block-after', type=int, help="days overdue before a patron is Blocked from borrowing")
+    parser.add_argument('--patron-type', help="thresholds for this patron type (default: every type)")
+    args = parser.parse_args()
+
+    branches = [args.branch] if args.branch else storage.get_branch_names()
+    for branch in branches:
+        storage.init_db(branch)
+        conn = storage.connect(branch)
+        try:
+            if args.warn_after is not None or args.block_after is not None:
+                try:
+                    set_thresholds(conn, args.warn_after, args.block_after, args.patron_type)
+                except ValueError as e:
+                    parser.error(str(e))
+            warn, block = get_thresholds(conn, args.patron_type)
+            c = conn.cursor()
+            c.execute('SELECT standing, COUNT(*) FROM patron_standing GROUP BY standing ORDER BY standing')
+            counts = ', '.join(f"{standing} {count}" for standing, count in c.fetchall())
+        finally:
+            conn.close()
+        print(f"[{branch}] Warning after {warn} days overdue, Blocked after {block} days ({counts})")
+
+if __name__ == "__main__":
+    main()
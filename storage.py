@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import analytics
+import changefeed
+import events
+import gate
+import maintenance
+import notifications
+import policy
+import reconcile
+import standing
+
+# Branch name -> database path. Override with a JSON file such as
+# {"Main": "library.db", "North": "/srv/library/north.db"}
+BRANCHES_FILE = Path(os.environ.get('LIBRARY_BRANCHES', 'branches.json'))
+DEFAULT_BRANCHES = {'Main': 'library.db'}
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='branch')
+_branches = None
+
+def load_branches():
+    global _branches
+    if _branches is None:
+        if BRANCHES_FILE.exists():
+            with open(BRANCHES_FILE) as f:
+                _branches = json.load(f)
+        else:
+            _branches = dict(DEFAULT_BRANCHES)
+    return _branches
+
+def get_branch_names():
+    return list(load_branches())
+
+def get_db_path(branch=None):
+    branches = load_branches()
+    if branch is None:
+        branch = next(iter(branches))
+    if branch not in branches:
+        raise KeyError(f"Unknown branch: {branch}")
+    return branches[branch]
+
+def connect(branch=None):
+    conn = sqlite3.connect(get_db_path(branch))
+    conn.row_factory = sqlite3.Row  # This enables column access by name
+    return conn
+
+def init_db(branch=None):
+    conn = sqlite3.connect(get_db_path(branch))
+    c = conn.cursor()
+
+    # New files hand free pages back in steps (see maintenance.py); an existing
+    # file keeps its mode until converted with --enable-incremental-vacuum
+    c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+    # Create tables if they don't exist
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            book_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            isbn TEXT NOT NULL,
+            category TEXT NOT NULL,
+            status TEXT DEFAULT 'Available'
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS students (
+            student_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            books_issued INTEGER DEFAULT 0,
+            patron_type TEXT NOT NULL DEFAULT 'Student'
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id TEXT PRIMARY KEY,
+            book_id TEXT,
+            student_id TEXT,
+            rfid TEXT NOT NULL,
+            issue_date TIMESTAMP NOT NULL,
+            due_date TIMESTAMP NOT NULL,
+            return_date TIMESTAMP,
+            status TEXT DEFAULT 'Issued',
+            fee REAL DEFAULT 0.0,
+            FOREIGN KEY (book_id) REFERENCES books (book_id),
+            FOREIGN KEY (student_id) REFERENCES students (student_id)
+        )
+    ''')
+
+    # Partial indexes over open loans
+    reconcile.init_indexes(conn)
+
+    # Loan rules and the per-category / per-patron-type terms compiled from them
+    policy.init_policy(conn)
+
+    # Patron standing (OK / Warning / Blocked) against those terms
+    standing.init_standing(conn)
+
+    # Append-only circulation log the tables above are projected from
+    events.init_events(conn)
+
+    # Pre-bucketed circulation aggregates for the trend charts
+    analytics.init_aggregates(conn)
+
+    # Overdue reminder outbox
+    notifications.init_outbox(conn)
+
+    # Numbered change log over transactions and books for incremental readers
+    changefeed.init_changefeed(conn)
+
+    # Last run of each maintenance job
+    maintenance.init_maintenance(conn)
+
+    # Exit-gate alarm log
+    gate.init_gate(conn)
+
+    conn.commit()
+    conn.close()
+
+class BranchResults:
+    def __init__(self):
+        self.results = {}
+        self.latencies = {}
+        self.errors = {}
+        self.wall_time = 0.0
+
+def _timed(branch, query, connect):
+    start = time.perf_counter()
+    result = None
+    error = None
+    try:
+        conn = connect(branch)
+        try:
+            result = query(conn)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        error = e
+    return time.perf_counter() - start, result, error
+
+def fan_out(query, branches=None, connect=connect):
+    # Run query(conn) against every branch in parallel on the shared pool.
+    # The wall time tracks the slowest branch rather than the sum of all of them.
+    branches = branches or get_branch_names()
+    out = BranchResults()
+    start = time.perf_counter()
+    futures = {branch: _executor.submit(_timed, branch, query, connect) for branch in branches}
+    for branch, future in futures.items():
+        elapsed, result, error = future.result()
+        out.latencies[branch] = elapsed
+        if error is None:
+            out.results[branch] = result
+        else:
+            out.errors[branch] = error
+    out.wall_time = time.perf_counter() - start
+    return out
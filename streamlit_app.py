@@ -1,1143 +1,892 @@
-import streamlit as st
-import pandas as pd
-from datetime import datetime, timedelta
-import re
-import json
-from pathlib import Path
-import sqlite3
-import time
-import random
-
-# Database setup
-def init_db():
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    
-    # Create tables if they don't exist
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            book_id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            isbn TEXT NOT NULL,
-            category TEXT NOT NULL,
-            status TEXT DEFAULT 'Available'
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS students (
-            student_id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            books_issued INTEGER DEFAULT 0
-        )
-    ''')
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            transaction_id TEXT PRIMARY KEY,
-            book_id TEXT,
-            student_id TEXT,
-            rfid TEXT NOT NULL,
-            issue_date TIMESTAMP NOT NULL,
-            due_date TIMESTAMP NOT NULL,
-            return_date TIMESTAMP,
-            status TEXT DEFAULT 'Issued',
-            fee REAL DEFAULT 0.0,
-            FOREIGN KEY (book_id) REFERENCES books (book_id),
-            FOREIGN KEY (student_id) REFERENCES students (student_id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    try:
-        conn = sqlite3.connect('library.db')
-        conn.row_factory = sqlite3.Row  # This enables column access by name
-        return conn
-    except sqlite3.Error as e:
-        st.error(f"Database connection error: {str(e)}")
-        return None
-
-# Page Configuration
-st.set_page_config(
-    page_title="Library Management System",
-    page_icon="📚",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Custom CSS
-st.markdown("""
-    <style>
-    /* Base theme */
-    .stApp {
-        background-color: #0a0a0a;
-        color: #ffffff;
-    }
-    
-    /* Components */
-    .stButton>button {
-        background-color: #ff0000;
-        color: white;
-        border: none;
-        padding: 0.7rem 1.5rem;
-        border-radius: 6px;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-        width: 100%;
-    }
-    
-    .stButton>button:hover {
-        background-color: #cc0000;
-        transform: translateY(-2px);
-        box-shadow: 0 5px 15px rgba(255, 0, 0, 0.3);
-    }
-    
-    /* Input fields */
-    .stTextInput>div>div>input,
-    .stSelectbox>div>div {
-        background-color: #1a1a1a !important;
-        color: white !important;
-        border: 2px solid #333333 !important;
-        border-radius: 6px !important;
-        padding: 0.5rem !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stTextInput>div>div>input:focus,
-    .stSelectbox>div>div:focus {
-        border-color: #ff0000 !important;
-        box-shadow: 0 0 0 2px rgba(255, 0, 0, 0.2) !important;
-    }
-    
-    /* Tables */
-    .dataframe {
-        background-color: #1a1a1a !important;
-        color: white !important;
-        border: none !important;
-        border-radius: 8px !important;
-        overflow: hidden !important;
-        width: 100% !important;
-    }
-    
-    .dataframe th {
-        background-color: #0a0a0a !important;
-        color: #ff0000 !important;
-        font-weight: 600 !important;
-        padding: 1rem !important;
-        border-bottom: 2px solid #333333 !important;
-        text-align: left !important;
-    }
-    
-    .dataframe td {
-        background-color: #1a1a1a !important;
-        color: white !important;
-        padding: 0.8rem 1rem !important;
-        border-bottom: 1px solid #333333 !important;
-        text-align: left !important;
-    }
-    
-    .dataframe tr:hover td {
-        background-color: #222222 !important;
-    }
-    
-    /* Cards and containers */
-    .metric-card {
-        background-color: #1a1a1a;
-        border: 1px solid #333333;
-        border-radius: 12px;
-        padding: 1.5rem;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        margin-bottom: 1rem;
-    }
-    
-    .metric-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 15px rgba(255, 0, 0, 0.2);
-        border-color: #ff0000;
-    }
-    
-    /* Search container */
-    .search-container {
-        background-color: #1a1a1a;
-        padding: 1.5rem;
-        border-radius: 12px;
-        margin-bottom: 1.5rem;
-        border: 1px solid #333333;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Stats card */
-    .stats-card {
-        background-color: #1a1a1a;
-        border: 1px solid #333333;
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin-bottom: 1.5rem;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    
-    /* Sidebar */
-    .css-1d391kg {
-        background-color: #0a0a0a;
-    }
-    
-    .css-1d391kg .stButton>button {
-        width: 100%;
-    }
-    
-    /* Alerts and messages */
-    .stAlert, .stInfo, .stSuccess, .stError {
-        background-color: #1a1a1a !important;
-        color: white !important;
-        border: 1px solid #333333 !important;
-        border-radius: 8px !important;
-        padding: 1rem !important;
-        margin: 1rem 0 !important;
-    }
-    
-    /* Tabs */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 1rem;
-        border-bottom: 2px solid #333333;
-        padding-bottom: 0.5rem;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        background-color: #1a1a1a;
-        color: white;
-        border-radius: 6px;
-        transition: all 0.3s ease;
-        padding: 0.8rem 1.5rem;
-        font-weight: 500;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: #ff0000;
-        color: white;
-        font-weight: 600;
-        transform: translateY(-2px);
-        box-shadow: 0 4px 6px rgba(255, 0, 0, 0.2);
-    }
-    
-    /* Forms */
-    .stForm {
-        background-color: #1a1a1a;
-        border: 1px solid #333333;
-        border-radius: 12px;
-        padding: 1.5rem;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        margin-bottom: 1.5rem;
-    }
-    
-    /* Expander */
-    .streamlit-expanderHeader {
-        background-color: #1a1a1a !important;
-        border: 1px solid #333333 !important;
-        border-radius: 8px !important;
-        color: white !important;
-        font-weight: 600 !important;
-        padding: 1rem !important;
-    }
-    
-    .streamlit-expanderHeader:hover {
-        border-color: #ff0000 !important;
-    }
-    
-    /* Footer */
-    .footer {
-        background-color: #0a0a0a;
-        border-top: 1px solid #333333;
-        padding: 1.5rem 0;
-        margin-top: 2rem;
-        text-align: center;
-    }
-    
-    /* Status badges */
-    .status-ok {
-        background-color: #1a472a !important;
-        color: #4caf50 !important;
-        padding: 6px 12px !important;
-        border-radius: 6px !important;
-        font-weight: 600 !important;
-        text-transform: uppercase !important;
-        letter-spacing: 0.5px !important;
-    }
-    
-    .status-warning {
-        background-color: #4a3c00 !important;
-        color: #ffd700 !important;
-        padding: 6px 12px !important;
-        border-radius: 6px !important;
-        font-weight: 600 !important;
-        text-transform: uppercase !important;
-        letter-spacing: 0.5px !important;
-    }
-    
-    .status-blocked {
-        background-color: #4a0000 !important;
-        color: #ff4444 !important;
-        padding: 6px 12px !important;
-        border-radius: 6px !important;
-        font-weight: 600 !important;
-        text-transform: uppercase !important;
-        letter-spacing: 0.5px !important;
-    }
-    
-    /* RFID Scanner */
-    .rfid-container {
-        background-color: #1a1a1a;
-        padding: 1.5rem;
-        border-radius: 12px;
-        border: 1px solid #333333;
-        margin-bottom: 1.5rem;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    </style>
-""", unsafe_allow_html=True)
-
-# Add greeting
-st.markdown("""
-    <div class="greeting">
-        Hello Medha ma'am! 👋
-    </div>
-""", unsafe_allow_html=True)
-
-# Data Classes
-class Book:
-    def __init__(self, book_id, title, author, isbn, category, status='Available'):
-        self.book_id = book_id
-        self.title = title
-        self.author = author
-        self.isbn = isbn
-        self.category = category
-        self.status = status
-
-class Student:
-    def __init__(self, student_id, name, email, phone, books_issued=0):
-        self.student_id = student_id
-        self.name = name
-        self.email = email
-        self.phone = phone
-        self.books_issued = books_issued
-        self.transactions = []
-
-class Transaction:
-    def __init__(self, transaction_id, book_id, student_id, rfid, issue_date, due_date, return_date=None, status='Issued', fee=0.0):
-        self.transaction_id = transaction_id
-        self.book_id = book_id
-        self.student_id = student_id
-        self.rfid = rfid
-        self.issue_date = issue_date
-        self.due_date = due_date
-        self.return_date = return_date
-        self.status = status
-        self.fee = fee
-
-# Initialize session state
-if 'books' not in st.session_state:
-    st.session_state.books = []
-if 'students' not in st.session_state:
-    st.session_state.students = []
-if 'transactions' not in st.session_state:
-    st.session_state.transactions = []
-
-def render_header():
-    st.markdown("""
-        <div style='text-align: center; padding: 2rem 0; background-color: #1a1a1a; border-radius: 12px; margin-bottom: 2rem; box-shadow: 0 4px 6px rgba(255, 0, 0, 0.2);'>
-            <h1 style='color: #ff0000; font-size: 3.5rem; margin-bottom: 0.5rem; font-weight: 800; text-transform: uppercase; letter-spacing: 2px; text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);'>PAAD LIBRARY</h1>
-            <p style='color: #ffffff; font-size: 1.2rem; opacity: 0.9; letter-spacing: 1px;'>Professional RFID-Based Library Management System</p>
-            <div style='margin-top: 1rem; padding: 0.5rem; background-color: #0a0a0a; border-radius: 6px; display: inline-block;'>
-                <p style='color: #ff0000; font-size: 1rem; margin: 0; font-weight: 600;'>📚 Knowledge is Power 📚</p>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-
-def render_metrics():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get total books
-    c.execute('SELECT COUNT(*) FROM books')
-    total_books = c.fetchone()[0]
-    
-    # Get total students
-    c.execute('SELECT COUNT(*) FROM students')
-    total_students = c.fetchone()[0]
-    
-    # Get active issues
-    c.execute('SELECT COUNT(*) FROM transactions WHERE status = "Issued"')
-    active_issues = c.fetchone()[0]
-    
-    # Get overdue books
-    c.execute('''
-        SELECT COUNT(*) FROM transactions 
-        WHERE status = "Issued" AND due_date < datetime('now')
-    ''')
-    overdue_books = c.fetchone()[0]
-    
-    conn.close()
-    
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown(f"""
-            <div class='metric-card'>
-                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>📚 Total Books</h3>
-                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{total_books}</p>
-            </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-            <div class='metric-card'>
-                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>👥 Total Students</h3>
-                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{total_students}</p>
-            </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown(f"""
-            <div class='metric-card'>
-                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>📖 Active Issues</h3>
-                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{active_issues}</p>
-            </div>
-        """, unsafe_allow_html=True)
-    
-    with col4:
-        st.markdown(f"""
-            <div class='metric-card'>
-                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>⏰ Overdue Books</h3>
-                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{overdue_books}</p>
-            </div>
-        """, unsafe_allow_html=True)
-
-def render_forms():
-    st.sidebar.markdown("### 📝 Quick Actions")
-    
-    with st.sidebar.expander("➕ Add New Book", expanded=False):
-        with st.form("add_book_form"):
-            st.markdown("#### Add New Book")
-            book_id = st.text_input("Book ID (3 digits)")
-            title = st.text_input("Book Title")
-            author = st.text_input("Author")
-            isbn = st.text_input("ISBN")
-            category = st.selectbox(
-                "Category",
-                ["Fiction", "Non-Fiction", "Science", "Technology", "History", "Biography", "Other"]
-            )
-            if st.form_submit_button("Add Book"):
-                if add_book(book_id, title, author, isbn, category):
-                    st.success("✅ Book added successfully!")
-    
-    with st.sidebar.expander("➕ Add New Student", expanded=False):
-        with st.form("add_student_form"):
-            st.markdown("#### Add New Student")
-            student_id = st.text_input("Student ID (8 alphanumeric)")
-            name = st.text_input("Student Name")
-            email = st.text_input("Email")
-            phone = st.text_input("Phone")
-            if st.form_submit_button("Add Student"):
-                if add_student(student_id, name, email, phone):
-                    st.success("✅ Student added successfully!")
-    
-    with st.sidebar.expander("📖 Issue Book", expanded=False):
-        with st.form("issue_book_form"):
-            st.markdown("#### Issue Book")
-            book_id = st.text_input("Book ID")
-            student_id = st.text_input("Student ID")
-            rfid = st.text_input("RFID Tag")
-            if st.form_submit_button("Issue Book"):
-                if issue_book(book_id, student_id, rfid):
-                    st.success("✅ Book issued successfully!")
-    
-    with st.sidebar.expander("📥 Return Book", expanded=False):
-        with st.form("return_book_form"):
-            st.markdown("#### Return Book")
-            book_id = st.text_input("Book ID")
-            student_id = st.text_input("Student ID")
-            if st.form_submit_button("Return Book"):
-                if return_book(book_id, student_id):
-                    st.success("✅ Book returned successfully!")
-
-def render_tables():
-    tab1, tab2, tab3 = st.tabs(["📚 Books", "👥 Students", "📖 Transactions"])
-    
-    conn = get_db_connection()
-    if not conn:
-        st.error("Failed to connect to database")
-        return
-        
-    c = conn.cursor()
-    
-    try:
-        with tab1:
-            c.execute('SELECT * FROM books')
-            books = c.fetchall()
-            if books:
-                books_df = pd.DataFrame(books, columns=['book_id', 'title', 'author', 'isbn', 'category', 'status'])
-                st.dataframe(
-                    books_df.style.apply(
-                        lambda x: ['background-color: #ff0000; color: #ffffff;' if v == 'Issued' else '' for v in x],
-                        axis=1
-                    ),
-                    use_container_width=True
-                )
-            else:
-                st.info("No books in the library yet.")
-        
-        with tab2:
-            c.execute('''
-                SELECT 
-                    s.student_id,
-                    s.name,
-                    s.email,
-                    s.phone,
-                    s.books_issued,
-                    COUNT(t.transaction_id) as active_issues,
-                    SUM(CASE WHEN t.status = 'Issued' AND t.due_date < datetime('now') THEN 1 ELSE 0 END) as overdue_books,
-                    MAX(CASE WHEN t.status = 'Issued' AND t.due_date < datetime('now') 
-                        THEN julianday('now') - julianday(t.due_date) ELSE 0 END) as max_overdue_days,
-                    SUM(CASE WHEN t.status = 'Issued' AND t.due_date < datetime('now') 
-                        THEN (julianday('now') - julianday(t.due_date)) * 10 ELSE 0 END) as total_due_fee
-                FROM students s
-                LEFT JOIN transactions t ON s.student_id = t.student_id AND t.status = 'Issued'
-                GROUP BY s.student_id
-            ''')
-            students = c.fetchall()
-            
-            if students:
-                students_data = []
-                for student in students:
-                    # Get current books for this student
-                    c.execute('''
-                        SELECT b.title, t.issue_date, t.due_date, t.fee
-                        FROM transactions t
-                        JOIN books b ON t.book_id = b.book_id
-                        WHERE t.student_id = ? AND t.status = 'Issued'
-                    ''', (student['student_id'],))
-                    current_books = c.fetchall()
-                    
-                    library_status = 'OK'
-                    if student['max_overdue_days'] > 14:
-                        library_status = 'Blocked'
-                    elif student['overdue_books'] > 0:
-                        library_status = 'Warning'
-                    
-                    current_books_list = []
-                    issue_dates = []
-                    due_dates = []
-                    book_fees = []
-                    
-                    for book in current_books:
-                        current_books_list.append(book['title'])
-                        # Format dates
-                        try:
-                            issue_date = datetime.strptime(book['issue_date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y')
-                            due_date = datetime.strptime(book['due_date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y')
-                        except:
-                            issue_date = book['issue_date']
-                            due_date = book['due_date']
-                        
-                        issue_dates.append(issue_date)
-                        due_dates.append(due_date)
-                        book_fees.append(f"₹{float(book['fee']):.2f}" if book['fee'] else "₹0.00")
-                    
-                    students_data.append({
-                        'student_id': student['student_id'],
-                        'name': student['name'],
-                        'email': student['email'],
-                        'phone': student['phone'],
-                        'books_issued': student['books_issued'],
-                        'current_books': '\n'.join(current_books_list) if current_books_list else 'No books issued',
-                        'issue_dates': '\n'.join(issue_dates) if issue_dates else 'N/A',
-                        'due_dates': '\n'.join(due_dates) if due_dates else 'N/A',
-                        'book_fees': '\n'.join(book_fees) if book_fees else 'N/A',
-                        'overdue_books': student['overdue_books'],
-                        'max_overdue_days': int(student['max_overdue_days']),
-                        'library_status': library_status,
-                        'total_due_fee': f"₹{float(student['total_due_fee']):.2f}" if student['total_due_fee'] else "₹0.00"
-                    })
-                
-                students_df = pd.DataFrame(students_data)
-                st.dataframe(
-                    students_df.style.applymap(
-                        lambda x: 'background-color: #4a0000; color: #ff4444;' if x == 'Blocked'
-                        else 'background-color: #4a3c00; color: #ffd700;' if x == 'Warning'
-                        else 'background-color: #1a472a; color: #4caf50;',
-                        subset=['library_status']
-                    ),
-                    use_container_width=True
-                )
-                
-                st.markdown("""
-                    <div style='background-color: #1a1a1a; border: 1px solid #ffd700; padding: 1rem; border-radius: 8px; margin-top: 1rem;'>
-                        <h4 style='color: #ffd700; margin-bottom: 0.5rem;'>Status Legend:</h4>
-                        <p style='color: #4caf50;'>🟢 OK - No overdue books</p>
-                        <p style='color: #ffd700;'>🟠 Warning - Has overdue books</p>
-                        <p style='color: #ff4444;'>🔴 Blocked - Overdue for more than 14 days</p>
-                    </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.info("No students registered yet.")
-        
-        with tab3:
-            c.execute('''
-                SELECT 
-                    t.transaction_id,
-                    t.book_id,
-                    b.title as book_title,
-                    t.student_id,
-                    s.name as student_name,
-                    t.rfid,
-                    t.issue_date,
-                    t.due_date,
-                    t.return_date,
-                    t.status,
-                    t.fee
-                FROM transactions t
-                JOIN books b ON t.book_id = b.book_id
-                JOIN students s ON t.student_id = s.student_id
-                ORDER BY t.issue_date DESC
-            ''')
-            transactions = c.fetchall()
-            
-            if transactions:
-                transactions_data = []
-                for t in transactions:
-                    # Convert dates to consistent format
-                    try:
-                        issue_date = datetime.strptime(t['issue_date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y')
-                        due_date = datetime.strptime(t['due_date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y')
-                        return_date = datetime.strptime(t['return_date'], '%Y-%m-%d %H:%M:%S.%f').strftime('%d-%m-%Y') if t['return_date'] else None
-                    except:
-                        issue_date = t['issue_date']
-                        due_date = t['due_date']
-                        return_date = t['return_date']
-                    
-                    transactions_data.append({
-                        'transaction_id': t['transaction_id'],
-                        'book_id': t['book_id'],
-                        'book_title': t['book_title'],
-                        'student_id': t['student_id'],
-                        'student_name': t['student_name'],
-                        'rfid': t['rfid'],
-                        'issue_date': issue_date,
-                        'due_date': due_date,
-                        'return_date': return_date,
-                        'status': t['status'],
-                        'fee': f"₹{float(t['fee']):.2f}" if t['fee'] else "₹0.00"
-                    })
-                
-                transactions_df = pd.DataFrame(transactions_data)
-                st.dataframe(
-                    transactions_df.style.apply(
-                        lambda x: ['background-color: #ff0000; color: #ffffff;' 
-                                 if x['status'] == 'Issued' and pd.notnull(x['due_date']) 
-                                 and datetime.strptime(x['due_date'], '%d-%m-%Y') < datetime.now() else '' 
-                                 for _ in x],
-                        axis=1
-                    ),
-                    use_container_width=True
-                )
-            else:
-                st.info("No transactions recorded yet.")
-    except Exception as e:
-        st.error(f"Error displaying tables: {str(e)}")
-    finally:
-        conn.close()
-
-def render_rfid_scanner():
-    st.markdown("""
-        <div class="rfid-container">
-            <h3 style='color: #ff0000; margin-bottom: 1rem; font-weight: 600; text-transform: uppercase; letter-spacing: 0.5px;'>📱 RFID Scanner</h3>
-            <p style='color: #ffffff; opacity: 0.9; margin-bottom: 1rem;'>Place the book near the scanner to read its RFID tag</p>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    if st.button("🔍 Scan RFID", use_container_width=True):
-        with st.spinner("Scanning..."):
-            time.sleep(1)
-            rfid = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=6))
-            st.session_state.current_rfid = rfid
-            st.success(f"Scanned RFID: {rfid}")
-    
-    if 'current_rfid' in st.session_state:
-        st.markdown(f"""
-            <div style='background-color: #1a1a1a; padding: 1rem; border-radius: 8px; border: 1px solid #333333; margin-top: 1rem;'>
-                <p style='color: #ffffff; margin: 0;'>
-                    Current RFID: <strong style='color: #ff0000;'>{st.session_state.current_rfid}</strong>
-                </p>
-            </div>
-        """, unsafe_allow_html=True)
-
-def add_book(book_id, title, author, isbn, category):
-    if not book_id or not title or not author or not isbn or not category:
-        st.error("All fields are required!")
-        return False
-    
-    if not book_id.isdigit() or len(book_id) != 3:
-        st.error("Book ID must be 3 digits!")
-        return False
-    
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    try:
-        c.execute('SELECT book_id FROM books WHERE book_id = ?', (book_id,))
-        if c.fetchone():
-            st.error("Book ID already exists!")
-            return False
-        
-        c.execute('''
-            INSERT INTO books (book_id, title, author, isbn, category)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (book_id, title, author, isbn, category))
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"Error adding book: {str(e)}")
-        return False
-    finally:
-        conn.close()
-
-def add_student(student_id, name, email, phone):
-    if not student_id or not name or not email or not phone:
-        st.error("All fields are required!")
-        return False
-    
-    if not re.match(r'^[A-Za-z0-9]{8}$', student_id):
-        st.error("Student ID must be 8 alphanumeric characters!")
-        return False
-    
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    try:
-        c.execute('SELECT student_id FROM students WHERE student_id = ?', (student_id,))
-        if c.fetchone():
-            st.error("Student ID already exists!")
-            return False
-        
-        c.execute('''
-            INSERT INTO students (student_id, name, email, phone)
-            VALUES (?, ?, ?, ?)
-        ''', (student_id, name, email, phone))
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"Error adding student: {str(e)}")
-        return False
-    finally:
-        conn.close()
-
-def issue_book(book_id, student_id, rfid):
-    if not book_id or not student_id or not rfid:
-        st.error("All fields are required!")
-        return False
-    
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    try:
-        # Check book availability
-        c.execute('SELECT status FROM books WHERE book_id = ?', (book_id,))
-        book = c.fetchone()
-        if not book:
-            st.error("Book not found!")
-            return False
-        if book[0] == 'Issued':
-            st.error("Book is already issued!")
-            return False
-        
-        # Check student's book limit
-        c.execute('SELECT books_issued FROM students WHERE student_id = ?', (student_id,))
-        student = c.fetchone()
-        if not student:
-            st.error("Student not found!")
-            return False
-        if student[0] >= 3:
-            st.error("Student has reached maximum book limit!")
-            return False
-        
-        # Create transaction
-        issue_date = datetime.now()
-        due_date = issue_date + timedelta(days=14)
-        transaction_id = f"T{len(get_all_transactions()) + 1:03d}"
-        
-        c.execute('''
-            INSERT INTO transactions 
-            (transaction_id, book_id, student_id, rfid, issue_date, due_date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (transaction_id, book_id, student_id, rfid, issue_date, due_date))
-        
-        # Update book and student status
-        c.execute('UPDATE books SET status = ? WHERE book_id = ?', ('Issued', book_id))
-        c.execute('UPDATE students SET books_issued = books_issued + 1 WHERE student_id = ?', (student_id,))
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"Error issuing book: {str(e)}")
-        return False
-    finally:
-        conn.close()
-
-def return_book(book_id, student_id):
-    if not book_id or not student_id:
-        st.error("All fields are required!")
-        return False
-    
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    try:
-        # Check book status
-        c.execute('SELECT status FROM books WHERE book_id = ?', (book_id,))
-        book = c.fetchone()
-        if not book:
-            st.error("Book not found!")
-            return False
-        if book[0] == 'Available':
-            st.error("Book is already available!")
-            return False
-        
-        # Check student
-        c.execute('SELECT student_id FROM students WHERE student_id = ?', (student_id,))
-        if not c.fetchone():
-            st.error("Student not found!")
-            return False
-        
-        # Get active transaction
-        c.execute('''
-            SELECT transaction_id, due_date 
-            FROM transactions 
-            WHERE book_id = ? AND student_id = ? AND status = 'Issued'
-        ''', (book_id, student_id))
-        transaction = c.fetchone()
-        
-        if not transaction:
-            st.error("No active issue found for this book and student!")
-            return False
-        
-        # Calculate fee
-        return_date = datetime.now()
-        due_date = datetime.strptime(transaction[1], '%Y-%m-%d %H:%M:%S.%f')
-        days_overdue = (return_date - due_date).days if return_date > due_date else 0
-        fee = days_overdue * 10
-        
-        # Update transaction
-        c.execute('''
-            UPDATE transactions 
-            SET return_date = ?, status = 'Returned', fee = ?
-            WHERE transaction_id = ?
-        ''', (return_date, fee, transaction[0]))
-        
-        # Update book and student status
-        c.execute('UPDATE books SET status = ? WHERE book_id = ?', ('Available', book_id))
-        c.execute('UPDATE students SET books_issued = books_issued - 1 WHERE student_id = ?', (student_id,))
-        
-        conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"Error returning book: {str(e)}")
-        return False
-    finally:
-        conn.close()
-
-def get_all_books():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM books')
-    books = c.fetchall()
-    conn.close()
-    return books
-
-def get_all_students():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM students')
-    students = c.fetchall()
-    conn.close()
-    return students
-
-def get_all_transactions():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT * FROM transactions')
-    transactions = c.fetchall()
-    conn.close()
-    return transactions
-
-def initialize_sample_data():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    try:
-        # Check if data already exists
-        c.execute('SELECT COUNT(*) FROM books')
-        if c.fetchone()[0] > 0:
-            return
-        
-        # Add sample books
-        categories = ["Fiction", "Non-Fiction", "Science", "Technology", "History", "Biography", "Mathematics", "Physics", "Chemistry", "Biology", "Computer Science", "Literature", "Philosophy", "Psychology", "Economics"]
-        authors = ["John Smith", "Jane Doe", "Robert Johnson", "Emily Brown", "Michael Wilson", "Sarah Davis", "David Miller", "Lisa Anderson", "James Taylor", "Mary Thomas"]
-        
-        for i in range(100):
-            book_id = f"{i+1:03d}"
-            title = f"Book {i+1}"
-            author = random.choice(authors)
-            isbn = f"978-{random.randint(1000000000, 9999999999)}"
-            category = random.choice(categories)
-            status = "Available" if random.random() > 0.3 else "Issued"
-            
-            c.execute('''
-                INSERT INTO books (book_id, title, author, isbn, category, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (book_id, title, author, isbn, category, status))
-        
-        # Add sample students
-        first_names = ["John", "Jane", "Michael", "Emily", "David", "Sarah", "James", "Lisa", "Robert", "Mary", "William", "Emma", "Daniel", "Sophia", "Matthew"]
-        last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson"]
-        
-        for i in range(25):
-            student_id = f"STU{i+1:03d}"
-            name = f"{random.choice(first_names)} {random.choice(last_names)}"
-            email = f"{name.lower().replace(' ', '.')}@example.com"
-            phone = f"{random.randint(1000000000, 9999999999)}"
-            books_issued = random.randint(0, 3)
-            
-            c.execute('''
-                INSERT INTO students (student_id, name, email, phone, books_issued)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (student_id, name, email, phone, books_issued))
-        
-        # Add sample transactions
-        for _ in range(50):
-            c.execute('SELECT book_id FROM books WHERE status = "Issued" ORDER BY RANDOM() LIMIT 1')
-            book = c.fetchone()
-            if not book:
-                continue
-                
-            c.execute('SELECT student_id FROM students ORDER BY RANDOM() LIMIT 1')
-            student = c.fetchone()
-            if not student:
-                continue
-            
-            issue_date = datetime.now() - timedelta(days=random.randint(1, 30))
-            due_date = issue_date + timedelta(days=14)
-            return_date = None if random.random() > 0.5 else due_date + timedelta(days=random.randint(1, 10))
-            status = "Issued" if return_date is None else "Returned"
-            fee = 0 if return_date is None else max(0, (return_date - due_date).days * 10)
-            
-            transaction_id = f"T{_+1:03d}"
-            rfid = f"RFID{random.randint(1000, 9999)}"
-            
-            c.execute('''
-                INSERT INTO transactions 
-                (transaction_id, book_id, student_id, rfid, issue_date, due_date, return_date, status, fee)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (transaction_id, book[0], student[0], rfid, issue_date, due_date, return_date, status, fee))
-        
-        conn.commit()
-    except Exception as e:
-        st.error(f"Error initializing sample data: {str(e)}")
-    finally:
-        conn.close()
-
-def render_search():
-    st.markdown("""
-        <div class="search-container">
-            <h3 style='color: #ff0000; margin-bottom: 1rem;'>🔍 Search Library</h3>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    col1, col2 = st.columns(2)
-    with col1:
-        search_type = st.selectbox("Search by", ["Books", "Students", "Transactions"])
-    with col2:
-        search_query = st.text_input("Enter search term")
-    
-    if search_query:
-        conn = get_db_connection()
-        c = conn.cursor()
-        
-        try:
-            if search_type == "Books":
-                c.execute('''
-                    SELECT * FROM books 
-                    WHERE LOWER(title) LIKE ? 
-                    OR LOWER(author) LIKE ? 
-                    OR book_id LIKE ?
-                ''', (f'%{search_query.lower()}%', f'%{search_query.lower()}%', f'%{search_query}%'))
-                results = c.fetchall()
-                
-                if results:
-                    st.success(f"Found {len(results)} books")
-                    books_df = pd.DataFrame(results, columns=['book_id', 'title', 'author', 'isbn', 'category', 'status'])
-                    st.dataframe(books_df, use_container_width=True)
-                else:
-                    st.warning("No books found")
-            
-            elif search_type == "Students":
-                c.execute('''
-                    SELECT * FROM students 
-                    WHERE LOWER(name) LIKE ? 
-                    OR student_id LIKE ?
-                ''', (f'%{search_query.lower()}%', f'%{search_query}%'))
-                results = c.fetchall()
-                
-                if results:
-                    st.success(f"Found {len(results)} students")
-                    students_df = pd.DataFrame(results, columns=['student_id', 'name', 'email', 'phone', 'books_issued'])
-                    st.dataframe(students_df, use_container_width=True)
-                else:
-                    st.warning("No students found")
-            
-            else:  # Transactions
-                c.execute('''
-                    SELECT * FROM transactions 
-                    WHERE transaction_id LIKE ? 
-                    OR book_id LIKE ? 
-                    OR student_id LIKE ?
-                ''', (f'%{search_query}%', f'%{search_query}%', f'%{search_query}%'))
-                results = c.fetchall()
-                
-                if results:
-                    st.success(f"Found {len(results)} transactions")
-                    transactions_df = pd.DataFrame(results, columns=['transaction_id', 'book_id', 'student_id', 'rfid', 'issue_date', 'due_date', 'return_date', 'status', 'fee'])
-                    st.dataframe(transactions_df, use_container_width=True)
-                else:
-                    st.warning("No transactions found")
-        finally:
-            conn.close()
-
-def render_stats():
-    st.markdown("""
-        <div class="stats-card">
-            <h3 style='color: #ff0000; margin-bottom: 1rem;'>📊 Library Statistics</h3>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    col1, col2, col3 = st.columns(3)
-    
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    try:
-        with col1:
-            # Category distribution
-            c.execute('''
-                SELECT category, COUNT(*) as count 
-                FROM books 
-                GROUP BY category 
-                ORDER BY count DESC
-            ''')
-            categories = c.fetchall()
-            
-            st.markdown("#### Book Categories")
-            for category, count in categories:
-                st.markdown(f"""
-                    <div style='background-color: #1a1a1a; padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;'>
-                        <span style='color: #ffffff;'>{category}:</span>
-                        <span style='color: #ff0000; float: right;'>{count}</span>
-                    </div>
-                """, unsafe_allow_html=True)
-        
-        with col2:
-            # Overdue books
-            c.execute('''
-                SELECT b.title, s.name, t.due_date
-                FROM transactions t
-                JOIN books b ON t.book_id = b.book_id
-                JOIN students s ON t.student_id = s.student_id
-                WHERE t.status = 'Issued' AND t.due_date < datetime('now')
-            ''')
-            overdue_books = c.fetchall()
-            
-            st.markdown("#### Overdue Books")
-            if overdue_books:
-                for title, name, due_date in overdue_books:
-                    days_overdue = (datetime.now() - datetime.strptime(due_date, '%Y-%m-%d %H:%M:%S.%f')).days
-                    st.markdown(f"""
-                        <div style='background-color: #1a1a1a; padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;'>
-                            <div style='color: #ffffff;'>{title}</div>
-                            <div style='color: #ff0000; font-size: 0.9rem;'>
-                                {name} - {days_overdue} days overdue
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.success("No overdue books")
-        
-        with col3:
-            # Popular books
-            c.execute('''
-                SELECT b.title, COUNT(*) as issue_count
-                FROM transactions t
-                JOIN books b ON t.book_id = b.book_id
-                GROUP BY b.book_id
-                ORDER BY issue_count DESC
-                LIMIT 5
-            ''')
-            popular_books = c.fetchall()
-            
-            st.markdown("#### Popular Books")
-            for title, issues in popular_books:
-                st.markdown(f"""
-                    <div style='background-color: #1a1a1a; padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;'>
-                        <div style='color: #ffffff;'>{title}</div>
-                        <div style='color: #ff0000; font-size: 0.9rem;'>
-                            {issues} issues
-                        </div>
-                    </div>
-                """, unsafe_allow_html=True)
-    finally:
-        conn.close()
-
-def main():
-    # Initialize database
-    init_db()
-    
-    # Initialize sample data if database is empty
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM books')
-    if c.fetchone()[0] == 0:
-        initialize_sample_data()
-    conn.close()
-    
-    render_header()
-    
-    # Add RFID Scanner to sidebar
-    with st.sidebar:
-        render_rfid_scanner()
-        st.markdown("---")
-    
-    render_metrics()
-    render_search()
-    render_stats()
-    render_forms()
-    render_tables()
-    
-    # Footer
-    st.markdown("---")
-    st.markdown("""
-        <div class='footer' style='text-align: center;'>
-            <p style='color: #ffffff; font-size: 0.9rem; opacity: 0.8;'>© 2024 Library Management System | Made with ❤️</p>
-        </div>
-    """, unsafe_allow_html=True)
-
-if __name__ == "__main__":
-    main()
-
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from datetime import datetime
+import json
+import os
+import re
+from pathlib import Path
+import sqlite3
+import time
+import random
+import analytics
+import changefeed
+import circulation
+import frames
+import isbn_index
+import maintenance
+import notifications
+import policy
+import queries
+import replica
+import search_index
+import seed
+import standing
+import storage
+import writer
+
+SCRIPT_START = time.perf_counter()
+
+# Database setup
+ALL_BRANCHES = "All branches"
+
+# Live activity panel: seconds between auto-refreshes and changes listed
+LIVE_REFRESH_SECONDS = 5
+LIVE_ACTIVITY_ROWS = 15
+# How often the live loop wakes; a click waits at most this long to be handled
+LIVE_POLL_SECONDS = 0.5
+
+@st.cache_resource
+def bootstrap():
+    # Runs once per process, not on every rerun: schema setup, sample data for
+    # empty branches and the replica scheduler. Returns errors to show.
+    errors = []
+    for branch in storage.get_branch_names():
+        storage.init_db(branch)
+        conn = storage.connect(branch)
+        c = conn.cursor()
+        c.execute('SELECT COUNT(*) FROM books')
+        if c.fetchone()[0] == 0:
+            try:
+                seed.seed(branch)
+            except ValueError:
+                pass  # another process seeded it first
+            except Exception as e:
+                errors.append(f"Error initializing sample data: {str(e)}")
+        conn.close()
+        # Snapshots pick up schema changes and sample data straight away
+        replica.refresh(branch)
+    
+    # Keep the dashboard snapshots fresh in the background
+    replica.start_scheduler()
+    maintenance.start_scheduler()
+    return errors
+
+@st.cache_resource
+def load_css():
+    # style.css minified once per process
+    css = (Path(__file__).parent / 'style.css').read_text()
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};:,>])\s*', r'\1', css)
+    return f"<style>{css.replace(';}', '}').strip()}</style>"
+
+def get_selected_branches():
+    branch = st.session_state.get('branch')
+    if branch == ALL_BRANCHES:
+        return storage.get_branch_names()
+    return [branch or storage.get_branch_names()[0]]
+
+def get_db_connection(branch=None, read_only=False):
+    # read_only connections go to the branch's snapshot replica so heavy reads
+    # never hold up circulation writes on the primary
+    connect = replica.connect if read_only else storage.connect
+    try:
+        return connect(branch or get_selected_branches()[0])
+    except sqlite3.Error as e:
+        st.error(f"Database connection error: {str(e)}")
+        return None
+
+def query_branches(query, read_only=False):
+    connect = replica.connect if read_only else storage.connect
+    results = storage.fan_out(query, get_selected_branches(), connect)
+    for branch, error in results.errors.items():
+        st.error(f"{branch}: {str(error)}")
+    return results
+
+# Page Configuration
+st.set_page_config(
+    page_title="Library Management System",
+    page_icon="📚",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Custom CSS
+st.markdown(load_css(), unsafe_allow_html=True)
+
+# Add greeting
+st.markdown("""
+    <div class="greeting">
+        Hello Medha ma'am! 👋
+    </div>
+""", unsafe_allow_html=True)
+
+# Data Classes
+class Book:
+    def __init__(self, book_id, title, author, isbn, category, status='Available'):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.category = category
+        self.status = status
+
+class Student:
+    def __init__(self, student_id, name, email, phone, books_issued=0):
+        self.student_id = student_id
+        self.name = name
+        self.email = email
+        self.phone = phone
+        self.books_issued = books_issued
+        self.transactions = []
+
+class Transaction:
+    def __init__(self, transaction_id, book_id, student_id, rfid, issue_date, due_date, return_date=None, status='Issued', fee=0.0):
+        self.transaction_id = transaction_id
+        self.book_id = book_id
+        self.student_id = student_id
+        self.rfid = rfid
+        self.issue_date = issue_date
+        self.due_date = due_date
+        self.return_date = return_date
+        self.status = status
+        self.fee = fee
+
+# Initialize session state
+if 'books' not in st.session_state:
+    st.session_state.books = []
+if 'students' not in st.session_state:
+    st.session_state.students = []
+if 'transactions' not in st.session_state:
+    st.session_state.transactions = []
+
+def render_header():
+    st.markdown("""
+        <div style='text-align: center; padding: 2rem 0; background-color: #1a1a1a; border-radius: 12px; margin-bottom: 2rem; box-shadow: 0 4px 6px rgba(255, 0, 0, 0.2);'>
+            <h1 style='color: #ff0000; font-size: 3.5rem; margin-bottom: 0.5rem; font-weight: 800; text-transform: uppercase; letter-spacing: 2px; text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);'>PAAD LIBRARY</h1>
+            <p style='color: #ffffff; font-size: 1.2rem; opacity: 0.9; letter-spacing: 1px;'>Professional RFID-Based Library Management System</p>
+            <div style='margin-top: 1rem; padding: 0.5rem; background-color: #0a0a0a; border-radius: 6px; display: inline-block;'>
+                <p style='color: #ff0000; font-size: 1rem; margin: 0; font-weight: 600;'>📚 Knowledge is Power 📚</p>
+            </div>
+        </div>
+    """, unsafe_allow_html=True)
+
+def render_branch_latency(results):
+    if len(results.latencies) < 2:
+        return
+    timings = " · ".join(f"{branch} {seconds * 1000:.0f} ms" for branch, seconds in results.latencies.items())
+    st.caption(f"{len(results.latencies)} branches in {results.wall_time * 1000:.0f} ms ({timings})")
+
+def render_metrics():
+    results = query_branches(queries.query_metrics, read_only=True)
+    
+    # Merge the per-branch counts
+    totals = {'total_books': 0, 'total_students': 0, 'active_issues': 0, 'overdue_books': 0}
+    for metrics in results.results.values():
+        for key in totals:
+            totals[key] += metrics[key]
+    total_books = totals['total_books']
+    total_students = totals['total_students']
+    active_issues = totals['active_issues']
+    overdue_books = totals['overdue_books']
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.markdown(f"""
+            <div class='metric-card'>
+                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>📚 Total Books</h3>
+                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{total_books}</p>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown(f"""
+            <div class='metric-card'>
+                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>👥 Total Students</h3>
+                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{total_students}</p>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    with col3:
+        st.markdown(f"""
+            <div class='metric-card'>
+                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>📖 Active Issues</h3>
+                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{active_issues}</p>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    with col4:
+        st.markdown(f"""
+            <div class='metric-card'>
+                <h3 style='color: #ffffff; margin-bottom: 0.5rem; font-size: 0.9rem; text-transform: uppercase; letter-spacing: 0.5px;'>⏰ Overdue Books</h3>
+                <p style='font-size: 2.2rem; font-weight: 700; color: #ff0000;'>{overdue_books}</p>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    render_branch_latency(results)
+    render_replica_status()
+
+def render_replica_status():
+    staleness = [replica.get_staleness(branch) for branch in get_selected_branches()]
+    known = [seconds for seconds in staleness if seconds is not None]
+    if not known:
+        st.caption("📸 Dashboard snapshot not taken yet")
+        return
+    st.caption(f"📸 Dashboards and the Books and Students tables show a snapshot from {max(known):.0f} s ago; "
+               "Transactions and Live Activity are live")
+
+def render_live_activity():
+    # Returns the placeholder the panel is drawn in, so live mode can redraw just
+    # the panel (see follow_live_activity)
+    with st.expander("🔴 Live Activity", expanded=st.session_state.get('live_refresh', False)):
+        st.toggle(f"Auto-refresh every {LIVE_REFRESH_SECONDS} s", key="live_refresh")
+        panel = st.empty()
+        draw_live_activity(panel)
+    return panel
+
+def draw_live_activity(panel):
+    # Each refresh reads only the change_log rows after the feed's last seq and the
+    # transactions they name, so polling costs a handful of rows, not the table
+    with panel.container():
+        activity = []
+        read = 0
+        for branch in get_selected_branches():
+            feed = changefeed.get_feed(branch)
+            try:
+                feed.refresh()
+            except sqlite3.Error as e:
+                st.error(f"{branch}: {str(e)}")
+                continue
+            rows, recent, last_refresh_rows = feed.snapshot()
+            read += last_refresh_rows
+            activity.extend((changed_at, branch, op, t) for seq, transaction_id, op, changed_at, t in recent)
+        
+        activity = [item for item in activity if item[3]]
+        activity.sort(key=lambda item: item[0], reverse=True)
+        if not activity:
+            st.info("No circulation since the dashboard started.")
+        for changed_at, branch, op, t in activity[:LIVE_ACTIVITY_ROWS]:
+            where = f" · {branch}" if len(get_selected_branches()) > 1 else ""
+            if op == 'insert':
+                action = f"📖 Issued **{t['book_title']}** to {t['student_name']}"
+            elif t['status'] == 'Returned':
+                action = f"📥 **{t['book_title']}** returned by {t['student_name']}" + (f" (₹{t['fee']:.2f} fee)" if t['fee'] else "")
+            else:
+                action = f"✏️ {t['transaction_id']} updated ({t['status']})"
+            st.markdown(f"`{changed_at[11:19]}`{where} {action}")
+        st.caption(f"Last refresh read {read} rows at {datetime.now():%H:%M:%S}")
+
+def follow_live_activity(panel):
+    # No fragments in this Streamlit version, so instead of rerunning the whole
+    # script the finished page stays open and only the panel is redrawn. Any
+    # widget interaction stops the loop at its next Streamlit call, so the short
+    # ticks keep clicks responsive.
+    ticker = st.empty()
+    next_refresh = time.monotonic() + LIVE_REFRESH_SECONDS
+    while True:
+        time.sleep(LIVE_POLL_SECONDS)
+        remaining = next_refresh - time.monotonic()
+        if remaining <= 0:
+            draw_live_activity(panel)
+            next_refresh = time.monotonic() + LIVE_REFRESH_SECONDS
+            remaining = LIVE_REFRESH_SECONDS
+        ticker.caption(f"🔴 Live · next refresh in {remaining:.0f} s")
+
+def render_db_health():
+    with st.sidebar.expander("🩺 Database Health", expanded=False):
+        for branch in get_selected_branches():
+            conn = get_db_connection(branch)
+            if not conn:
+                continue
+            try:
+                health = maintenance.get_health(conn)
+                runs = maintenance.get_runs(conn)
+            finally:
+                conn.close()
+            size = os.path.getsize(storage.get_db_path(branch)) / 1024 / 1024
+            free_share = health['freelist_count'] / health['page_count'] if health['page_count'] else 0
+            st.markdown(f"#### {branch}")
+            st.caption(f"{size:.1f} MB · {health['page_count']} pages of {health['page_size']} B · "
+                       f"{health['freelist_count']} free ({free_share:.1%}) · auto_vacuum {health['auto_vacuum']} · "
+                       f"journal {health['journal_mode']}")
+            for run in runs:
+                icon = "✅" if run['ok'] else "❌"
+                st.markdown(f"{icon} **{run['job']}** {run['last_run_at'][5:16]} · {run['duration'] * 1000:.0f} ms")
+                if not run['ok']:
+                    st.error(run['result'])
+            if not runs:
+                st.info("No maintenance has run yet.")
+            backups = maintenance.list_backups(branch)
+            st.caption(f"💾 {len(backups)} backups" + (f", newest {backups[-1].name}" if backups else ""))
+
+BOOK_CATEGORY_FROM_ISBN = "From ISBN"
+
+def render_forms():
+    st.sidebar.markdown("### 📝 Quick Actions")
+    
+    if st.session_state.get('branch') == ALL_BRANCHES:
+        st.sidebar.info("Select a branch to add, issue or return books.")
+        return
+    
+    with st.sidebar.expander("➕ Add New Book", expanded=False):
+        with st.form("add_book_form"):
+            st.markdown("#### Add New Book")
+            book_id = st.text_input("Book ID (3 digits)")
+            isbn = st.text_input("ISBN")
+            title = st.text_input("Book Title", placeholder="Blank: look up by ISBN")
+            author = st.text_input("Author", placeholder="Blank: look up by ISBN")
+            category = st.selectbox(
+                "Category",
+                [BOOK_CATEGORY_FROM_ISBN, "Fiction", "Non-Fiction", "Science", "Technology", "History", "Biography", "Other"]
+            )
+            if st.form_submit_button("Add Book"):
+                if category == BOOK_CATEGORY_FROM_ISBN:
+                    category = ""
+                if add_book(book_id, title, author, isbn, category):
+                    st.success("✅ Book added successfully!")
+    
+    with st.sidebar.expander("📦 Import Books (CSV)", expanded=False):
+        st.caption("Columns: book_id, isbn and optionally title, author, category. Blanks are filled from the ISBN index.")
+        upload = st.file_uploader("Books CSV", type="csv")
+        if upload is not None and st.button("Import Books"):
+            rows = pd.read_csv(upload, dtype=str).fillna('').to_dict('records')
+            added, enriched, errors = import_books(rows)
+            st.success(f"✅ Imported {added} of {len(rows)} books ({enriched} enriched from ISBN)")
+            for book_id, error in errors[:10]:
+                st.error(f"{book_id}: {error}")
+    
+    with st.sidebar.expander("➕ Add New Student", expanded=False):
+        with st.form("add_student_form"):
+            st.markdown("#### Add New Student")
+            student_id = st.text_input("Student ID (8 alphanumeric)")
+            name = st.text_input("Student Name")
+            email = st.text_input("Email")
+            phone = st.text_input("Phone")
+            patron_type = st.selectbox("Patron Type", get_patron_types())
+            if st.form_submit_button("Add Student"):
+                if add_student(student_id, name, email, phone, patron_type):
+                    st.success("✅ Student added successfully!")
+    
+    with st.sidebar.expander("📖 Issue Book", expanded=False):
+        with st.form("issue_book_form"):
+            st.markdown("#### Issue Book")
+            book_id = st.text_input("Book ID")
+            student_id = st.text_input("Student ID")
+            rfid = st.text_input("RFID Tag")
+            if st.form_submit_button("Issue Book"):
+                if issue_book(book_id, student_id, rfid):
+                    st.success("✅ Book issued successfully!")
+    
+    with st.sidebar.expander("📥 Return Book", expanded=False):
+        with st.form("return_book_form"):
+            st.markdown("#### Return Book")
+            book_id = st.text_input("Book ID")
+            student_id = st.text_input("Student ID")
+            if st.form_submit_button("Return Book"):
+                if return_book(book_id, student_id):
+                    st.success("✅ Book returned successfully!")
+
+TRANSACTION_COLUMNS = ['transaction_id', 'book_id', 'book_title', 'student_id', 'student_name', 'rfid',
+                       'issue_date', 'due_date', 'return_date', 'status', 'fee']
+
+def format_date(value):
+    return value.strftime('%d-%m-%Y') if pd.notnull(value) else ''
+
+def render_tables():
+    tab1, tab2, tab3 = st.tabs(["📚 Books", "👥 Students", "📖 Transactions"])
+    
+    if st.session_state.get('branch') == ALL_BRANCHES:
+        st.info("Select a branch to browse its books, students and transactions.")
+        return
+    
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        st.error("Failed to connect to database")
+        return
+        
+    c = conn.cursor()
+    
+    try:
+        with tab1:
+            c.execute('SELECT book_id, title, author, isbn, category, status FROM books')
+            books_df = frames.read_frame(c)
+            if not books_df.empty:
+                st.dataframe(
+                    books_df.style.apply(
+                        lambda x: ['background-color: #ff0000; color: #ffffff;' if v == 'Issued' else '' for v in x],
+                        axis=1
+                    ),
+                    use_container_width=True
+                )
+                st.caption(frames.format_memory(books_df))
+            else:
+                st.info("No books in the library yet.")
+        
+        with tab2:
+            # One pass over open loans; the per-loan lists are joined in SQL in loan order
+            c.execute('''
+                SELECT 
+                    s.student_id,
+                    s.name,
+                    s.email,
+                    s.phone,
+                    s.patron_type,
+                    s.books_issued,
+                    COALESCE(GROUP_CONCAT(b.title, char(10)), 'No books issued') as current_books,
+                    COALESCE(GROUP_CONCAT(strftime('%d-%m-%Y', t.issue_date), char(10)), 'N/A') as issue_dates,
+                    COALESCE(GROUP_CONCAT(strftime('%d-%m-%Y', t.due_date), char(10)), 'N/A') as due_dates,
+                    COALESCE(GROUP_CONCAT(CASE WHEN t.transaction_id IS NOT NULL
+                        THEN printf('₹%.2f', COALESCE(t.fee, 0)) END, char(10)), 'N/A') as book_fees,
+                    SUM(CASE WHEN t.status = 'Issued' AND t.due_date < datetime('now', 'localtime') THEN 1 ELSE 0 END) as overdue_books,
+                    CAST(MAX(CASE WHEN t.status = 'Issued' AND t.due_date < datetime('now', 'localtime') 
+                        THEN julianday('now', 'localtime') - julianday(t.due_date) ELSE 0 END) AS INTEGER) as max_overdue_days,
+                    ps.standing as library_status,
+                    SUM(CASE WHEN t.status = 'Issued' AND t.due_date < datetime('now', 'localtime') 
+                        THEN (julianday('now', 'localtime') - julianday(t.due_date)) * lp.daily_fee ELSE 0 END) as total_due_fee
+                FROM students s
+                JOIN patron_standing ps ON ps.student_id = s.student_id
+                LEFT JOIN transactions t ON s.student_id = t.student_id AND t.status = 'Issued'
+                LEFT JOIN books b ON t.book_id = b.book_id
+                LEFT JOIN loan_policy lp ON lp.category = b.category AND lp.patron_type = s.patron_type
+                GROUP BY s.student_id
+            ''')
+            students_df = frames.read_frame(c)
+            
+            if not students_df.empty:
+                students_df['library_status'] = students_df['library_status'].astype('category')
+                students_df['max_overdue_days'] = pd.to_numeric(students_df['max_overdue_days'], downcast='integer')
+                st.dataframe(
+                    students_df.style.applymap(
+                        lambda x: 'background-color: #4a0000; color: #ff4444;' if x == 'Blocked'
+                        else 'background-color: #4a3c00; color: #ffd700;' if x == 'Warning'
+                        else 'background-color: #1a472a; color: #4caf50;',
+                        subset=['library_status']
+                    ).format({'total_due_fee': "₹{:.2f}"}),
+                    use_container_width=True
+                )
+                st.caption(frames.format_memory(students_df))
+                
+                warn_after, block_after = standing.get_thresholds(conn)
+                warning = "Has overdue books" if warn_after == 0 else f"Overdue for more than {warn_after} days"
+                st.markdown(f"""
+                    <div style='background-color: #1a1a1a; border: 1px solid #ffd700; padding: 1rem; border-radius: 8px; margin-top: 1rem;'>
+                        <h4 style='color: #ffd700; margin-bottom: 0.5rem;'>Status Legend:</h4>
+                        <p style='color: #4caf50;'>🟢 OK - No overdue books</p>
+                        <p style='color: #ffd700;'>🟠 Warning - {warning}</p>
+                        <p style='color: #ff4444;'>🔴 Blocked - Overdue for more than {block_after} days, cannot borrow</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.info("No students registered yet.")
+        
+        with tab3:
+            # The newest loans, kept in memory per branch and caught up from the
+            # change feed, so a rerun reads only the rows changed since the last one
+            feed = changefeed.get_feed(get_selected_branches()[0])
+            feed.refresh()
+            rows, recent, last_refresh_rows = feed.snapshot()
+            transactions_df = frames.from_rows(rows, TRANSACTION_COLUMNS)
+            
+            if not transactions_df.empty:
+                transactions_df = transactions_df.sort_values('issue_date', ascending=False, ignore_index=True)
+                if len(transactions_df) >= feed.window:
+                    st.caption(f"Showing the newest {feed.window} loans; use Search to find older ones")
+                st.download_button(
+                    "⬇️ Export CSV",
+                    transactions_df.to_csv(index=False, date_format='%d-%m-%Y'),
+                    file_name="transactions.csv",
+                    mime="text/csv"
+                )
+                overdue = (transactions_df['status'] == 'Issued') & (transactions_df['due_date'] < datetime.now())
+                st.dataframe(
+                    transactions_df.style.apply(
+                        lambda x: overdue.map({True: 'background-color: #ff0000; color: #ffffff;', False: ''}),
+                        axis=0
+                    ).format({
+                        'issue_date': format_date,
+                        'due_date': format_date,
+                        'return_date': format_date,
+                        'fee': "₹{:.2f}"
+                    }),
+                    use_container_width=True
+                )
+                st.caption(frames.format_memory(transactions_df))
+            else:
+                st.info("No transactions recorded yet.")
+    except Exception as e:
+        st.error(f"Error displaying tables: {str(e)}")
+    finally:
+        conn.close()
+
+def render_rfid_scanner():
+    st.markdown("""
+        <div class="rfid-container">
+            <h3 style='color: #ff0000; margin-bottom: 1rem; font-weight: 600; text-transform: uppercase; letter-spacing: 0.5px;'>📱 RFID Scanner</h3>
+            <p style='color: #ffffff; opacity: 0.9; margin-bottom: 1rem;'>Place the book near the scanner to read its RFID tag</p>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    if st.button("🔍 Scan RFID", use_container_width=True):
+        with st.spinner("Scanning..."):
+            time.sleep(1)
+            rfid = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=6))
+            st.session_state.current_rfid = rfid
+            st.success(f"Scanned RFID: {rfid}")
+    
+    if 'current_rfid' in st.session_state:
+        st.markdown(f"""
+            <div style='background-color: #1a1a1a; padding: 1rem; border-radius: 8px; border: 1px solid #333333; margin-top: 1rem;'>
+                <p style='color: #ffffff; margin: 0;'>
+                    Current RFID: <strong style='color: #ff0000;'>{st.session_state.current_rfid}</strong>
+                </p>
+            </div>
+        """, unsafe_allow_html=True)
+
+def submit_write(operation, action, *args):
+    # All writes go through the branch's writer thread, which group-commits
+    # requests from every session
+    try:
+        writer.submit(get_selected_branches()[0], operation, *args).result(timeout=30)
+        return True
+    except circulation.CirculationError as e:
+        st.error(str(e))
+        return False
+    except Exception as e:
+        st.error(f"Error {action}: {str(e)}")
+        return False
+
+def add_book(book_id, title, author, isbn, category):
+    # Blank title, author or category are filled from the offline ISBN index
+    title, author, isbn, category = isbn_index.enrich(title, author, isbn, category)
+    return submit_write('add_book', "adding book", book_id, title, author, isbn, category or "Other")
+
+def import_books(rows):
+    # Bulk add from CSV rows; every row is queued before waiting so the writer can
+    # commit them in large batches. Returns (added, enriched, [(book_id, error)]).
+    branch = get_selected_branches()[0]
+    pending = []
+    enriched = 0
+    for row in rows:
+        fields = [str(row.get(column) or '').strip() for column in ('book_id', 'title', 'author', 'isbn', 'category')]
+        book_id, title, author, isbn, category = fields
+        filled = isbn_index.enrich(title, author, isbn, category)
+        if filled != (title, author, isbn, category):
+            enriched += 1
+        title, author, isbn, category = filled
+        pending.append((book_id, writer.submit(branch, 'add_book', book_id, title, author, isbn, category or "Other")))
+
+    added = 0
+    errors = []
+    for book_id, future in pending:
+        try:
+            future.result(timeout=60)
+            added += 1
+        except Exception as e:
+            errors.append((book_id, str(e)))
+    return added, enriched, errors
+
+def add_student(student_id, name, email, phone, patron_type):
+    return submit_write('add_student', "adding student", student_id, name, email, phone, patron_type)
+
+def get_patron_types():
+    # Default type first, so it is what the form starts on
+    conn = get_db_connection(read_only=True)
+    if not conn:
+        return [policy.DEFAULT_PATRON_TYPE]
+    try:
+        patron_types = policy.get_patron_types(conn)
+    finally:
+        conn.close()
+    return sorted(patron_types, key=lambda patron_type: patron_type != policy.DEFAULT_PATRON_TYPE)
+
+def issue_book(book_id, student_id, rfid):
+    return submit_write('issue', "issuing book", book_id, student_id, rfid)
+
+def return_book(book_id, student_id):
+    return submit_write('return', "returning book", book_id, student_id)
+
+def get_all_books():
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM books')
+    books = c.fetchall()
+    conn.close()
+    return books
+
+def get_all_students():
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM students')
+    students = c.fetchall()
+    conn.close()
+    return students
+
+def get_all_transactions():
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute('SELECT * FROM transactions')
+    transactions = c.fetchall()
+    conn.close()
+    return transactions
+
+def render_search():
+    st.markdown("""
+        <div class="search-container">
+            <h3 style='color: #ff0000; margin-bottom: 1rem;'>🔍 Search Library</h3>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        search_type = st.selectbox("Search by", ["Books", "Students", "Transactions"])
+    with col2:
+        search_query = st.text_input("Enter search term")
+    
+    if search_query:
+        results = query_branches(lambda conn: queries.query_search(conn, search_type, search_query))
+        
+        # Merge the per-branch matches, tagging each row with its branch
+        columns = queries.SEARCH_COLUMNS[search_type]
+        branch_frames = [pd.DataFrame(rows, columns=columns) for rows in results.results.values()]
+        if len(results.results) > 1:
+            for branch, frame in zip(results.results, branch_frames):
+                frame.insert(0, 'branch', branch)
+        results_df = pd.concat(branch_frames, ignore_index=True) if branch_frames else pd.DataFrame(columns=columns)
+        
+        label = search_type.lower()
+        if not results_df.empty:
+            st.success(f"Found {len(results_df)} {label}")
+            st.dataframe(results_df, use_container_width=True)
+            if search_type in SUGGESTION_KINDS:
+                render_suggestions(search_type, search_query, limit=5, compact=True)
+        else:
+            st.warning(f"No {label} found")
+            if search_type in SUGGESTION_KINDS:
+                render_suggestions(search_type, search_query)
+        render_branch_latency(results)
+
+SUGGESTION_KINDS = {"Books": 'book', "Students": 'student'}
+
+def render_suggestions(search_type, search_query, limit=10, compact=False):
+    # Typo-tolerant matches from the in-memory trigram index, best first
+    start = time.perf_counter()
+    branches = get_selected_branches()
+    matches = []
+    for branch in branches:
+        for score, kind, doc_id, field, doc in search_index.get_index(branch).search(
+                search_query, kind=SUGGESTION_KINDS[search_type], limit=limit):
+            matches.append((score, branch, doc_id, field, doc))
+    matches = sorted(matches, key=lambda m: m[0], reverse=True)[:limit]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if not matches:
+        return
+
+    if compact:
+        names = ", ".join(f"{doc['title']} ({doc['author']})" if 'title' in doc else doc['name']
+                          for score, branch, doc_id, field, doc in matches)
+        st.caption(f"💡 Similar: {names} ({elapsed_ms:.1f} ms)")
+        return
+
+    rows = []
+    for score, branch, doc_id, field, doc in matches:
+        row = {'similarity': score}
+        if len(branches) > 1:
+            row['branch'] = branch
+        row['id'] = doc_id
+        row.update(doc)
+        row['matched'] = field
+        rows.append(row)
+    st.info(f"💡 Closest matches for \"{search_query}\"")
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    st.caption(f"Fuzzy matches in {elapsed_ms:.1f} ms")
+
+def merge_stats(results):
+    multi_branch = len(results) > 1
+    category_counts = {}
+    overdue_books = []
+    popular_books = []
+    for branch, stats in results.items():
+        for category, count in stats['categories']:
+            category_counts[category] = category_counts.get(category, 0) + count
+        for title, name, due_date in stats['overdue_books']:
+            overdue_books.append((f"{title} ({branch})" if multi_branch else title, name, due_date))
+        for title, issues in stats['popular_books']:
+            popular_books.append((f"{title} ({branch})" if multi_branch else title, issues))
+    
+    # Each branch already returns its own top 5, so the overall top 5 is among them
+    categories = sorted(category_counts.items(), key=lambda item: item[1], reverse=True)
+    popular_books = sorted(popular_books, key=lambda item: item[1], reverse=True)[:5]
+    return categories, overdue_books, popular_books
+
+def render_stats():
+    st.markdown("""
+        <div class="stats-card">
+            <h3 style='color: #ff0000; margin-bottom: 1rem;'>📊 Library Statistics</h3>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    col1, col2, col3 = st.columns(3)
+    
+    results = query_branches(queries.query_stats, read_only=True)
+    categories, overdue_books, popular_books = merge_stats(results.results)
+    
+    with col1:
+        st.markdown("#### Book Categories")
+        for category, count in categories:
+            st.markdown(f"""
+                <div style='background-color: #1a1a1a; padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;'>
+                    <span style='color: #ffffff;'>{category}:</span>
+                    <span style='color: #ff0000; float: right;'>{count}</span>
+                </div>
+            """, unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown("#### Overdue Books")
+        if overdue_books:
+            for title, name, due_date in overdue_books:
+                days_overdue = (datetime.now() - datetime.strptime(due_date, '%Y-%m-%d %H:%M:%S.%f')).days
+                st.markdown(f"""
+                    <div style='background-color: #1a1a1a; padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;'>
+                        <div style='color: #ffffff;'>{title}</div>
+                        <div style='color: #ff0000; font-size: 0.9rem;'>
+                            {name} - {days_overdue} days overdue
+                        </div>
+                    </div>
+                """, unsafe_allow_html=True)
+            
+            # Reminders are only queued here; notifications.py sends them in the background
+            if st.button("📧 Queue Overdue Reminders"):
+                queued = query_branches(notifications.enqueue_overdue_reminders)
+                st.success(f"Queued {sum(queued.results.values())} new reminders")
+        else:
+            st.success("No overdue books")
+    
+    with col3:
+        st.markdown("#### Popular Books")
+        for title, issues in popular_books:
+            st.markdown(f"""
+                <div style='background-color: #1a1a1a; padding: 0.5rem; border-radius: 4px; margin-bottom: 0.5rem;'>
+                    <div style='color: #ffffff;'>{title}</div>
+                    <div style='color: #ff0000; font-size: 0.9rem;'>
+                        {issues} issues
+                    </div>
+                </div>
+            """, unsafe_allow_html=True)
+    
+    render_branch_latency(results)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def load_trends(preset, branches):
+    # Use one range for every branch so they all pick the same grain
+    history = storage.fan_out(analytics.get_history_start, branches, replica.connect)
+    history_start = min(history.results.values(), default=datetime.now().date())
+    start, end = analytics.range_for_preset(preset, history_start)
+    results = storage.fan_out(lambda conn: analytics.get_trends(conn, start, end), branches, replica.connect)
+    
+    grain = analytics.choose_grain(start, end)
+    backlog = 0
+    series_frames = [pd.DataFrame(columns=['period', 'issues', 'returns', 'overdue_delta'])]
+    category_frames = [pd.DataFrame(columns=['category', 'issues'])]
+    for _, branch_backlog, series, category_mix in results.results.values():
+        backlog += branch_backlog
+        series_frames.append(pd.DataFrame(series, columns=['period', 'issues', 'returns', 'overdue_delta']))
+        category_frames.append(pd.DataFrame(category_mix, columns=['category', 'issues']))
+    
+    series_df = pd.concat(series_frames).groupby('period', as_index=False).sum()
+    series_df['overdue_backlog'] = backlog + series_df['overdue_delta'].cumsum()
+    series_df['period'] = pd.to_datetime(series_df['period'])
+    category_df = (
+        pd.concat(category_frames).groupby('category', as_index=False).sum()
+        .sort_values('issues', ascending=False)
+    )
+    return grain, series_df, category_df
+
+def render_trends():
+    st.markdown("""
+        <div class="stats-card">
+            <h3 style='color: #ff0000; margin-bottom: 1rem;'>📈 Circulation Trends</h3>
+        </div>
+    """, unsafe_allow_html=True)
+
+    preset = st.selectbox(
+        "Range",
+        ["Last 30 days", "Last 90 days", "Last year", "Last 5 years", "All time"],
+        index=1,
+        key="trend_range"
+    )
+    grain, series_df, category_df = load_trends(preset, tuple(get_selected_branches()))
+
+    if series_df.empty:
+        st.info("No circulation activity in this range.")
+        return
+
+    grain_label = {'day': 'daily', 'week': 'weekly', 'month': 'monthly'}[grain]
+    st.caption(f"Showing {grain_label} buckets ({len(series_df)} points)")
+    layout = dict(
+        template="plotly_dark",
+        paper_bgcolor="#1a1a1a",
+        plot_bgcolor="#1a1a1a",
+        margin=dict(l=10, r=10, t=40, b=10),
+        legend=dict(orientation="h", y=1.1),
+        height=320
+    )
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Issues and returns per bucket
+        fig = go.Figure()
+        fig.add_bar(x=series_df['period'], y=series_df['issues'], name="Issues", marker_color="#ff0000")
+        fig.add_bar(x=series_df['period'], y=series_df['returns'], name="Returns", marker_color="#4caf50")
+        fig.update_layout(title="Issues & Returns", barmode="group", **layout)
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        # Overdue backlog at the end of each bucket
+        fig = go.Figure()
+        fig.add_scatter(
+            x=series_df['period'], y=series_df['overdue_backlog'], name="Overdue",
+            mode="lines", line=dict(color="#ffd700", shape="hv"), fill="tozeroy"
+        )
+        fig.update_layout(title="Overdue Backlog", **layout)
+        st.plotly_chart(fig, use_container_width=True)
+
+    if not category_df.empty:
+        fig = px.pie(category_df, names='category', values='issues', hole=0.5, title="Issues by Category")
+        fig.update_layout(**layout)
+        st.plotly_chart(fig, use_container_width=True)
+
+def main():
+    for error in bootstrap():
+        st.error(error)
+    
+    render_header()
+    
+    # Add RFID Scanner to sidebar
+    with st.sidebar:
+        branches = storage.get_branch_names()
+        if len(branches) > 1:
+            st.selectbox("🏛️ Branch", [ALL_BRANCHES] + branches, key="branch")
+            st.markdown("---")
+        render_rfid_scanner()
+        st.markdown("---")
+    
+    render_metrics()
+    live_panel = render_live_activity()
+    render_search()
+    render_stats()
+    render_trends()
+    render_forms()
+    render_db_health()
+    render_tables()
+    
+    # Footer
+    st.markdown("---")
+    st.markdown("""
+        <div class='footer' style='text-align: center;'>
+            <p style='color: #ffffff; font-size: 0.9rem; opacity: 0.8;'>© 2024 Library Management System | Made with ❤️</p>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    # Script time for this rerun, read by bench_rerun.py
+    st.session_state['rerun_seconds'] = time.perf_counter() - SCRIPT_START
+    
+    if st.session_state.get('live_refresh'):
+        follow_live_activity(live_panel)
+
+if __name__ == "__main__":
+    main()
+
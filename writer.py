@@ -0,0 +1,147 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import circulation
+import maintenance
+import replica
+import storage
+
+# How long the writer waits for more requests before committing a batch
+GROUP_COMMIT_WINDOW = 0.005
+MAX_BATCH = 64
+
+OPERATIONS = {
+    'add_book': circulation.add_book,
+    'add_student': circulation.add_student,
+    'issue': circulation.issue_book,
+    'return': circulation.return_book,
+}
+
+_writers = {}
+_writers_lock = threading.Lock()
+_listeners = []
+
+class WriteRequest:
+    def __init__(self, operation, args):
+        self.operation = operation
+        self.args = args
+        self.future = Future()
+
+class Writer:
+    # Owns the only write connection to one branch database. Requests from every
+    # session are queued, and those arriving within GROUP_COMMIT_WINDOW of each other
+    # share one transaction (and one fsync). Each request runs in its own savepoint,
+    # so a rejected request does not affect the rest of its batch.
+    def __init__(self, branch, window=GROUP_COMMIT_WINDOW, max_batch=MAX_BATCH):
+        self.branch = branch
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        self.thread = threading.Thread(target=self._run, daemon=True, name=f'writer-{branch}')
+        self.thread.start()
+
+    def submit(self, operation, *args):
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {operation}")
+        request = WriteRequest(operation, args)
+        self.queue.put(request)
+        return request.future
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = storage.connect(self.branch)
+        conn.isolation_level = None  # transactions are managed explicitly below
+        c = conn.cursor()
+        last_optimize = time.monotonic()
+        while True:
+            batch = self._collect()
+            outcomes = []
+            try:
+                c.execute('BEGIN IMMEDIATE')
+                for request in batch:
+                    c.execute('SAVEPOINT request')
+                    try:
+                        result = OPERATIONS[request.operation](c, *request.args)
+                        c.execute('RELEASE request')
+                        outcomes.append((request, result, None))
+                    except Exception as e:
+                        c.execute('ROLLBACK TO request')
+                        c.execute('RELEASE request')
+                        outcomes.append((request, None, e))
+                c.execute('COMMIT')
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    c.execute('ROLLBACK')
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            # Results are only handed back once the batch is durable
+            for request, result, error in outcomes:
+                if error is None:
+                    replica.note_write(self.branch)
+                    self._notify(request, result)
+                    request.future.set_result(result)
+                else:
+                    request.future.set_exception(error)
+
+            # This long-lived connection has run every circulation statement, so
+            # PRAGMA optimize here knows which tables' stats they depend on
+            if time.monotonic() - last_optimize >= maintenance.OPTIMIZE_EVERY and self.queue.empty():
+                last_optimize = time.monotonic()
+                self._optimize(conn)
+
+    def _optimize(self, conn):
+        started_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            maintenance.optimize(conn)
+            ok, result = True, "ok"
+        except sqlite3.Error as e:
+            ok, result = False, str(e)
+        try:
+            maintenance.record_run(self.branch, 'optimize', started_at, time.perf_counter() - start, ok, result)
+        except sqlite3.Error:
+            pass
+
+    def _notify(self, request, result):
+        for listener in list(_listeners):
+            try:
+                listener(self.branch, request.operation, request.args, result)
+            except Exception:
+                pass  # a broken listener must never stop the writer
+
+def add_listener(listener):
+    # listener(branch, operation, args, result) is called after each committed request
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+def get_writer(branch=None):
+    branch = branch or storage.get_branch_names()[0]
+    with _writers_lock:
+        if branch not in _writers:
+            _writers[branch] = Writer(branch)
+        return _writers[branch]
+
+def submit(branch, operation, *args):
+    return get_writer(branch).submit(operation, *args)